@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmarks of the stages of the salient region detection, on the images of
+the tests and on images scaled to several sizes.
+
+Run all benchmarks and compare them with a baseline::
+
+    python benchmarks/run.py --output results.json --baseline baseline.json
+
+A missing baseline is an error; record one first with::
+
+    python benchmarks/run.py --baseline baseline.json --record-baseline
+
+See ``python benchmarks/run.py --help`` for the options.
+'''
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+from multiprocessing import cpu_count
+from timeit import default_timer
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import salientregions as sr  # noqa: E402
+from salientregions import binarydetector  # noqa: E402
+
+IMAGES_PATH = os.path.join(ROOT, 'tests', 'images')
+# The bundled images, by name
+BUNDLED_IMAGES = {
+    'color': os.path.join('Color', 'color.png'),
+    'gray': os.path.join('Gray', 'Gray_scale.png'),
+    'binary': os.path.join('Binary', 'Binary_all_types_noise.png'),
+}
+# The image that is scaled to the requested sizes
+SCALED_IMAGE = 'color'
+DEFAULT_SIZES = [0.25, 1.]
+ALL_SIZES = [0.25, 1., 4., 16., 50.]
+# Parameters of the detectors, as in the tests
+SE_SIZE_FACTOR = 0.15
+LAM_FACTOR = 4
+AREA_FACTOR = 0.05
+CONNECTIVITY = 4
+# Step between the threshold levels of MSSR, to keep it affordable
+MSSR_STEP = 32
+# Seed and cell size of the synthetic images
+SYNTHETIC_SEED = 0
+SYNTHETIC_CELL_SIZE = 256
+
+
+def load_image(name):
+    """Load a bundled image in color (or grayscale for the binary image).
+    """
+    flags = cv2.IMREAD_GRAYSCALE if name == 'binary' else cv2.IMREAD_COLOR
+    return cv2.imread(os.path.join(IMAGES_PATH, BUNDLED_IMAGES[name]), flags)
+
+
+def scaled_image(megapixels):
+    """Scale the color test image to the given number of megapixels.
+    """
+    img = load_image(SCALED_IMAGE)
+    factor = np.sqrt(megapixels * 1e6 / (img.shape[0] * img.shape[1]))
+    size = (max(int(round(img.shape[1] * factor)), 1),
+            max(int(round(img.shape[0] * factor)), 1))
+    return cv2.resize(img, size, interpolation=cv2.INTER_LINEAR)
+
+
+def synthetic_image(megapixels):
+    """Generate a square synthetic grayscale image of the given number of
+    megapixels (see `synthetic.SyntheticImage`).
+    """
+    side = max(int(round(np.sqrt(megapixels * 1e6))), 1)
+    return sr.synthetic.SyntheticImage(
+        (side, side), seed=SYNTHETIC_SEED,
+        cell_size=SYNTHETIC_CELL_SIZE).grayscale()
+
+
+def prepare_inputs(img):
+    """Get the inputs of the stages: grayscale and binary versions of the
+    image, and its structuring element and lambda.
+    """
+    if img.ndim == 3:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = img
+    _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+    detector = sr.SalientDetector(SE_size_factor=SE_SIZE_FACTOR,
+                                  lam_factor=LAM_FACTOR)
+    SE, lam = detector.structuring_element(gray.size)
+    return {'img': img, 'gray': gray, 'binary': binary, 'SE': SE, 'lam': lam}
+
+
+def _datadriven_binarizer(inputs):
+    binarizer = sr.DatadrivenBinarizer(lam=inputs['lam'],
+                                       connectivity=CONNECTIVITY)
+    return lambda: binarizer.binarize(inputs['gray'], visualize=False)
+
+
+def _binary_detector(inputs):
+    detector = sr.BinaryDetector(SE=inputs['SE'], lam=inputs['lam'],
+                                 area_factor=AREA_FACTOR,
+                                 connectivity=CONNECTIVITY)
+    return lambda: detector.detect(inputs['binary'], visualize=False)
+
+
+def _mssr_detector(inputs):
+    detector = sr.MSSRDetector(min_thres=0, max_thres=255, step=MSSR_STEP,
+                               SE_size_factor=SE_SIZE_FACTOR,
+                               lam_factor=LAM_FACTOR,
+                               area_factor=AREA_FACTOR,
+                               connectivity=CONNECTIVITY)
+    return lambda: detector.detect(inputs['img'], visualize=False)
+
+
+def _fill_image(inputs):
+    return lambda: binarydetector._fill_image(inputs['binary'], CONNECTIVITY)
+
+
+def _ellipse_features(inputs):
+    detector = sr.BinaryDetector(SE=inputs['SE'], lam=inputs['lam'],
+                                 area_factor=AREA_FACTOR,
+                                 connectivity=CONNECTIVITY)
+    regions = detector.detect(inputs['binary'], visualize=False)
+    return lambda: sr.binary_mask2ellipse_features(regions, CONNECTIVITY)
+
+
+# The benchmarks: for each name a function that takes the inputs and
+# returns the function to time
+BENCHMARKS = {
+    'datadriven_binarizer': _datadriven_binarizer,
+    'binary_detector': _binary_detector,
+    'mssr_detector': _mssr_detector,
+    'fill_image': _fill_image,
+    'ellipse_features': _ellipse_features,
+}
+
+
+def time_function(func, repeat):
+    """Time a function a number of times.
+
+    Parameters
+    ------
+    func: callable
+        The function to time, without arguments
+    repeat: int
+        How many times to run it
+
+    Returns
+    ------
+    times: list of floats
+        The wall time of every run, in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = default_timer()
+        func()
+        times.append(default_timer() - start)
+    return times
+
+
+def run_benchmarks(sizes=None, names=None, repeat=3, bundled=True,
+                   verbose=True, synthetic_sizes=()):
+    """Run the benchmarks.
+
+    Parameters
+    ------
+    sizes: list of floats, optional
+        The sizes (in megapixels) of the scaled images
+    names: list of str, optional
+        The names of the benchmarks to run, by default all
+    repeat: int, optional
+        How many times to run each benchmark
+    bundled: bool, optional
+        Whether to also run the benchmarks on the bundled images
+    verbose: bool, optional
+        Whether to print the results while running
+    synthetic_sizes: list of floats, optional
+        The sizes (in megapixels) of synthetic images to also run the
+        benchmarks on
+
+    Returns
+    ------
+    results: dict
+        The 'metadata' of the run, and the 'results': for every case
+        (``benchmark/image``) the 'times' of the runs, their 'min' and
+        'median', the mean time per run of the 'stages' of the detection
+        (see `instrumentation.Profiler`) and the 'shape' of the image
+    """
+    if sizes is None:
+        sizes = DEFAULT_SIZES
+    if names is None:
+        names = sorted(BENCHMARKS.keys())
+    images = []
+    if bundled:
+        images += [(name, lambda name=name: load_image(name))
+                   for name in sorted(BUNDLED_IMAGES.keys())]
+    images += [('%gMP' % size, lambda size=size: scaled_image(size))
+               for size in sizes]
+    images += [('synthetic-%gMP' % size,
+                lambda size=size: synthetic_image(size))
+               for size in synthetic_sizes]
+
+    results = {}
+    for image_name, get_image in images:
+        inputs = prepare_inputs(get_image())
+        for name in names:
+            case = '%s/%s' % (name, image_name)
+            func = BENCHMARKS[name](inputs)
+            with sr.instrumentation.Profiler() as profiler:
+                times = time_function(func, repeat)
+            stages = dict((stage, record['time'] / repeat) for stage, record
+                          in profiler.report()['stages'].items())
+            results[case] = {'times': times, 'min': min(times),
+                             'median': float(np.median(times)),
+                             'stages': stages,
+                             'shape': list(inputs['img'].shape)}
+            if verbose:
+                print('%-40s %10.4f s' % (case, min(times)))
+                sys.stdout.flush()
+    return {'metadata': metadata(repeat), 'results': results}
+
+
+def metadata(repeat):
+    """Describe the environment of a benchmark run.
+    """
+    return {'date': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': cpu_count(),
+            'repeat': repeat}
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Compare the results of a run with a baseline.
+
+    Parameters
+    ------
+    results: dict
+        The results of `run_benchmarks`
+    baseline: dict
+        The results of an earlier run
+    tolerance: float, optional
+        The fraction by which a case may be slower than in the baseline
+        before it is a regression
+
+    Returns
+    ------
+    comparison: list of tuples
+        For every case in both, ``(case, baseline time, time, ratio,
+        regression)``, comparing the minimum times
+    """
+    comparison = []
+    for case in sorted(results['results'].keys()):
+        if case not in baseline['results']:
+            continue
+        old = baseline['results'][case]['min']
+        new = results['results'][case]['min']
+        ratio = new / old if old > 0 else float('inf')
+        comparison.append((case, old, new, ratio, ratio > 1 + tolerance))
+    return comparison
+
+
+def print_comparison(comparison, tolerance):
+    """Print the comparison with the baseline.
+    """
+    print()
+    print('%-40s %10s %10s %8s' % ('case', 'baseline', 'time', 'ratio'))
+    for case, old, new, ratio, regression in comparison:
+        print('%-40s %10.4f %10.4f %8.2f%s' % (
+            case, old, new, ratio, '  REGRESSION' if regression else ''))
+    regressions = sum(1 for row in comparison if row[4])
+    print('%i of %i cases are more than %i%% slower than the baseline' % (
+        regressions, len(comparison), round(tolerance * 100)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the stages of the salient region detection.')
+    parser.add_argument('--sizes', type=float, nargs='+',
+                        default=DEFAULT_SIZES,
+                        help='sizes of the scaled images in megapixels '
+                        '(default: %(default)s)')
+    parser.add_argument('--all-sizes', action='store_true',
+                        help='use the sizes ' +
+                        ' '.join('%g' % size for size in ALL_SIZES))
+    parser.add_argument('--synthetic', type=float, nargs='+', default=[],
+                        help='sizes of synthetic images in megapixels to '
+                        'also run the benchmarks on')
+    parser.add_argument('--benchmarks', nargs='+',
+                        choices=sorted(BENCHMARKS.keys()),
+                        help='the benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs per case (default: 3)')
+    parser.add_argument('--no-bundled', action='store_true',
+                        help='skip the bundled test images')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--baseline',
+                        help='JSON file with results to compare with')
+    parser.add_argument('--record-baseline', action='store_true',
+                        help='write the results to the baseline file '
+                        'instead of comparing with it')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fraction by which a case may be slower than '
+                        'the baseline (default: 0.2)')
+    args = parser.parse_args(argv)
+    if args.record_baseline and not args.baseline:
+        parser.error('--record-baseline needs --baseline')
+    if args.baseline and not args.record_baseline and \
+            not os.path.exists(args.baseline):
+        print('No baseline %s to compare with; record one with '
+              '--record-baseline' % args.baseline, file=sys.stderr)
+        return 2
+
+    sr.set_headless()
+    results = run_benchmarks(ALL_SIZES if args.all_sizes else args.sizes,
+                             args.benchmarks, args.repeat,
+                             not args.no_bundled,
+                             synthetic_sizes=args.synthetic)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.record_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparison = compare(results, baseline, args.tolerance)
+        print_comparison(comparison, args.tolerance)
+        if any(row[4] for row in comparison):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
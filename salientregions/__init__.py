@@ -4,14 +4,34 @@ The initialization module for the salient regions package.
 from __future__ import absolute_import
 from .helpers import show_image, read_matfile, \
     image_diff, visualize_elements, binary_mask2ellipse_features, visualize_ellipses,\
-    visualize_elements_ellipses, save_ellipse_features2file, load_ellipse_features_from_file
+    visualize_elements_ellipses, save_ellipse_features2file, load_ellipse_features_from_file, \
+    set_headless, is_headless
 from .binarydetector import BinaryDetector
-from .detectors import SalientDetector, MSSRDetector
+from .detectors import SalientDetector, MSSRDetector, DetectionContext, \
+    LevelAccumulator
 from .binarization import Binarizer, ThresholdBinarizer, \
     OtsuBinarizer, DatadrivenBinarizer
+from . import componenttree
+from . import morphology
+from . import featurestore
+from . import spatialindex
+from . import evaluation
+from . import instrumentation
+from . import synthetic
+from . import tiled
+from . import imagecontext
 
 __all__ = [
     'helpers',
     'binarydetector',
     'detectors',
-    'binarization']
+    'binarization',
+    'componenttree',
+    'morphology',
+    'featurestore',
+    'spatialindex',
+    'evaluation',
+    'instrumentation',
+    'synthetic',
+    'tiled',
+    'imagecontext']
@@ -7,7 +7,7 @@ from __future__ import absolute_import
 from abc import abstractmethod
 import cv2
 from . import helpers
-import matplotlib.pyplot as plt
+from .imagecontext import ImageContext, as_context
 import numpy as np
 from six.moves import range
 
@@ -16,12 +16,36 @@ class Binarizer(object):
 
     """ Abstract class for objects that can binarize an image.
     """
+    # Whether `binarize` also accepts an `ImageContext` instead of an image
+    accepts_context = False
+
     @abstractmethod
     def binarize(self, img, visualize=True):
         """ Subclasses should implement this method.
         """
         pass
 
+    def binarize_context(self, context, visualize=True):
+        """
+        Binarizes the image of an `ImageContext`, using the facts that the
+        context keeps if the binarizer accepts contexts.
+
+        Parameters
+        ------
+        context : ImageContext
+            context of the image to be binarized.
+        visualize: bool, optional
+            Option for visualizing the process
+
+        Returns
+        ------
+        binarized : numpy array
+            Binary image with values 0 and 255
+        """
+        if self.accepts_context:
+            return self.binarize(context, visualize)
+        return self.binarize(context.gray, visualize)
+
 
 class ThresholdBinarizer(Binarizer):
 
@@ -34,6 +58,8 @@ class ThresholdBinarizer(Binarizer):
         Threshold value
     """
 
+    accepts_context = True
+
     def __init__(self, threshold=127):
         self.threshold = threshold
 
@@ -43,8 +69,8 @@ class ThresholdBinarizer(Binarizer):
 
         Parameters
         ------
-        img : numpy array
-            grayscale image to be binarized.
+        img : numpy array or ImageContext
+            grayscale image to be binarized, or its context.
         visualize: bool, optional
             Option for visualizing the process
 
@@ -53,11 +79,13 @@ class ThresholdBinarizer(Binarizer):
         binarized : numpy array
             Binary image with values 0 and 255
         """
+        if isinstance(img, ImageContext):
+            img = img.gray
         _, binarized = cv2.threshold(img, self.threshold, 255,
                                      cv2.THRESH_BINARY)
         if len(binarized.shape) > 2:
             binarized = binarized[:, :, 0]
-        if visualize:
+        if helpers.visualization_enabled(visualize):
             helpers.show_image(
                 binarized, title=(
                     'Binarized with threshold %i' %
@@ -71,14 +99,17 @@ class OtsuBinarizer(Binarizer):
     Binarizes the image with the Otsu method.
     """
 
+    accepts_context = True
+
     def binarize(self, img, visualize=True):
         """
-        Binarizes the image with the Otsu method.
+        Binarizes the image with the Otsu method. The Otsu level of a
+        context is computed from its histogram.
 
         Parameters
         ------
-        img : numpy array
-            grayscale image to be binarized.
+        img : numpy array or ImageContext
+            grayscale image to be binarized, or its context.
         visualize: bool, optional
             Option for visualizing the process
 
@@ -87,11 +118,15 @@ class OtsuBinarizer(Binarizer):
         binarized : numpy array
             Binary image with values 0 and 255
         """
-        threshold, binarized = cv2.threshold(
-            img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if isinstance(img, ImageContext):
+            threshold = img.otsu_threshold
+            binarized = img.threshold(threshold)
+        else:
+            threshold, binarized = cv2.threshold(
+                img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         if len(binarized.shape) > 2:
             binarized = binarized[:, :, 0]
-        if visualize:
+        if helpers.visualization_enabled(visualize):
             helpers.show_image(
                 binarized, title=(
                     'Binarized with threshold %i' %
@@ -124,6 +159,8 @@ class DatadrivenBinarizer(Binarizer):
         What connectivity to use to define CCs
     """
 
+    accepts_context = True
+
     def __init__(self,
                  lam,
                  area_factor_large=0.001,
@@ -144,11 +181,13 @@ class DatadrivenBinarizer(Binarizer):
         """
         Binarizes the image  such that the desired number of (large) connected
         components is maximized. Also returns the optimal threshold.
+        The Otsu level and the number of CCs per level are taken from
+        the context of the image, and kept there for later calls.
 
         Parameters
         ------
-        img : numpy array
-            grayscale image to be binarized.
+        img : numpy array or ImageContext
+            grayscale image to be binarized, or its context.
         visualize: bool, optional
             Option for visualizing the process
 
@@ -159,29 +198,26 @@ class DatadrivenBinarizer(Binarizer):
         binarized : numpy array
             Binary image with values 0 and 255
         """
-        t_otsu, _ = cv2.threshold(
-            img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        t_otsu = int(t_otsu)
-        area = img.size
+        context = as_context(img)
+        t_otsu = context.otsu_threshold
+        area = context.size
         area_large = self.area_factor_large * area
         area_verylarge = self.area_factor_verylarge * area
 
-        # Initialize the count arrays
+        # Count the CCs for all levels in one sweep, and keep
+        # the levels within the search range around the Otsu level
+        counts = context.component_counts(
+            (self.lam, area_large, area_verylarge),
+            connectivity=self.connectivity)
+        levels = list(range(max(t_otsu - self.offset, 0),
+                            min(t_otsu + self.offset, 255),
+                            self.stepsize))
         a_nccs = np.zeros(256)
         a_nccs_large = np.zeros(256)
         a_nccs_verylarge = np.zeros(256)
-
-        for t in range(max(t_otsu - self.offset, 0),
-                       min(t_otsu + self.offset, 255),
-                       self.stepsize):
-            _, bint = cv2.threshold(img, t, 255,
-                                    cv2.THRESH_BINARY)
-            nccs, labels, stats, centroids = cv2.connectedComponentsWithStats(
-                bint, connectivity=self.connectivity)
-            areas = stats[:, cv2.CC_STAT_AREA]
-            a_nccs[t] = (areas >= self.lam).sum()
-            a_nccs_large[t] = (areas >= area_large).sum()
-            a_nccs_verylarge[t] = (areas >= area_verylarge).sum()
+        a_nccs[levels] = counts[0, levels]
+        a_nccs_large[levels] = counts[1, levels]
+        a_nccs_verylarge[levels] = counts[2, levels]
 
         # Normalize
         a_nccs_norm = a_nccs / float(a_nccs.max())
@@ -192,9 +228,9 @@ class DatadrivenBinarizer(Binarizer):
             self.weights[1] * a_nccs_large_norm + \
             self.weights[2] * a_nccs_verylarge_norm
         t_opt = scores.argmax()
-        _, binarized = cv2.threshold(img, t_opt, 255,
-                                     cv2.THRESH_BINARY)
-        if visualize:
+        binarized = context.threshold(t_opt)
+        if helpers.visualization_enabled(visualize):
+            plt = helpers.get_pyplot()
             fig = plt.figure()
             fig.canvas.set_window_title('Number of CCs per threshold level')
             s, = plt.plot(scores)
@@ -233,8 +269,8 @@ class DatadrivenBinarizer(Binarizer):
 
         Parameters
         ------
-        img : numpy array
-            grayscale image to be binarized.
+        img : numpy array or ImageContext
+            grayscale image to be binarized, or its context.
         visualize: bool, optional
             Option for visualizing the process
 
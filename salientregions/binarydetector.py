@@ -2,8 +2,11 @@
 Binary detection of salient regions using mathematical moprhology.
 '''
 from __future__ import absolute_import
+import threading
 import cv2
 from . import helpers
+from . import instrumentation
+from .morphology import OpenCVMorphology
 import numpy as np
 from six.moves import range
 
@@ -23,6 +26,26 @@ class BinaryDetector(object):
         factor that describes the minimum area of a significent CC
     connectivity: int
         What connectivity to use to define CCs
+    incremental: bool, optional
+        Whether to remember the tophat/blackhat of every significant CC
+        in an `IncrementalState` given to `detect`, and reuse it when the same
+        CC is found again in the next call with that state. This speeds up
+        detecting on a series of similar images, such as the threshold levels
+        in MSSR.
+    morphology: Morphology object, optional
+        Morphology object that performs the tophat and blackhat.
+        By default, we use `cv2.morphologyEx`
+    low_memory: bool, optional
+        Whether to keep the memory use low: the intermediate images are
+        written to the buffers of a `Workspace` that is reused across calls,
+        and they are released after `detect`.
+    memory_budget: int, optional
+        The maximum number of bytes that `detect` may use for an image
+        (see `memory_estimate`); implies `low_memory`. Larger images raise a
+        MemoryError before anything is allocated.
+    workspace: Workspace, optional
+        The workspace to use in low-memory mode. By default, all detectors in
+        a thread share one (see `thread_workspace`).
 
     Attributes
     ------
@@ -34,6 +57,11 @@ class BinaryDetector(object):
         binary mask of the indentations
     protrusions : numpy array
         binary mask of the protrusions
+    estimated_peak_memory : int
+        In low-memory mode, an estimate (not a measurement) of the peak
+        working set of the last call to `detect` in bytes: the size of the
+        workspace, the masks of the regions and the temporary images of the
+        largest connected component
 
     Note
     ------
@@ -41,13 +69,37 @@ class BinaryDetector(object):
     and `get_protrusions` invoke the calculation of the regions. After that, the
     regions are also available as attributes `holes`, `islands`, `indentations`
     and `protrusions`.
+
+    In incremental mode, the state only keeps the CCs of the previous call to
+    `detect`, so the memory use is bounded by the size of a single result.
+    The state is not kept in the detector, so several threads can each
+    detect with their own state.
+
+    In low-memory mode, only `detect` invokes the calculation: it computes the
+    holes and protrusions before the islands and indentations, so that the
+    buffers of the one can be reused for the other. The low-memory mode
+    cannot be combined with the incremental mode.
     """
 
-    def __init__(self, SE, lam, area_factor, connectivity):
+    def __init__(self, SE, lam, area_factor, connectivity, incremental=False,
+                 morphology=None, low_memory=False, memory_budget=None,
+                 workspace=None):
+        if incremental and (low_memory or memory_budget is not None):
+            raise ValueError('The low-memory mode cannot be combined with '
+                             'the incremental mode')
         self.SE = SE
         self.lam = lam
         self.area_factor = area_factor
         self.connectivity = connectivity
+        self.incremental = incremental
+        if morphology is None:
+            morphology = OpenCVMorphology()
+        self.morphology = morphology
+        self.low_memory = low_memory or memory_budget is not None
+        self.memory_budget = memory_budget
+        self.workspace = workspace
+        self.estimated_peak_memory = None
+        self._largest_box = 0
         self._img = None
         self._invimg = None
         self._filled = None
@@ -58,7 +110,8 @@ class BinaryDetector(object):
         self.protrusions = None
 
     def detect(self, img, find_holes=True, find_islands=True,
-               find_indentations=True, find_protrusions=True, visualize=True):
+               find_indentations=True, find_protrusions=True, visualize=True,
+               state=None):
         """Find salient regions of the types specified.
 
         Parameters
@@ -75,14 +128,33 @@ class BinaryDetector(object):
             Whether to detect regions of type protrusion
         visualize: bool, optional
             option for visualizing the process
+        state: IncrementalState, optional
+            In incremental mode, the results of the previous call with this
+            state to reuse; it is updated with the results of this call.
+            Without it, nothing is reused.
 
         Returns
         ------
         regions: dict
             For each type of region, the maks with detected regions.
         """
+        if self.low_memory:
+            regions = self._detect_low_memory(
+                img, find_holes, find_islands, find_indentations,
+                find_protrusions)
+            if helpers.visualization_enabled(visualize):
+                helpers.visualize_elements(
+                    img, title='Salient regions in binary image', **regions)
+            return regions
+
         regions = {}
         self.reset()
+        if not self.incremental:
+            state = None
+        elif state is None:
+            state = IncrementalState()
+        if state is not None:
+            state.start()
         self._img = img
         # Get holes and islands
         if find_holes:
@@ -94,12 +166,16 @@ class BinaryDetector(object):
 
         # Get indentations and protrusions
         if find_indentations:
-            regions['indentations'] = self.get_indentations()
+            regions['indentations'] = self.get_indentations(state)
 
         if find_protrusions:
-            regions['protrusions'] = self.get_protrusions()
+            regions['protrusions'] = self.get_protrusions(state)
+
+        # Only remember the CCs of this image
+        if state is not None:
+            state.finish()
 
-        if visualize:
+        if helpers.visualization_enabled(visualize):
             helpers.visualize_elements(
                 img, holes=regions.get(
                     'holes', None), islands=regions.get(
@@ -109,6 +185,84 @@ class BinaryDetector(object):
                 title='Salient regions in binary image')
         return regions
 
+    def _detect_low_memory(self, img, find_holes, find_islands,
+                           find_indentations, find_protrusions):
+        """Find salient regions in low-memory mode, see `detect`.
+        """
+        estimate = self.memory_estimate(img.shape)
+        if self.memory_budget is not None and estimate > self.memory_budget:
+            raise MemoryError(
+                'Detecting regions in an image of shape %s needs up to %i '
+                'bytes, more than the budget of %i bytes'
+                % (img.shape, estimate, self.memory_budget))
+        workspace = self.workspace
+        if workspace is None:
+            workspace = thread_workspace()
+        self.reset()
+        self._largest_box = 0
+        regions = {}
+        # Holes and protrusions, in the image
+        if find_holes or find_protrusions:
+            with instrumentation.stage('filling'):
+                self._filled = _fill_image(img, self.connectivity, workspace)
+            self.holes = self._detect_holelike(img, self._filled, workspace)
+            if find_protrusions:
+                self.protrusions = self._detect_protrusionlike(
+                    img, self._filled, self.holes, workspace=workspace)
+                regions['protrusions'] = self.protrusions
+            if find_holes:
+                regions['holes'] = self.holes
+            else:
+                self.holes = None
+        # Islands and indentations, in the inverse image, reusing the buffers
+        if find_islands or find_indentations:
+            self._invimg = cv2.bitwise_not(
+                img, dst=workspace.get('inverse', img.shape))
+            with instrumentation.stage('filling'):
+                self._invfilled = _fill_image(self._invimg, self.connectivity,
+                                              workspace)
+            self.islands = self._detect_holelike(self._invimg,
+                                                 self._invfilled, workspace)
+            if find_indentations:
+                self.indentations = self._detect_protrusionlike(
+                    self._invimg, self._invfilled, self.islands,
+                    workspace=workspace)
+                regions['indentations'] = self.indentations
+            if find_islands:
+                regions['islands'] = self.islands
+            else:
+                self.islands = None
+        # The intermediate images are in the workspace, which the next call
+        # overwrites
+        self._img = self._invimg = self._filled = self._invfilled = None
+        # The temporary images of a CC: its mask, the image and the result of
+        # the morphology and the internal buffer of the morphology
+        self.estimated_peak_memory = workspace.nbytes + 4 * self._largest_box + sum(
+            mask.nbytes for mask in regions.values())
+        return regions
+
+    def memory_estimate(self, shape):
+        """Estimate the peak working set of `detect` in low-memory mode.
+        Besides the masks of the regions, this is the workspace: 6 bytes per
+        pixel for the images and 4 for the labels, and the temporary images
+        of a CC, which can be as large as the image.
+
+        Parameters
+        ------
+        shape: tuple of ints
+            The shape of the image
+
+        Returns
+        ------
+        nbytes: int
+            The estimated peak working set in bytes
+        """
+        rows, cols = shape[0], shape[1]
+        size = rows * cols
+        workspace = (rows + 2) * (cols + 2) + (rows + 4) * (cols + 4) \
+            + 4 * size + 4 * size
+        return int(workspace + 4 * size + 4 * size)
+
     def reset(self):
         """ Reset all attributes.
         """
@@ -126,7 +280,8 @@ class BinaryDetector(object):
         """
         if self.holes is None:
             # Fill the image
-            self._filled = _fill_image(self._img, self.connectivity)
+            with instrumentation.stage('filling'):
+                self._filled = _fill_image(self._img, self.connectivity)
 
             # Detect the holes
             self.holes = self._detect_holelike(
@@ -140,30 +295,43 @@ class BinaryDetector(object):
             # Get the inverse image
             self._invimg = cv2.bitwise_not(self._img)
             # Fill the inverse image
-            self._invfilled = _fill_image(self._invimg, self.connectivity)
+            with instrumentation.stage('filling'):
+                self._invfilled = _fill_image(self._invimg, self.connectivity)
             self.islands = self._detect_holelike(
                 img=self._invimg, filled=self._invfilled)
         return self.islands
 
-    def get_protrusions(self):
+    def get_protrusions(self, state=None):
         """Get salient regions of type 'protrusion'
+
+        Parameters
+        ------
+        state: IncrementalState, optional
+            The state to reuse results from in incremental mode
         """
         if self.protrusions is None:
             holes = self.get_holes()
             self.protrusions = self._detect_protrusionlike(
-                self._img, self._filled, holes)
+                self._img, self._filled, holes, name='protrusions',
+                state=state)
         return self.protrusions
 
-    def get_indentations(self):
+    def get_indentations(self, state=None):
         """Get salient regions of type 'indentation'
+
+        Parameters
+        ------
+        state: IncrementalState, optional
+            The state to reuse results from in incremental mode
         """
         if self.indentations is None:
             islands = self.get_islands()
             self.indentations = self._detect_protrusionlike(
-                self._invimg, self._invfilled, islands)
+                self._invimg, self._invfilled, islands, name='indentations',
+                state=state)
         return self.indentations
 
-    def _detect_holelike(self, img, filled):
+    def _detect_holelike(self, img, filled, workspace=None):
         """Detect hole-like salient regions, using the image and its filled version
 
         Parameters
@@ -172,6 +340,8 @@ class BinaryDetector(object):
             Image to detect holes
         filled: 2-dimensional numpy array with values 0/255, optional
             Precomputed filled image
+        workspace: Workspace, optional
+            The buffers for the intermediate images in low-memory mode
 
         Returns
         ------
@@ -179,14 +349,25 @@ class BinaryDetector(object):
             Mask with all holes as foreground.
         """
 
-        # Get all the holes (including those that are noise)
-        all_the_holes = cv2.bitwise_and(filled, cv2.bitwise_not(img))
-        # Substract the noise elements
-        theholes = self._remove_small_elements(all_the_holes,
-                                               remove_border_elements=True)
+        with instrumentation.stage('holes_islands'):
+            # Get all the holes (including those that are noise)
+            if workspace is None:
+                all_the_holes = cv2.bitwise_and(filled, cv2.bitwise_not(img))
+                out = None
+            else:
+                all_the_holes = cv2.bitwise_not(
+                    img, dst=workspace.get('elements', img.shape))
+                cv2.bitwise_and(filled, all_the_holes, dst=all_the_holes)
+                out = np.empty(img.shape, dtype='uint8')
+            # Substract the noise elements
+            theholes = self._remove_small_elements(all_the_holes,
+                                                   remove_border_elements=True,
+                                                   workspace=workspace,
+                                                   out=out)
         return theholes
 
-    def _detect_protrusionlike(self, img, filled, holes):
+    def _detect_protrusionlike(self, img, filled, holes, name=None,
+                               workspace=None, state=None):
         """Detect 'protrusion'-like salient regions
 
         Parameters
@@ -197,6 +378,12 @@ class BinaryDetector(object):
             precomputed filled image
         holes: 2-dimensional numpy array with values 0/255
             The earlier detected holes
+        name: str, optional
+            Under which name to remember the results in incremental mode
+        workspace: Workspace, optional
+            The buffers for the intermediate images in low-memory mode
+        state: IncrementalState, optional
+            The state to reuse and remember results in, in incremental mode
 
         Returns
         ------
@@ -206,48 +393,199 @@ class BinaryDetector(object):
 
         # Calculate minimum area for connected components
         min_area = self.area_factor * img.size
+        # Margin around a CC that influences the result within the CC
+        margin = _morphology_margin(self.SE)
 
         # Initalize protrusion image
-        prots1 = np.zeros(img.shape, dtype='uint8')
-        prots2 = np.zeros(img.shape, dtype='uint8')
+        if workspace is None:
+            prots1 = np.zeros(img.shape, dtype='uint8')
+            labels = None
+        else:
+            prots1 = workspace.get('protrusions', img.shape)
+            prots1[:] = 0
+            labels = workspace.get('labels', img.shape, np.int32)
 
         # Retrieve all connected components
         nccs, labels, stats, centroids = cv2.connectedComponentsWithStats(
-            filled, connectivity=self.connectivity)
-        for i in range(1, nccs):
-            area = stats[i, cv2.CC_STAT_AREA]
-            # For the significant CCs, perform tophat
-            if area > min_area:
-                ccimage = np.array(255 * (labels == i), dtype='uint8')
-                wth = cv2.morphologyEx(ccimage, cv2.MORPH_TOPHAT, self.SE)
-                prots1 += wth
-
-        prots1_nonoise = self._remove_small_elements(prots1)
+            filled, labels=labels, connectivity=self.connectivity,
+            ltype=cv2.CV_32S)
+        with instrumentation.stage('tophats'):
+            if state is not None and name is not None:
+                significant = stats[:, cv2.CC_STAT_AREA] > min_area
+                significant[0] = False
+                prots1 = self._incremental_tophat(name, labels, stats,
+                                                  significant, margin, state)
+            else:
+                for i in range(1, nccs):
+                    area = stats[i, cv2.CC_STAT_AREA]
+                    # For the significant CCs, perform tophat within their
+                    # bounding box
+                    if area > min_area:
+                        box, wth = self._component_morphology(
+                            'tophat', labels, i, stats[i], margin, state)
+                        prots1[box] += wth
+
+        if workspace is None:
+            prots1_nonoise = self._remove_small_elements(prots1)
+            prots2 = np.zeros(img.shape, dtype='uint8')
+            labels2 = None
+        else:
+            prots1_nonoise = self._remove_small_elements(
+                prots1, workspace=workspace,
+                out=np.empty(img.shape, dtype='uint8'))
+            # The buffers of the first part are free again
+            prots2 = prots1
+            prots2[:] = 0
+            labels2 = labels
 
         # Now get indentations of significant holes
         nccs2, labels2, stats2, centroids2 = cv2.connectedComponentsWithStats(
-            holes, connectivity=self.connectivity)
-        for i in range(1, nccs2):
-            area = stats2[i, cv2.CC_STAT_AREA]
-            ccimage = np.array(255 * (labels2 == i), dtype='uint8')
+            holes, labels=labels2, connectivity=self.connectivity,
+            ltype=cv2.CV_32S)
+        with instrumentation.stage('tophats'):
+            for i in range(1, nccs2):
+                area = stats2[i, cv2.CC_STAT_AREA]
+                # For the significant CCs, perform blackhat within their
+                # bounding box
+                if area > min_area:
+                    box, bth = self._component_morphology(
+                        'blackhat', labels2, i, stats2[i], margin, state)
+                    prots2[box] += bth
+
+        if workspace is None:
+            prots2_nonoise = self._remove_small_elements(prots2)
+            prots = cv2.add(prots1_nonoise, prots2_nonoise)
+        else:
+            prots2_nonoise = self._remove_small_elements(
+                prots2, workspace=workspace,
+                out=workspace.get('elements', img.shape))
+            prots = cv2.add(prots1_nonoise, prots2_nonoise,
+                            dst=prots1_nonoise)
+        return prots
+
+    def _component_morphology(self, operation, labels, label, stat, margin,
+                              state=None):
+        """Perform a tophat or blackhat on a single CC, within its bounding box.
+        With a state, the result for the same CC in the previous image is
+        reused.
+
+        Parameters
+        ------
+        operation: str
+            'tophat', or 'blackhat' to fill the CC and perform a blackhat
+        labels: 2-dimensional numpy array
+            Label image of the CCs
+        label: int
+            The label of the CC
+        stat: numpy array
+            The statistics of the CC, as returned by `cv2.connectedComponentsWithStats`
+        margin: tuple of ints
+            The margin to pad the bounding box with
+        state: IncrementalState, optional
+            The state to reuse and remember the result in
+
+        Returns
+        ------
+        box: tuple of slices
+            The box in the image to which the result belongs
+        result: 2-dimensional numpy array with values 0/255
+            The result of the operation within the box
+        """
+        box = _padded_box(stat, labels.shape, margin)
+        ccimage = cv2.compare(labels[box], int(label), cv2.CMP_EQ)
+        self._largest_box = max(self._largest_box, ccimage.size)
+        if state is not None:
+            mask = ccimage > 0
+            # A CC is identified by its first pixel, and is the same
+            # as before if its mask within the box is the same
+            top = stat[cv2.CC_STAT_TOP]
+            left = stat[cv2.CC_STAT_LEFT]
+            toprow = labels[top, left:left + stat[cv2.CC_STAT_WIDTH]]
+            key = (top, left + int(np.argmax(toprow == label)))
+            boxcorners = (box[0].start, box[0].stop, box[1].start, box[1].stop)
+            cached = state.cache.get(operation, {}).get(key)
+            if cached is not None and cached[0] == boxcorners \
+                    and np.array_equal(cached[1], mask):
+                state.new_cache.setdefault(operation, {})[key] = cached
+                return box, cached[2]
+
+        if operation == 'tophat':
+            result = self.morphology.tophat(ccimage, self.SE)
+        else:
             ccimage_filled = _fill_image(ccimage, self.connectivity)
-            # For the significant CCs, perform tophat
-            if area > min_area:
-                bth = cv2.morphologyEx(
-                    ccimage_filled, cv2.MORPH_BLACKHAT, self.SE)
-                prots2 += bth
+            result = self.morphology.blackhat(ccimage_filled, self.SE)
 
-        prots2_nonoise = self._remove_small_elements(prots2)
+        if state is not None:
+            state.new_cache.setdefault(operation, {})[key] = \
+                (boxcorners, mask, result)
+        return box, result
 
-        prots = cv2.add(prots1_nonoise, prots2_nonoise)
-        return prots
+    def _incremental_tophat(self, name, labels, stats, significant, margin,
+                            state):
+        """Perform a tophat on the union of the significant CCs, recomputing
+        it only around the pixels that changed since the previous image.
+
+        A (connected) SE that fits in the union fits in a single CC, so the
+        tophat of the union is the sum of the tophats of the CCs. A pixel of
+        the tophat only depends on the union within the margin around it.
+
+        Parameters
+        ------
+        name: str
+            Under which name the previous union and tophat are remembered
+        labels: 2-dimensional numpy array
+            Label image of the CCs
+        stats: numpy array
+            The statistics of the CCs, as returned by `cv2.connectedComponentsWithStats`
+        significant: numpy array
+            For each label, whether the CC is significant
+        margin: tuple of ints
+            The margin around a pixel that influences the result
+        state: IncrementalState
+            The state with the previous union and tophat
+
+        Returns
+        ------
+        tophat: 2-dimensional numpy array with values 0/255
+            The tophat of the union of the significant CCs
+        """
+        union = np.array(255 * significant[labels], dtype='uint8')
+        previous = state.previous_tophat.get(name)
+        if previous is not None and previous[0].shape == union.shape:
+            changed = cv2.bitwise_xor(union, previous[0])
+            boxes = _dirty_boxes(changed, margin)
+            dirty_area = sum((core[0].stop - core[0].start) *
+                             (core[1].stop - core[1].start)
+                             for core in boxes)
+            # Only worth it if a small part of the image has to be recomputed
+            if dirty_area < union.size // 2:
+                tophat = previous[1].copy()
+                for core in boxes:
+                    window = _padded_box(_box_stat(core), union.shape, margin)
+                    wth = self.morphology.tophat(union[window], self.SE)
+                    tophat[core] = wth[core[0].start - window[0].start:
+                                       core[0].stop - window[0].start,
+                                       core[1].start - window[1].start:
+                                       core[1].stop - window[1].start]
+                state.previous_tophat[name] = (union, tophat)
+                return tophat
+
+        tophat = np.zeros(union.shape, dtype='uint8')
+        for i in np.nonzero(significant)[0]:
+            box, wth = self._component_morphology(
+                'tophat', labels, i, stats[i], margin, state)
+            tophat[box] += wth
+        state.previous_tophat[name] = (union, tophat)
+        return tophat
 
     def _remove_small_elements(
             self,
             elements,
             connectivity=None,
             remove_border_elements=True,
-            visualize=False):
+            visualize=False,
+            workspace=None,
+            out=None):
         """Remove elements (Connected Components) that are smaller
         then a given threshold
 
@@ -261,55 +599,177 @@ class BinaryDetector(object):
             Also remove elements that are attached to the border
         visualize: bool, optional
             option for visualizing the process
+        workspace: Workspace, optional
+            The buffers for the labels in low-memory mode
+        out: numpy array, optional
+            The array to write the result to
 
         Returns
         ------
         result : numpy array
             Binary image with all elements larger then lam
         """
-        if connectivity is None:
-            connectivity = self.connectivity
-        result = elements.copy()
-        nr_elements, labels, stats, _ = cv2.connectedComponentsWithStats(
-            elements, connectivity=connectivity)
-
-        leftborder = 0
-        rightborder = elements.shape[1]
-        upperborder = 0
-        lowerborder = elements.shape[0]
-        for i in range(1, nr_elements):
-            area = stats[i, cv2.CC_STAT_AREA]
-            if area < self.lam:
-                result[[labels == i]] = 0
-
+        with instrumentation.stage('small_elements'):
+            if connectivity is None:
+                connectivity = self.connectivity
+            labels = None if workspace is None else workspace.get(
+                'labels', elements.shape, np.int32)
+            _, labels, stats, _ = cv2.connectedComponentsWithStats(
+                elements, labels=labels, connectivity=connectivity,
+                ltype=cv2.CV_32S)
+
+            # Decide per element whether to remove it
+            remove = stats[:, cv2.CC_STAT_AREA] < self.lam
             if remove_border_elements:
-                xmin = stats[i, cv2.CC_STAT_LEFT]
-                xmax = stats[i, cv2.CC_STAT_LEFT] + stats[i, cv2.CC_STAT_WIDTH]
-                ymin = stats[i, cv2.CC_STAT_TOP]
-                ymax = stats[i, cv2.CC_STAT_TOP] + stats[i, cv2.CC_STAT_HEIGHT]
-                if xmin <= leftborder \
-                        or xmax >= rightborder \
-                        or ymin <= upperborder \
-                        or ymax >= lowerborder:
-                    result[[labels == i]] = 0
-        if visualize:
+                xmin = stats[:, cv2.CC_STAT_LEFT]
+                xmax = xmin + stats[:, cv2.CC_STAT_WIDTH]
+                ymin = stats[:, cv2.CC_STAT_TOP]
+                ymax = ymin + stats[:, cv2.CC_STAT_HEIGHT]
+                remove |= (xmin <= 0) | (xmax >= elements.shape[1]) \
+                    | (ymin <= 0) | (ymax >= elements.shape[0])
+            # The background is never removed
+            remove[0] = False
+
+            # Look up the decision for every pixel in one pass
+            if out is None:
+                result = elements.copy()
+                result[remove[labels]] = 0
+            else:
+                keep = np.where(remove, 0, 255).astype('uint8')
+                result = np.take(keep, labels, out=out)
+                cv2.bitwise_and(result, elements, dst=result)
+        if helpers.visualization_enabled(visualize):
             helpers.show_image(result, 'Small elements removed')
         return result
 
 
-def _fill_image(img, connectivity):
+def _morphology_margin(SE):
+    """Get the margin around a connected component that is needed to compute
+    an opening or closing of it exactly within a cropped image.
+    Both the first and the second step of the operation can reach as far as
+    the SE extends, so the margin is twice the SE radius.
+
+    Parameters
+    ------
+    SE : numpy array
+        The structuring element
+
+    Returns
+    ------
+    margin : tuple of ints
+        The margin in vertical and horizontal direction
+    """
+    return 2 * (SE.shape[0] // 2), 2 * (SE.shape[1] // 2)
+
+
+def _padded_box(stat, shape, margin):
+    """Get the bounding box of a connected component, padded with a margin
+    and clipped to the image.
+
+    Parameters
+    ------
+    stat : numpy array
+        The row of `cv2.connectedComponentsWithStats` stats for the CC
+    shape : tuple of ints
+        The shape of the image
+    margin : tuple of ints
+        The margin in vertical and horizontal direction
+
+    Returns
+    ------
+    box : tuple of slices
+        The slices to crop the box from the image
+    """
+    top = max(stat[cv2.CC_STAT_TOP] - margin[0], 0)
+    bottom = min(stat[cv2.CC_STAT_TOP] + stat[cv2.CC_STAT_HEIGHT] + margin[0],
+                 shape[0])
+    left = max(stat[cv2.CC_STAT_LEFT] - margin[1], 0)
+    right = min(stat[cv2.CC_STAT_LEFT] + stat[cv2.CC_STAT_WIDTH] + margin[1],
+                shape[1])
+    return slice(top, bottom), slice(left, right)
+
+
+def _dirty_boxes(changed, margin):
+    """Get boxes that cover all pixels within a margin of a changed pixel.
+    The image is divided into cells of the size of the margin; the cells
+    with a change and their neighbouring cells are grouped into boxes.
+
+    Parameters
+    ------
+    changed : numpy array
+        Binary image with the changed pixels as foreground
+    margin : tuple of ints
+        The margin in vertical and horizontal direction
+
+    Returns
+    ------
+    boxes : list of tuples of slices
+        The boxes (which may overlap)
+    """
+    nrows, ncols = changed.shape
+    cellrows, cellcols = max(margin[0], 1), max(margin[1], 1)
+    ngridrows = -(-nrows // cellrows)
+    ngridcols = -(-ncols // cellcols)
+    padded = np.zeros((ngridrows * cellrows, ngridcols * cellcols),
+                      dtype='uint8')
+    padded[:nrows, :ncols] = changed
+    grid = padded.reshape(ngridrows, cellrows, ngridcols, cellcols).max(
+        axis=(1, 3))
+    grid = cv2.dilate(grid, np.ones((3, 3), dtype='uint8'))
+    ncells, _, stats, _ = cv2.connectedComponentsWithStats(
+        grid, connectivity=8)
+    boxes = []
+    for i in range(1, ncells):
+        top = stats[i, cv2.CC_STAT_TOP] * cellrows
+        left = stats[i, cv2.CC_STAT_LEFT] * cellcols
+        bottom = (stats[i, cv2.CC_STAT_TOP] + stats[i, cv2.CC_STAT_HEIGHT]) \
+            * cellrows
+        right = (stats[i, cv2.CC_STAT_LEFT] + stats[i, cv2.CC_STAT_WIDTH]) \
+            * cellcols
+        boxes.append((slice(top, min(bottom, nrows)),
+                      slice(left, min(right, ncols))))
+    return boxes
+
+
+def _box_stat(box):
+    """Get CC statistics with the bounding box given by a pair of slices.
+
+    Parameters
+    ------
+    box : tuple of slices
+        The slices of the box
+
+    Returns
+    ------
+    stat : numpy array
+        The box as a row of `cv2.connectedComponentsWithStats` stats
+    """
+    stat = np.zeros(5, dtype=int)
+    stat[cv2.CC_STAT_TOP] = box[0].start
+    stat[cv2.CC_STAT_HEIGHT] = box[0].stop - box[0].start
+    stat[cv2.CC_STAT_LEFT] = box[1].start
+    stat[cv2.CC_STAT_WIDTH] = box[1].stop - box[1].start
+    return stat
+
+
+def _fill_image(img, connectivity, workspace=None):
     """Fills all holes in connected components in a binary image.
 
     Parameters
     ------
     img : numpy array
         binary image to fill
+    workspace: Workspace, optional
+        The buffers to use instead of allocating new images; the
+        filled image is the buffer 'filled' of the workspace
 
     Returns
     ------
     filled : numpy array
         The filled image
     """
+    if workspace is not None:
+        return _fill_image_into(img, connectivity, workspace)
     # Copy the image with an extra border
     h, w = img.shape[:2]
     img_border = np.zeros((h + 2, w + 2), np.uint8)
@@ -322,3 +782,128 @@ def _fill_image(img, connectivity):
     filled = img_border | floodfill_inv
     filled = filled[1:-1, 1:-1]
     return filled
+
+
+def _fill_image_into(img, connectivity, workspace):
+    """Fill the holes of a binary image, using the buffers of a workspace.
+    """
+    h, w = img.shape[:2]
+    img_border = workspace.get('border', (h + 2, w + 2))
+    img_border[[0, -1], :] = 0
+    img_border[:, [0, -1]] = 0
+    img_border[1:-1, 1:-1] = img
+    mask = workspace.get('floodmask', (h + 4, w + 4))
+    mask[:] = 0
+    cv2.floodFill(img_border, mask, (0, 0), 255, flags=connectivity)
+    # The pixels that the flood did not reach are the holes
+    filled = cv2.bitwise_not(img_border[1:-1, 1:-1],
+                             dst=workspace.get('filled', (h, w)))
+    return cv2.bitwise_or(filled, img, dst=filled)
+
+
+class IncrementalState(object):
+
+    """
+    The results that `BinaryDetector` in incremental mode remembers from one
+    call to `detect` for the next: the tophat/blackhat of every significant
+    CC and the tophat of the union of the CCs. A state belongs to a single
+    series of images and should not be shared by threads.
+
+    Attributes
+    ------
+    cache: dict
+        For each operation, the results of the CCs of the previous call
+    new_cache: dict
+        For each operation, the results of the CCs of the current call
+    previous_tophat: dict
+        For each region type, the union of the CCs and its tophat in the
+        previous call
+    """
+
+    def __init__(self):
+        self.cache = {}
+        self.new_cache = {}
+        self.previous_tophat = {}
+
+    def start(self):
+        """Start a call to `detect`.
+        """
+        self.new_cache = {}
+
+    def finish(self):
+        """Finish a call to `detect`: only the CCs of this call are
+        remembered for the next.
+        """
+        self.cache = self.new_cache
+        self.new_cache = {}
+
+
+class Workspace(object):
+
+    """
+    Buffers for the intermediate images of `BinaryDetector` in low-memory
+    mode, which are reused across calls and detectors. A buffer is only
+    allocated again when the shape of the image changes.
+
+    Attributes
+    ------
+    nbytes: int
+        The size of all buffers in bytes
+    """
+
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, name, shape, dtype='uint8'):
+        """Get a buffer, with undefined contents.
+
+        Parameters
+        ------
+        name: str
+            The name of the buffer
+        shape: tuple of ints
+            The shape of the buffer
+        dtype: str or numpy dtype, optional
+            The type of the buffer
+
+        Returns
+        ------
+        buffer: numpy array
+            The buffer
+        """
+        shape = tuple(shape[:2])
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != np.dtype(dtype):
+            # Release the old buffer before allocating the new one
+            self._buffers.pop(name, None)
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buf
+        return buf
+
+    @property
+    def nbytes(self):
+        return sum(buf.nbytes for buf in self._buffers.values())
+
+    def release(self):
+        """Release all buffers.
+        """
+        self._buffers = {}
+
+
+_thread_state = threading.local()
+
+
+def thread_workspace():
+    """Get the workspace shared by the detectors in low-memory mode in the
+    current thread. Its buffers stay allocated until `Workspace.release`
+    is called.
+
+    Returns
+    ------
+    workspace: Workspace
+        The workspace of this thread
+    """
+    workspace = getattr(_thread_state, 'workspace', None)
+    if workspace is None:
+        workspace = _thread_state.workspace = Workspace()
+    return workspace
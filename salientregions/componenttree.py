@@ -0,0 +1,404 @@
+'''
+Union-find sweeps over the gray levels of an image.
+The connected components of all threshold levels are computed in one pass,
+by adding the pixels level by level and merging the components they touch.
+'''
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import numpy as np
+from six.moves import range
+
+
+def _neighbour_offsets(connectivity):
+    """Get the (row, column) offsets of the neighbours of a pixel.
+
+    Parameters
+    ------
+    connectivity: int
+        What connectivity to use to define CCs, 4 or 8
+
+    Returns
+    ------
+    offsets: list of tuples
+        The offsets of the neighbouring pixels
+    """
+    if connectivity == 4:
+        return [(-1, 0), (0, -1), (0, 1), (1, 0)]
+    elif connectivity == 8:
+        return [(-1, -1), (-1, 0), (-1, 1), (0, -1),
+                (0, 1), (1, -1), (1, 0), (1, 1)]
+    raise ValueError('connectivity should be 4 or 8, got %s' % connectivity)
+
+
+class LevelSweep(object):
+
+    """
+    Union-find structure over the pixels of an image. Pixels are added in
+    batches (typically all pixels of one gray level) and the connected
+    components they form are tracked, together with their area.
+
+    Pixels are identified by their flat index in the image padded with a
+    border of one pixel (see `padded_index`), so that neighbours can be
+    looked up without checking the image boundaries.
+
+    Parameters
+    ------
+    shape: tuple of ints
+        Shape (rows, columns) of the image
+    connectivity: int, optional
+        What connectivity to use to define CCs
+
+    Attributes
+    ------
+    parent: numpy array
+        For every (padded) pixel index, a pointer towards the root of its component
+    area: numpy array
+        For every root pixel, the area of its component
+    active: numpy array
+        For every pixel, whether it has been added
+    """
+
+    def __init__(self, shape, connectivity=4):
+        self.shape = (shape[0], shape[1])
+        self.connectivity = connectivity
+        size = (self.shape[0] + 2) * (self.shape[1] + 2)
+        index_dtype = np.int32 if size < 2 ** 31 else np.int64
+        self.parent = np.arange(size, dtype=index_dtype)
+        self.area = np.zeros(size, dtype=np.int64)
+        self.active = np.zeros(size, dtype=bool)
+        stride = self.shape[1] + 2
+        self._offsets = [drow * stride + dcol for (drow, dcol)
+                         in _neighbour_offsets(connectivity)]
+        # Scratch space to mark the current batch and number its nodes
+        self._inbatch = np.zeros(size, dtype=bool)
+        self._position = np.zeros(size, dtype=index_dtype)
+
+    def padded_index(self, flat):
+        """Convert flat indices of the image to indices of the padded image.
+
+        Parameters
+        ------
+        flat: numpy array
+            Flat pixel indices in the image
+
+        Returns
+        ------
+        padded: numpy array
+            The corresponding pixel indices used by the sweep
+        """
+        flat = np.asarray(flat, dtype=self.parent.dtype)
+        return flat + 2 * (flat // self.shape[1]) + (self.shape[1] + 3)
+
+    def find(self, pixels):
+        """Find the roots of the components of the given pixels.
+        The pointers of the pixels are set directly to their root.
+
+        Parameters
+        ------
+        pixels: numpy array
+            Flat indices of (added) pixels
+
+        Returns
+        ------
+        roots: numpy array
+            Flat index of the root of each pixel
+        """
+        roots = self.parent[pixels]
+        todo = np.arange(len(roots))
+        while len(todo) > 0:
+            up = self.parent[roots[todo]]
+            moved = up != roots[todo]
+            todo = todo[moved]
+            roots[todo] = up[moved]
+        self.parent[pixels] = roots
+        return roots
+
+    def _neighbour_pairs(self, pixels, offsets, mask):
+        """Get all pairs of a pixel and a neighbour that is set in `mask`.
+        """
+        first = []
+        second = []
+        for offset in offsets:
+            neighbours = pixels + offset
+            selected = mask.take(neighbours)
+            first.append(pixels.compress(selected))
+            second.append(neighbours.compress(selected))
+        return np.concatenate(first), np.concatenate(second)
+
+    def add(self, pixels):
+        """Add a batch of pixels and merge the components they connect.
+
+        Parameters
+        ------
+        pixels: numpy array
+            Padded indices of the pixels to add
+
+        Returns
+        ------
+        merge: tuple or None
+            None if no components were merged. Otherwise a tuple
+            ``(nodes, node_area, groups, reps)``: the roots that took part in
+            a merge, their area before the merge, for each of them the index
+            of the group it was merged into, and the new root of each group.
+        """
+        # scipy.sparse is slow to import, so only import it when it is used
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        pixels = np.asarray(pixels, dtype=self.parent.dtype)
+        self.parent[pixels] = pixels
+        self.area[pixels] = 1
+
+        # Links to earlier pixels go through the roots of their components,
+        # links between new pixels are only collected in one direction.
+        new_old, old = self._neighbour_pairs(pixels, self._offsets,
+                                             self.active)
+        self.active[pixels] = True
+        forward = [offset for offset in self._offsets if offset > 0]
+        self._inbatch[pixels] = True
+        new_first, new_second = self._neighbour_pairs(pixels, forward,
+                                                      self._inbatch)
+        self._inbatch[pixels] = False
+        if len(old) == 0 and len(new_first) == 0:
+            return None
+        old_roots = self.find(old)
+        # Keep one occurrence of every root, without sorting
+        self._position[old_roots] = np.arange(len(old_roots),
+                                              dtype=self._position.dtype)
+        old_roots = old_roots.compress(
+            self._position.take(old_roots) == np.arange(len(old_roots)))
+
+        # Number the nodes: first the new pixels, then the old roots, so that
+        # the old roots become the representatives of their groups
+        nodes = np.concatenate([pixels, old_roots])
+        self._position[nodes] = np.arange(len(nodes),
+                                          dtype=self._position.dtype)
+        rows = np.concatenate([self._position[new_old],
+                               self._position[new_first]])
+        cols = np.concatenate([self._position[self.parent[old]],
+                               self._position[new_second]])
+        graph = coo_matrix((np.ones(len(rows), dtype=bool), (rows, cols)),
+                           shape=(len(nodes), len(nodes)))
+        ngroups, groups = connected_components(graph, directed=False)
+        if ngroups == len(nodes):
+            return None
+        reps = np.empty(ngroups, dtype=nodes.dtype)
+        reps[groups] = nodes
+
+        node_area = self.area[nodes]
+        group_area = np.bincount(groups, weights=node_area,
+                                 minlength=ngroups).astype(np.int64)
+        self.parent[nodes] = reps[groups]
+        self.area[reps] = group_area
+        return nodes, node_area, groups, reps
+
+
+def count_components_per_level(img, min_areas, connectivity=4, hist=None,
+                               order=None):
+    """For every gray level t, count the connected components of the
+    thresholded image ``img > t`` that have at least a given area.
+    All 256 levels are computed in one sweep, adding the pixels from the
+    brightest level down.
+
+    Parameters
+    ------
+    img: numpy array
+        2-dimensional grayscale image of type uint8
+    min_areas: list of floats
+        The minimum areas to count components for
+    connectivity: int, optional
+        What connectivity to use to define CCs
+    hist: numpy array, optional
+        The precomputed histogram of the image
+    order: numpy array, optional
+        The precomputed flat indices of the pixels, stably sorted by value
+
+    Returns
+    ------
+    counts: numpy array
+        Array of shape ``(len(min_areas), 256)`` with the number of
+        components per minimum area and per level
+
+    Note
+    ------
+    As in `cv2.connectedComponentsWithStats`, the background
+    (the pixels with ``img <= t``) is counted as one extra component.
+    """
+    values = img.ravel()
+    min_areas = np.asarray(min_areas, dtype=float)
+    if hist is None:
+        hist = np.bincount(values, minlength=256)
+    if order is None:
+        order = np.argsort(values, kind='mergesort')
+    ends = np.cumsum(hist)
+
+    sweep = LevelSweep(img.shape, connectivity)
+    order = sweep.padded_index(order)
+    running = np.zeros(len(min_areas), dtype=np.int64)
+    counts = np.zeros((len(min_areas), 256), dtype=np.int64)
+    for t in range(255, -1, -1):
+        # The foreground of level t gains the pixels with value t + 1
+        if t < 255 and hist[t + 1] > 0:
+            pixels = order[ends[t] : ends[t + 1]]
+            running += len(pixels) * (min_areas <= 1)
+            merge = sweep.add(pixels)
+            if merge is not None:
+                _, node_area, _, reps = merge
+                running -= (node_area[:, None] >= min_areas).sum(axis=0)
+                running += (sweep.area[reps][:, None] >= min_areas).sum(axis=0)
+        background = ends[t]
+        counts[:, t] = running + (background >= min_areas)
+    return counts
+
+
+def count_region_levels(img, levels, lam, connectivity=4,
+                        regtypes=('holes', 'islands'), hist=None, order=None):
+    """For every pixel, count on how many threshold levels it is in a hole
+    or an island of the thresholded image ``img > t`` with at least area
+    `lam`, as `BinaryDetector` finds them.
+
+    The holes of a level are the components of the background
+    ``img <= t`` that do not touch the image border, and all levels together
+    form a min-tree; the islands are the components of the foreground and
+    form a max-tree. Each tree is built in one sweep over the gray levels,
+    and the counts are derived from the area and border contact of its nodes.
+
+    Parameters
+    ------
+    img: numpy array
+        2-dimensional grayscale image of type uint8
+    levels: list of ints
+        The threshold levels
+    lam: float
+        lambda, minimumm area of a salient region
+    connectivity: int, optional
+        What connectivity to use to define CCs
+    regtypes: list of str, optional
+        The types of regions to count, 'holes' and/or 'islands'
+    hist: numpy array, optional
+        The precomputed histogram of the image
+    order: numpy array, optional
+        The precomputed flat indices of the pixels, stably sorted by value
+
+    Returns
+    ------
+    counts: dict
+        For each type of region, an int64 array with the number of levels
+        per pixel
+    """
+    values = img.ravel()
+    if hist is None:
+        hist = np.bincount(values, minlength=256)
+    if order is None:
+        order = np.argsort(values, kind='mergesort')
+    ends = np.cumsum(hist)
+    blocks = [order[ends[value] - hist[value]:ends[value]]
+              for value in range(256)]
+    levels = np.asarray(levels, dtype=np.int64)
+    counts = {}
+    if 'holes' in regtypes:
+        # After adding the pixels up to value s, the background is that of
+        # level s; all levels from 255 on have the whole image as background
+        selected = levels[levels >= 0]
+        weights = np.bincount(np.minimum(selected, 255), minlength=256)
+        counts['holes'] = _count_tree_levels(img.shape, blocks, weights,
+                                             lam, connectivity)
+    if 'islands' in regtypes:
+        # After adding the pixels down to value 255 - s, the foreground is
+        # that of level 254 - s
+        selected = levels[levels <= 254]
+        weights = np.bincount(254 - np.maximum(selected, -1), minlength=256)
+        counts['islands'] = _count_tree_levels(img.shape, blocks[::-1],
+                                               weights, lam, connectivity)
+    return counts
+
+
+def _count_tree_levels(shape, blocks, weights, lam, connectivity):
+    """Build the component tree by adding blocks of pixels, and count for
+    every pixel the weight of the steps in which its component has at least
+    area `lam` and does not touch the border.
+
+    Parameters
+    ------
+    shape: tuple of ints
+        Shape (rows, columns) of the image
+    blocks: list of numpy arrays
+        For every step, the flat indices of the pixels to add
+    weights: numpy array
+        For every step, the number of levels at which the components after
+        that step are counted
+    lam: float
+        The minimum area of a counted component
+    connectivity: int
+        What connectivity to use to define CCs
+
+    Returns
+    ------
+    counts: numpy array
+        The total weight per pixel
+    """
+    rows, cols = shape[0], shape[1]
+    size = rows * cols
+    sweep = LevelSweep(shape, connectivity)
+    # Whether each (padded) pixel is on the border of the image
+    on_border = np.zeros((rows + 2, cols + 2), dtype=bool)
+    on_border[[1, rows], 1:cols + 1] = True
+    on_border[1:rows + 1, [1, cols]] = True
+    on_border = on_border.ravel()
+    # For every root, whether its component touches the border and its node
+    border = np.zeros(len(sweep.parent), dtype=bool)
+    current = np.zeros(len(sweep.parent), dtype=np.int64)
+
+    # Every node has at least one pixel that is added with it
+    node_step = np.zeros(size, dtype=np.int64)
+    node_area = np.zeros(size, dtype=np.int64)
+    node_border = np.zeros(size, dtype=bool)
+    node_parent = np.full(size, -1, dtype=np.int64)
+    pixel_node = np.empty(size, dtype=np.int64)
+    starts = []
+    nnodes = 0
+    for step, flat in enumerate(blocks):
+        starts.append(nnodes)
+        if len(flat) == 0:
+            continue
+        pixels = sweep.padded_index(flat)
+        merge = sweep.add(pixels)
+        if merge is None:
+            # Every pixel is a new component
+            reps = pixels
+            groups = np.arange(len(pixels))
+            group_border = on_border[pixels]
+        else:
+            nodes, _, groups, reps = merge
+            old_roots = nodes[len(pixels):]
+            member_border = np.concatenate([on_border[pixels],
+                                            border[old_roots]])
+            group_border = np.bincount(groups, weights=member_border,
+                                       minlength=len(reps)) > 0
+        ids = np.arange(nnodes, nnodes + len(reps))
+        nnodes += len(reps)
+        node_step[ids] = step
+        node_area[ids] = sweep.area[reps]
+        node_border[ids] = group_border
+        if merge is not None:
+            node_parent[current[old_roots]] = ids[groups[len(pixels):]]
+        pixel_node[flat] = ids[groups[:len(pixels)]]
+        current[reps] = ids
+        border[reps] = group_border
+    starts.append(nnodes)
+
+    # A node lasts from its step until the step of its parent
+    cumulative = np.concatenate([[0], np.cumsum(weights)])
+    parent_step = np.full(nnodes, len(blocks), dtype=np.int64)
+    has_parent = node_parent[:nnodes] >= 0
+    parent_step[has_parent] = node_step[node_parent[:nnodes][has_parent]]
+    counted = (node_area[:nnodes] >= lam) & ~node_border[:nnodes]
+    total = counted * (cumulative[parent_step] -
+                       cumulative[node_step[:nnodes]])
+    # Add the totals of the ancestors, from the last step to the first;
+    # the parent of a node is always created in a later step
+    for step in range(len(blocks) - 1, -1, -1):
+        ids = np.arange(starts[step], starts[step + 1])
+        ids = ids[has_parent[ids]]
+        total[ids] += total[node_parent[ids]]
+    return total[pixel_node].reshape(rows, cols)
@@ -5,14 +5,189 @@ Salient regions detectors.
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 from abc import ABCMeta, abstractmethod
+import threading
 import cv2
 from . import helpers
 from . import binarization
 # import binarydetector
 import numpy as np
-from .binarydetector import BinaryDetector
+from .binarydetector import BinaryDetector, IncrementalState
+from . import morphology
+from . import instrumentation
+from . import componenttree
+from .imagecontext import ImageContext
 import six
 from six.moves import range
+from multiprocessing import cpu_count, Pool
+from multiprocessing.pool import ThreadPool
+
+# The detector that a worker of `Detector.detect_many` uses
+_worker = threading.local()
+
+
+class DetectionContext(object):
+
+    """
+    The intermediate results of a single detection. The detectors keep these
+    in a context object instead of on themselves, so that one detector can be
+    used by several threads at once.
+
+    Attributes
+    ------
+    image : ImageContext
+        The context of the image, with the facts about it that are shared
+        with other detections of the same image
+    gray : numpy array
+        The image converted to grayscale
+    SE : numpy array
+        The structuring element for this image
+    lam : float
+        lambda, minimumm area of a salient region
+    binarizer : Binarizer object
+        The binarizer that was used (`SalientDetector` only)
+    binarized : numpy array
+        The binarized image (`SalientDetector` only)
+    bint : numpy array
+        The thresholded image of the last level (`MSSRDetector` only)
+    regions_sum : dict
+        The sum of the regions of all levels, before thresholding
+        (`MSSRDetector` only)
+    accumulator : LevelAccumulator
+        The counts of the regions of all levels, and the masks of the levels
+        if they are kept (`MSSRDetector` only)
+    regions : dict
+        For each type of region, the maks with detected regions.
+    """
+
+    def __init__(self, gray, SE, lam, image=None):
+        if image is None:
+            image = ImageContext(gray)
+        self.image = image
+        self.gray = gray
+        self.SE = SE
+        self.lam = lam
+        self.binarizer = None
+        self.binarized = None
+        self.bint = None
+        self.regions_sum = None
+        self.accumulator = None
+        self.regions = None
+
+
+class LevelAccumulator(object):
+
+    """
+    Counts for every pixel on how many threshold levels it is in a region of
+    each type. The counts are of the smallest unsigned type that holds the
+    number of levels, and the masks of the levels are added to them in place.
+    The masks themselves can also be kept, packed to one bit per pixel.
+
+    Parameters
+    ------
+    shape: tuple of ints
+        The shape of the image
+    num_levels: int
+        The number of threshold levels
+    regtypes: list of str
+        The types of regions to count
+    keep_masks: bool, optional
+        Whether to keep the mask of every level
+
+    Attributes
+    ------
+    counts : dict
+        For each type of region, the number of levels per pixel
+    levels : list of ints
+        The levels of which the masks are kept, in the order of the masks
+    """
+
+    def __init__(self, shape, num_levels, regtypes, keep_masks=False):
+        self.shape = (shape[0], shape[1])
+        self.dtype = np.min_scalar_type(max(num_levels, 1))
+        self.keep_masks = keep_masks
+        self.counts = dict((regtype, np.zeros(self.shape, dtype=self.dtype))
+                           for regtype in regtypes)
+        self.levels = []
+        self._packed = dict((regtype, []) for regtype in regtypes)
+
+    def add(self, regions, levels):
+        """Add the regions of one or more levels at which they are the same.
+
+        Parameters
+        ------
+        regions: dict
+            For each type of region, the mask with values 0/255
+        levels: list of ints
+            The levels
+        """
+        for regtype, counts in self.counts.items():
+            mask = regions[regtype]
+            if counts.itemsize <= 2:
+                # OpenCV adds only where the mask is set, without temporaries
+                cv2.add(counts, len(levels), dst=counts, mask=mask)
+            else:
+                np.add(counts, len(levels), out=counts, where=mask > 0,
+                       casting='unsafe')
+            if self.keep_masks:
+                packed = np.packbits(mask > 0)
+                self._packed[regtype].extend([packed] * len(levels))
+        if self.keep_masks:
+            self.levels.extend(levels)
+
+    def merge(self, other):
+        """Add the counts and masks of the levels that follow, from another
+        accumulator.
+
+        Parameters
+        ------
+        other: LevelAccumulator
+            The accumulator of the following levels
+        """
+        for regtype, counts in self.counts.items():
+            if counts.itemsize <= 2:
+                cv2.add(counts, other.counts[regtype], dst=counts)
+            else:
+                counts += other.counts[regtype]
+            self._packed[regtype].extend(other._packed[regtype])
+        self.levels.extend(other.levels)
+
+    def set_counts(self, regtype, counts):
+        """Set the counts of a type of region that were computed otherwise,
+        such as from the component trees. No masks are kept for it.
+
+        Parameters
+        ------
+        regtype: str
+            The type of region
+        counts: numpy array
+            The number of levels per pixel
+        """
+        self.counts[regtype] = counts.astype(self.dtype)
+        self._packed[regtype] = []
+
+    def level_mask(self, regtype, level):
+        """Get the kept mask of a level.
+
+        Parameters
+        ------
+        regtype: str
+            The type of region
+        level: int
+            The threshold level
+
+        Returns
+        ------
+        mask: numpy array
+            The mask of the regions at that level, with values 0/255
+        """
+        packed = self._packed[regtype]
+        if not packed:
+            raise ValueError('The masks of the %s are not kept' % regtype)
+        size = self.shape[0] * self.shape[1]
+        bits = np.unpackbits(packed[self.levels.index(level)])[:size]
+        mask = bits.reshape(self.shape)
+        mask *= 255
+        return mask
 
 
 class Detector(six.with_metaclass(ABCMeta, object)):
@@ -30,17 +205,50 @@ class Detector(six.with_metaclass(ABCMeta, object)):
         factor that describes the minimum area of a significent CC
     connectivity: int
         What connectivity to use to define CCs
+    morphology: Morphology object, optional
+        Morphology object that performs the tophat and blackhat, for example
+        `morphology.DecomposedMorphology` for large structuring elements.
+        By default, we use `cv2.morphologyEx`
+    cache_SE: bool, optional
+        Whether to take the structuring element from a process-wide cache,
+        instead of creating it for every image
+    profile: callable, optional
+        Function that is called with the report of an
+        `instrumentation.Profiler` after every detection, with the time
+        per stage of the detection
+    profile_memory: bool, optional
+        Whether the reports of `profile` include the peak memory per stage.
+        This is the memory of the whole process, and only one thread at a
+        time can record it (see `instrumentation.Profiler`)
+    low_memory: bool, optional
+        Whether to detect the regions in the binary images in the low-memory
+        mode of `BinaryDetector`
+    memory_budget: int, optional
+        The maximum number of bytes that the detection in a binary image may
+        use (see `BinaryDetector.memory_estimate`); implies `low_memory`
 
     """
 
     def __init__(self, SE_size_factor=0.15,
                  lam_factor=5,
                  area_factor=0.05,
-                 connectivity=4):
+                 connectivity=4,
+                 morphology=None,
+                 cache_SE=True,
+                 profile=None,
+                 profile_memory=False,
+                 low_memory=False,
+                 memory_budget=None):
         self.SE_size_factor = SE_size_factor
         self.lam_factor = lam_factor
         self.area_factor = area_factor
         self.connectivity = connectivity
+        self.morphology = morphology
+        self.cache_SE = cache_SE
+        self.profile = profile
+        self.profile_memory = profile_memory
+        self.low_memory = low_memory
+        self.memory_budget = memory_budget
 
     @abstractmethod
     def detect(self, img):
@@ -57,10 +265,112 @@ class Detector(six.with_metaclass(ABCMeta, object)):
         nrows, ncols = img.shape[0], img.shape[1]
         self.get_SE(nrows * ncols)
 
+    def new_context(self, img):
+        """Start a detection: convert the image to grayscale and get the
+        structuring element and lambda for it, without changing the detector.
+
+        Parameters
+        ------
+        img: numpy arrary or ImageContext
+            grayscale or color image to detect regions, or its context.
+            The grayscale image of a context is shared, not copied.
+
+        Returns
+        ------
+        context: DetectionContext
+            The context to keep the results of this detection in
+        """
+        if isinstance(img, ImageContext):
+            image = img
+        elif len(img.shape) == 3:
+            image = ImageContext(img)
+        else:
+            # Keep the detection independent of later changes to the image
+            image = ImageContext(img.copy())
+        with instrumentation.stage('grayscale'):
+            gray = image.gray
+        SE, lam = self.structuring_element(image.size)
+        return DetectionContext(gray, SE, lam, image)
+
+    def detect_many(self, images, n_jobs=1, chunksize=1, ordered=True,
+                    processes=False, **kwargs):
+        """Find salient regions in a series of images, using a pool of workers.
+        The workers use `detect_context`, so they can share the detector;
+        the detector itself is not changed.
+
+        Parameters
+        ------
+        images: iterable of numpy arrays
+            grayscale or color images to detect regions
+        n_jobs: int, optional
+            The number of workers. -1 means one worker per CPU.
+            With 1 worker, the images are processed in the calling thread.
+        chunksize: int, optional
+            The number of images that is sent to a worker at once
+        ordered: bool, optional
+            Whether to yield the results in the order of the images,
+            or as soon as they are completed
+        processes: bool, optional
+            Whether the workers are processes instead of threads
+        **kwargs
+            Other arguments to pass along to `detect_context`
+
+        Returns
+        ------
+        results: generator of tuples
+            For each image, a tuple ``(index, regions)``, with the index of the
+            image in `images` and its regions
+        """
+        kwargs.setdefault('visualize', False)
+        if n_jobs is not None and n_jobs < 0:
+            n_jobs = max(cpu_count() + 1 + n_jobs, 1)
+        tasks = ((i, img, kwargs) for i, img in enumerate(images))
+        if n_jobs is None or n_jobs <= 1:
+            for i, img, _ in tasks:
+                yield i, self.detect_context(img, **kwargs).regions
+            return
+
+        if processes:
+            pool = Pool(n_jobs, initializer=_init_worker, initargs=(self,))
+        else:
+            pool = ThreadPool(n_jobs, initializer=_init_worker,
+                              initargs=(self,))
+        try:
+            if ordered:
+                results = pool.imap(_detect_worker, tasks, chunksize)
+            else:
+                results = pool.imap_unordered(_detect_worker, tasks,
+                                              chunksize)
+            for result in results:
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
     def get_SE(self, imgsize):
+        """Get the structuring element en minimum salient region area for this image,
+        and store them as the attributes `SE` and `lam`.
+
+        Parameters
+        ------
+        imgsize: int
+            size (nr of pixels) of the image
+
+        Returns
+        ------
+        SE: numpy array
+            The structuring element for this image
+        lam: float
+            lambda, minimumm area of a salient region
+        """
+        SE, self.lam = self.structuring_element(imgsize)
+        self.SE = _writable(SE)
+        return self.SE, self.lam
+
+    def structuring_element(self, imgsize):
         """Get the structuring element en minimum salient region area for this image.
-        The standard type of binarization is Datadriven (as in DMSR),
-        but it is possible to pass a different Binarizer.
+        With `cache_SE`, the structuring element is shared and read-only;
+        `get_SE` gives a copy that can be changed.
 
         Parameters
         ------
@@ -77,10 +387,13 @@ class Detector(six.with_metaclass(ABCMeta, object)):
 
         SE_size = int(np.floor(self.SE_size_factor * np.sqrt(imgsize / np.pi)))
         SE_dim_size = SE_size * 2 - 1
-        self.SE = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
-                                            (SE_dim_size, SE_dim_size))
-        self.lam = self.lam_factor * SE_size
-        return self.SE, self.lam
+        if self.cache_SE:
+            SE = morphology.get_structuring_element(SE_dim_size)
+        else:
+            SE = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
+                                           (SE_dim_size, SE_dim_size))
+        lam = self.lam_factor * SE_size
+        return SE, lam
 
 
 class SalientDetector(Detector):
@@ -123,8 +436,8 @@ class SalientDetector(Detector):
 
         Parameters
         ------
-        img: numpy arrary
-            grayscale or color image to detect regions
+        img: numpy arrary or ImageContext
+            grayscale or color image to detect regions, or its context
         find_holes: bool, optional
             Whether to detect regions of type hole
         find_islands: bool, optional
@@ -141,42 +454,93 @@ class SalientDetector(Detector):
         regions: dict
             For each type of region, the maks with detected regions.
         """
-        super(
-            SalientDetector,
-            self).detect(
-            img)
-
-        if self.binarizer is None:
-            self.binarizer = binarization.DatadrivenBinarizer(
-                lam=self.lam, connectivity=self.connectivity)
-        if len(img.shape) == 3:
-            self.gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        else:
-            self.gray = img.copy()
-        # The default binarizer is the Data Driven binarizer
+        context = self.detect_context(img, find_holes, find_islands,
+                                      find_indentations, find_protrusions,
+                                      visualize)
+        self.gray = context.gray
+        self.binarized = context.binarized
+        self.SE = _writable(context.SE)
+        self.lam = context.lam
+        return context.regions
+
+    def detect_context(
+            self,
+            img,
+            find_holes=True,
+            find_islands=True,
+            find_indentations=True,
+            find_protrusions=True,
+            visualize=True):
+        """Find salient regions of the types specified, without changing
+        the detector, so that it can be used by several threads at once.
+
+        Parameters
+        ------
+        img: numpy arrary or ImageContext
+            grayscale or color image to detect regions, or its context
+        find_holes: bool, optional
+            Whether to detect regions of type hole
+        find_islands: bool, optional
+            Whether to detect regions of type island
+        find_indentations: bool, optional
+            Whether to detect regions of type indentation
+        find_protrusions: bool, optional
+            Whether to detect regions of type protrusion
+        visualize: bool, optional
+            Option for visualizing the process
+
+        Returns
+        ------
+        context: DetectionContext
+            The regions and the intermediate results of the detection
+        """
+        with instrumentation.profile_call(self.profile, 'SalientDetector',
+                                          self.profile_memory):
+            return self._detect_context(img, find_holes, find_islands,
+                                        find_indentations, find_protrusions,
+                                        visualize)
+
+    def _detect_context(self, img, find_holes, find_islands,
+                        find_indentations, find_protrusions, visualize):
+        """Find salient regions, see `detect_context`.
+        """
+        context = self.new_context(img)
+
+        # The default binarizer is the Data Driven binarizer, with the
+        # lambda of this image
+        context.binarizer = self.binarizer
+        if context.binarizer is None:
+            context.binarizer = binarization.DatadrivenBinarizer(
+                lam=context.lam, connectivity=self.connectivity)
 
         # Binarize the image
-        self.binarized = self.binarizer.binarize(self.gray, visualize)
+        with instrumentation.stage('binarization'):
+            context.binarized = context.binarizer.binarize_context(
+                context.image, visualize)
 
         # Find regions in the binary image
-        bindetector = BinaryDetector(SE=self.SE, lam=self.lam,
+        bindetector = BinaryDetector(SE=context.SE, lam=context.lam,
                                      area_factor=self.area_factor,
-                                     connectivity=self.connectivity)
-        result = bindetector.detect(self.binarized,
+                                     connectivity=self.connectivity,
+                                     morphology=self.morphology,
+                                     low_memory=self.low_memory,
+                                     memory_budget=self.memory_budget)
+        result = bindetector.detect(context.binarized,
                                     find_holes,
                                     find_islands,
                                     find_indentations,
                                     find_protrusions,
                                     visualize)
-        if visualize:
+        if helpers.visualization_enabled(visualize):
             helpers.visualize_elements(
-                self.gray, holes=result.get(
+                context.gray, holes=result.get(
                     'holes', None), islands=result.get(
                     'islands', None), indentations=result.get(
                     'indentations', None), protrusions=result.get(
                     'protrusions', None),
                 title="Salient Regions visualized in grayscale image")
-        return result
+        context.regions = result
+        return context
 
 
 class MSSRDetector(Detector):
@@ -194,6 +558,27 @@ class MSSRDetector(Detector):
         Stepsize for looping through threshold levels
     perc: float, optional
         The percentile at which the threshold is taken
+    incremental: bool, optional
+        Whether to reuse the results of CCs that did not change since the
+        previous threshold level, instead of recomputing them
+    component_trees: bool, optional
+        Whether to derive the holes and islands of all threshold levels from
+        the min-tree and max-tree of the image
+        (`componenttree.count_region_levels`), instead of detecting them
+        level by level. The results are the same. The holes still come from
+        the levels when the protrusions are detected, which need them, and
+        so do the islands when the indentations are detected.
+    keep_level_masks: bool, optional
+        Whether to keep the masks of the regions of every level, packed to
+        one bit per pixel, in the `accumulator`. All types of regions are
+        then detected level by level.
+    n_jobs: int, optional
+        In how many chunks the threshold levels are split to be processed
+        in parallel. -1 means one chunk per CPU.
+    executor: object, optional
+        Executor (or pool) whose `map` method runs the chunks, for example a
+        `concurrent.futures.ProcessPoolExecutor`. By default the chunks run
+        in a pool of `n_jobs` threads (OpenCV releases the GIL).
     **kwargs
         Other arguments to pass along to the constructor of the superclass `Detector`
 
@@ -201,22 +586,33 @@ class MSSRDetector(Detector):
     ------
     gray : numpy array
         The image converted to grayscale
-    regions_sum : numpy array
+    regions_sum : dict
         The sum of the regions of all levels, before thresholding
+    accumulator : LevelAccumulator
+        The counts of the regions of all levels, and the masks of the levels
+        if they are kept
 
     Note
     ------
     This algorithm is much slower than the DMSR, so should be used with care.
     """
 
-    def __init__(self, min_thres=0, max_thres=255, step=1, perc=0.7, **kwargs):
+    def __init__(self, min_thres=0, max_thres=255, step=1, perc=0.7,
+                 incremental=False, n_jobs=1, executor=None,
+                 component_trees=True, keep_level_masks=False, **kwargs):
         super(MSSRDetector, self).__init__(**kwargs)
         self.min_thres = min_thres
         self.max_thres = max_thres
         self.step = step
         self.perc = perc
+        self.incremental = incremental
+        self.component_trees = component_trees
+        self.keep_level_masks = keep_level_masks
+        self.n_jobs = n_jobs
+        self.executor = executor
         self.gray = None
         self.regions_sum = None
+        self.accumulator = None
 
     def detect(
             self,
@@ -230,8 +626,8 @@ class MSSRDetector(Detector):
 
         Parameters
         ------
-        img: numpy arrary
-            grayscale or color image to detect regions
+        img: numpy arrary or ImageContext
+            grayscale or color image to detect regions, or its context
         find_holes: bool, optional
             Whether to detect regions of type hole
         find_islands: bool, optional
@@ -248,86 +644,309 @@ class MSSRDetector(Detector):
         regions: dict
             For each type of region, the maks with detected regions.
         """
-        super(
-            MSSRDetector,
-            self).detect(
-            img)
-        if len(img.shape) == 3:
-            self.gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        else:
-            self.gray = img.copy()
+        context = self.detect_context(img, find_holes, find_islands,
+                                      find_indentations, find_protrusions,
+                                      visualize)
+        self.gray = context.gray
+        self.SE = _writable(context.SE)
+        self.lam = context.lam
+        # for DEBUGGING
+        self.bint = context.bint
+        self.regions_sum = context.regions_sum
+        self.accumulator = context.accumulator
+        return context.regions
 
-        bindetector = BinaryDetector(SE=self.SE, lam=self.lam,
-                                     area_factor=self.area_factor,
-                                     connectivity=self.connectivity)
+    def detect_context(
+            self,
+            img,
+            find_holes=True,
+            find_islands=True,
+            find_indentations=True,
+            find_protrusions=True,
+            visualize=True):
+        """Find salient regions of the types specified, without changing
+        the detector, so that it can be used by several threads at once.
+
+        Parameters
+        ------
+        img: numpy arrary or ImageContext
+            grayscale or color image to detect regions, or its context
+        find_holes: bool, optional
+            Whether to detect regions of type hole
+        find_islands: bool, optional
+            Whether to detect regions of type island
+        find_indentations: bool, optional
+            Whether to detect regions of type indentation
+        find_protrusions: bool, optional
+            Whether to detect regions of type protrusion
+        visualize: bool, optional
+            Option for visualizing the process
+
+        Returns
+        ------
+        context: DetectionContext
+            The regions and the intermediate results of the detection
+        """
+        with instrumentation.profile_call(self.profile, 'MSSRDetector',
+                                          self.profile_memory):
+            return self._detect_context(img, find_holes, find_islands,
+                                        find_indentations, find_protrusions,
+                                        visualize)
+
+    def _detect_context(self, img, find_holes, find_islands,
+                        find_indentations, find_protrusions, visualize):
+        """Find salient regions, see `detect_context`.
+        """
+        context = self.new_context(img)
+        find = (find_holes, find_islands, find_indentations,
+                find_protrusions)
+        levels = list(range(self.min_thres, self.max_thres + 1, self.step))
+        # The holes and islands of all levels follow from the component
+        # trees, unless the protrusions and indentations need them anyway
+        tree_types = []
+        if self.component_trees and not self.keep_level_masks:
+            if find_holes and not find_protrusions:
+                tree_types.append('holes')
+            if find_islands and not find_indentations:
+                tree_types.append('islands')
+            find = ('holes' not in tree_types and find_holes,
+                    'islands' not in tree_types and find_islands,
+                    find_indentations, find_protrusions)
+        if any(find) or not tree_types:
+            accumulator, context.bint = self._detect_chunks(context, levels,
+                                                            find, visualize)
+        else:
+            accumulator = LevelAccumulator(context.gray.shape, len(levels),
+                                           [])
+            context.bint = np.zeros_like(context.gray, dtype='uint8')
+            if levels:
+                _, context.bint = cv2.threshold(context.gray, levels[-1], 255,
+                                                cv2.THRESH_BINARY)
+        if tree_types:
+            with instrumentation.stage('component_trees'):
+                counts = componenttree.count_region_levels(
+                    context.gray, levels, context.lam, self.connectivity,
+                    tree_types, hist=context.image.histogram,
+                    order=context.image.sorted_order)
+            for regtype in tree_types:
+                accumulator.set_counts(regtype, counts[regtype])
+
+        context.accumulator = accumulator
         result = {}
-        if find_holes:
-            result['holes'] = np.zeros(self.gray.shape, dtype='uint8')
-        if find_islands:
-            result['islands'] = np.zeros(self.gray.shape, dtype='uint8')
-        if find_indentations:
-            result['indentations'] = np.zeros(self.gray.shape, dtype='uint8')
-        if find_protrusions:
-            result['protrusions'] = np.zeros(self.gray.shape, dtype='uint8')
-
-        # Remember image from previous theshold
-        previmg = np.zeros_like(self.gray, dtype='uint8')
-        regions = result.copy()
-        for t in range(self.min_thres, self.max_thres + 1, self.step):
-            # print('threshold', t)
-            _, bint = cv2.threshold(self.gray, t, 255, cv2.THRESH_BINARY)
-            if visualize:
-                helpers.show_image(bint, 'binary image for threshold %i' % t)
-             # for DEBUGGING
-            self.bint = bint.copy()
-            # Only search for regions if the thresholded image is not
-            # different:
-            if not helpers.image_diff(bint, previmg, visualize=False):
-                regions = bindetector.detect(
-                    bint,
-                    find_holes,
-                    find_islands,
-                    find_indentations,
-                    find_protrusions,
-                    visualize=False)
-            for regtype in regions.keys():
-                result[regtype] += np.array(1 *
-                                            (regions[regtype] > 0), dtype='uint8')
-            previmg = bint
-        # for DEBUGGING
-        self.regions_sum = result.copy()
+        for regtype in ['holes', 'islands', 'indentations', 'protrusions']:
+            if regtype in accumulator.counts:
+                result[regtype] = accumulator.counts[regtype]
+        context.regions_sum = result.copy()
         for regtype in result.keys():
-            if visualize:
+            if helpers.visualization_enabled(visualize):
                 helpers.show_image(
                     result[regtype],
                     regtype + " before thresholding")
             result[regtype] = self.threshold_cumsum(result[regtype])
-            if visualize:
+            if helpers.visualization_enabled(visualize):
                 helpers.show_image(
                     result[regtype],
                     regtype + " after thresholding")
+        context.regions = result
+        return context
 
-        return result
+    def _detect_chunks(self, context, levels, find, visualize):
+        """Detect the regions level by level, in chunks of levels that may
+        run in parallel, and count for every pixel on how many levels it is
+        in a region (see `_detect_levels`).
+        """
+        n_chunks = min(self._n_chunks(), len(levels))
+        if n_chunks <= 1 and self.executor is None:
+            return _detect_levels(
+                (self._level_config(context), levels, None, find, visualize))
+        else:
+            # Split the levels in contiguous chunks, each chunk starts
+            # from the thresholded image of the level before it
+            bounds = np.linspace(0, len(levels), max(n_chunks, 1) + 1)
+            bounds = [int(b) for b in np.round(bounds)]
+            config = self._level_config(context)
+            tasks = [(config, levels[start:end],
+                      levels[start - 1] if start > 0 else None,
+                      find, False)
+                     for start, end in zip(bounds[:-1], bounds[1:])
+                     if end > start]
+            if self.executor is None:
+                pool = ThreadPool(len(tasks))
+                try:
+                    chunk_results = pool.map(_detect_levels, tasks)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                chunk_results = list(self.executor.map(_detect_levels,
+                                                       tasks))
+            accumulator = chunk_results[0][0]
+            for chunk_accumulator, _ in chunk_results[1:]:
+                accumulator.merge(chunk_accumulator)
+            return accumulator, chunk_results[-1][1]
+
+    def _n_chunks(self):
+        """Get the number of chunks to split the threshold levels in.
+        """
+        if self.n_jobs is None:
+            return 1
+        if self.n_jobs < 0:
+            return max(cpu_count() + 1 + self.n_jobs, 1)
+        return self.n_jobs
+
+    def _level_config(self, context):
+        """Get what a worker needs to process threshold levels. This does not
+        contain the detector itself, so that it can be sent to other processes.
+        """
+        return {'gray': context.gray, 'SE': context.SE, 'lam': context.lam,
+                'cumulative_histogram': context.image.cumulative_histogram,
+                'num_levels': len(range(self.min_thres, self.max_thres + 1,
+                                        self.step)),
+                'keep_level_masks': self.keep_level_masks,
+                'area_factor': self.area_factor,
+                'connectivity': self.connectivity,
+                'incremental': self.incremental,
+                'morphology': self.morphology,
+                'low_memory': self.low_memory,
+                'memory_budget': self.memory_budget}
 
     def threshold_cumsum(self, data):
         """Thresholds an image based on a percentile of the non-zero pixel values.
+        The percentile is read from the histogram of the values, which are
+        small non-negative integers.
 
         Parameters
         ------
         data: 2-dimensional numpy array
-            the image to threshold
+            the image to threshold, of any integer type
 
         Returns
         ------
         binarized : numpy array
             Thresholded image
         """
+        hist = helpers.integer_histogram(data, minlength=256)
+        values = np.flatnonzero(hist)
         # If the data is already binary, don't do the percentile
-        if len(np.unique(data)) <= 2:
-            thres = np.min(data)
+        if len(values) <= 2:
+            thres = values[0]
         else:
-            data_values = data[data > 0]
-            thres = np.percentile(data_values, int(self.perc * 100))
+            hist[0] = 0
+            thres = helpers.histogram_percentile(hist, int(self.perc * 100))
 
-        _, binarized = cv2.threshold(data, thres, 255, cv2.THRESH_BINARY)
+        if data.dtype == np.uint8:
+            _, binarized = cv2.threshold(data, thres, 255, cv2.THRESH_BINARY)
+        else:
+            binarized = (data > thres).view(np.uint8)
+            binarized *= 255
         return binarized
+
+
+def _init_worker(detector):
+    """Give a worker of `Detector.detect_many` the detector.
+    """
+    _worker.detector = detector
+
+
+def _detect_worker(task):
+    """Detect the regions of one image, with the detector of this worker.
+
+    Parameters
+    ------
+    task: tuple
+        ``(index, img, kwargs)``: the index of the image, the image and the
+        arguments to pass along to `detect_context`
+
+    Returns
+    ------
+    index: int
+        The index of the image
+    regions: dict
+        For each type of region, the maks with detected regions.
+    """
+    index, img, kwargs = task
+    return index, _worker.detector.detect_context(img, **kwargs).regions
+
+
+def _detect_levels(task):
+    """Detect the regions on a contiguous range of threshold levels,
+    and count for every pixel on how many levels it is in a region.
+
+    Parameters
+    ------
+    task: tuple
+        ``(config, levels, previous, find, visualize)``: the configuration
+        from `MSSRDetector._level_config`, the threshold levels, the level
+        before the first one (None if there is none), the four `find_*` flags
+        and whether to visualize the thresholded images
+
+    Returns
+    ------
+    accumulator: LevelAccumulator
+        For each type of region, the count of levels per pixel
+    bint: numpy array
+        The thresholded image of the last level
+    """
+    config, levels, previous, find, visualize = task
+    gray = config['gray']
+    bindetector = BinaryDetector(SE=config['SE'], lam=config['lam'],
+                                 area_factor=config['area_factor'],
+                                 connectivity=config['connectivity'],
+                                 incremental=config['incremental'],
+                                 morphology=config['morphology'],
+                                 low_memory=config['low_memory'],
+                                 memory_budget=config['memory_budget'])
+    regtypes = [regtype for regtype, flag in
+                zip(['holes', 'islands', 'indentations', 'protrusions'], find)
+                if flag]
+    accumulator = LevelAccumulator(gray.shape, config['num_levels'],
+                                   regtypes, config['keep_level_masks'])
+    # The results that the levels of this chunk share in incremental mode
+    state = IncrementalState() if config['incremental'] else None
+
+    # The thresholded image only changes between two levels if there are
+    # pixels with a value in between, which the histogram tells
+    cumhist = config['cumulative_histogram']
+    if previous is None:
+        bint = np.zeros_like(gray, dtype='uint8')
+    else:
+        _, bint = cv2.threshold(gray, previous, 255, cv2.THRESH_BINARY)
+    regions = None
+    # The levels with the current regions that are not counted yet
+    pending = []
+    for t in levels:
+        with instrumentation.stage('mssr_level'):
+            # The first level of a chunk always needs the regions
+            if regions is None or _pixels_up_to(cumhist, t) != \
+                    _pixels_up_to(cumhist, previous):
+                if pending:
+                    accumulator.add(regions, pending)
+                _, bint = cv2.threshold(gray, t, 255, cv2.THRESH_BINARY)
+                regions = bindetector.detect(bint, *find, visualize=False,
+                                             state=state)
+                pending = []
+            pending.append(t)
+            previous = t
+            if helpers.visualization_enabled(visualize):
+                helpers.show_image(bint, 'binary image for threshold %i' % t)
+    if pending:
+        accumulator.add(regions, pending)
+    return accumulator, bint
+
+
+def _pixels_up_to(cumhist, level):
+    """Get the number of pixels that are background at a threshold level,
+    from the cumulative histogram.
+    """
+    if level is None or level < 0:
+        return 0
+    return cumhist[min(int(level), 255)]
+
+
+def _writable(SE):
+    """Get a structuring element that can be changed, copying it if it is
+    shared (see `morphology.get_structuring_element`).
+    """
+    if SE.flags.writeable:
+        return SE
+    return SE.copy()
@@ -0,0 +1,382 @@
+'''
+Evaluation of detected regions: overlap errors between the ellipses of two
+images, repeatability and matching score.
+'''
+
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import numpy as np
+from six.moves import range
+from . import helpers
+from . import spatialindex
+
+# Number of ellipse pairs of which the overlap is computed at once
+_BATCH_SIZE = 4096
+
+
+def _poly_features(features):
+    """Get the polynomial ellipse features as a 2-D float array,
+    concatenating a dict in the order of the saliency types.
+    """
+    return spatialindex._as_features(features)
+
+
+def _valid_rows(features):
+    """Get the rows of the features that are valid ellipses.
+    """
+    valid = np.all(np.isfinite(features[:, :5]), axis=1)
+    valid[valid] = ((features[valid, 2] > 0) &
+                    (features[valid, 2] * features[valid, 4] >
+                     features[valid, 3] ** 2))
+    return np.flatnonzero(valid)
+
+
+def _standard_features(features):
+    """Convert polynomial ellipse features to standard ellipse features.
+    """
+    half_major_axes, half_minor_axes, thetas = \
+        helpers.poly2standard_ellipses(features[:, 2], features[:, 3],
+                                       features[:, 4])
+    # The standard features use the opposite angle (see
+    # `helpers.binary_mask2ellipse_features_single`)
+    return np.column_stack([features[:, :2], half_major_axes,
+                            half_minor_axes, -thetas, features[:, 5]])
+
+
+def project_ellipses(features, homography):
+    """Project ellipses with a homography, which is approximated by an affine
+    transformation at the center of each ellipse.
+
+    Parameters
+    ------
+    features: numpy array or dict
+        Polynomial ellipse features, one ellipse per row, of format
+        ``x0 y0 A B C saliency_type``
+    homography: numpy array
+        3x3 matrix that maps points of the image of the ellipses to the
+        other image
+
+    Returns
+    ------
+    projected: numpy array
+        Polynomial ellipse features of the projected ellipses
+    """
+    features = _poly_features(features)
+    homography = np.asarray(homography, dtype=float)
+    points = np.column_stack([features[:, :2], np.ones(len(features))])
+    projected_points = points.dot(homography.T)
+    w = projected_points[:, 2]
+    centers = projected_points[:, :2] / w[:, None]
+    # Jacobian of the homography at the centers
+    J = (homography[None, :2, :2] -
+         centers[:, :, None] * homography[None, 2, :2][:, None, :]) / \
+        w[:, None, None]
+    Jinv = np.linalg.inv(J)
+    M = np.empty((len(features), 2, 2))
+    M[:, 0, 0] = features[:, 2]
+    M[:, 0, 1] = features[:, 3]
+    M[:, 1, 0] = features[:, 3]
+    M[:, 1, 1] = features[:, 4]
+    M = np.einsum('nki,nkl,nlj->nij', Jinv, M, Jinv)
+    return np.column_stack([centers, M[:, 0, 0], M[:, 0, 1], M[:, 1, 1],
+                            features[:, 5]])
+
+
+def _overlap_errors_pairs(features1, features2, num_angles):
+    """Compute the overlap errors of pairs of ellipses, in batches.
+    """
+    errors = np.empty(len(features1))
+    for start in range(0, len(features1), _BATCH_SIZE):
+        batch = slice(start, start + _BATCH_SIZE)
+        errors[batch] = _overlap_errors_batch(features1[batch],
+                                              features2[batch], num_angles)
+    return errors
+
+
+def _overlap_errors_batch(features1, features2, num_angles):
+    """Compute the overlap errors of pairs of ellipses.
+
+    The first ellipse is mapped to the unit disc. From a point in the
+    intersection of the two ellipses, the intersection is star-shaped, and
+    its area is integrated over `num_angles` directions.
+    """
+    # Cholesky factor of the first ellipse: u = R (p - c1)
+    r11 = np.sqrt(features1[:, 2])
+    r12 = features1[:, 3] / r11
+    r22 = np.sqrt(features1[:, 4] - r12 * r12)
+    Rinv = np.zeros((len(features1), 2, 2))
+    Rinv[:, 0, 0] = 1 / r11
+    Rinv[:, 0, 1] = -r12 / (r11 * r22)
+    Rinv[:, 1, 1] = 1 / r22
+    M2 = np.empty((len(features2), 2, 2))
+    M2[:, 0, 0] = features2[:, 2]
+    M2[:, 0, 1] = features2[:, 3]
+    M2[:, 1, 0] = features2[:, 3]
+    M2[:, 1, 1] = features2[:, 4]
+    N = np.einsum('nki,nkl,nlj->nij', Rinv, M2, Rinv)
+    d = features2[:, :2] - features1[:, :2]
+    u0 = np.column_stack([r11 * d[:, 0] + r12 * d[:, 1], r22 * d[:, 1]])
+
+    # A point in both ellipses (or none, if they do not intersect)
+    origin, value = spatialindex.minimize_on_unit_disc(N, u0)
+    intersect = value <= 1
+
+    angles = (np.arange(num_angles) + 0.5) * (2 * np.pi / num_angles)
+    directions = np.column_stack([np.cos(angles), np.sin(angles)])
+    # Distance to the unit circle along each direction
+    od = origin.dot(directions.T)
+    oo = np.sum(origin * origin, axis=1)[:, None]
+    radius1 = -od + np.sqrt(np.maximum(od * od - oo + 1, 0))
+    # Distance to the second ellipse along each direction
+    e = origin - u0
+    Nd = np.einsum('nij,kj->nki', N, directions)
+    a = np.einsum('nki,ki->nk', Nd, directions)
+    b = np.einsum('nki,ni->nk', Nd, e)
+    c = np.einsum('ni,nij,nj->n', e, N, e)[:, None]
+    radius2 = (-b + np.sqrt(np.maximum(b * b - a * (c - 1), 0))) / a
+    radius = np.maximum(np.minimum(radius1, radius2), 0)
+
+    # Areas relative to the area of the first ellipse
+    intersection = np.sum(radius * radius, axis=1) / num_angles
+    intersection = np.where(intersect, np.minimum(intersection, 1), 0)
+    area2 = 1 / np.sqrt(np.linalg.det(N))
+    intersection = np.minimum(intersection, area2)
+    return 1 - intersection / (1 + area2 - intersection)
+
+
+def overlap_errors(features1, features2, homography=None, max_error=1.,
+                   num_angles=128):
+    """Compute the overlap errors between the ellipses of two images, for
+    all pairs of ellipses that intersect.
+
+    The overlap error of two ellipses is one minus the ratio of the areas of
+    their intersection and their union. The ellipses of the first image are
+    projected to the second image with the homography. Only the pairs of
+    which the bounding boxes intersect and of which the ratio of the areas
+    allows an overlap error below `max_error` are computed.
+
+    Parameters
+    ------
+    features1: numpy array or dict
+        Polynomial ellipse features of the first image, one ellipse per row,
+        of format ``x0 y0 A B C saliency_type``, or a dict of these per
+        saliency type, which are concatenated in the order holes, islands,
+        indentations, protrusions
+    features2: numpy array or dict
+        Polynomial ellipse features of the second image
+    homography: numpy array, optional
+        3x3 matrix that maps points of the first image to the second image;
+        by default the images have the same coordinates
+    max_error: float, optional
+        Only return pairs with an overlap error below this value
+    num_angles: int, optional
+        Number of directions in which the intersection is integrated
+
+    Returns
+    ------
+    indices1: numpy array
+        The rows of the ellipses in the first image
+    indices2: numpy array
+        The rows of the ellipses in the second image
+    errors: numpy array
+        The overlap errors of the pairs of ellipses
+    """
+    features1 = _poly_features(features1)
+    features2 = _poly_features(features2)
+    if homography is not None:
+        features1 = project_ellipses(features1, homography)
+    rows1 = _valid_rows(features1)
+    rows2 = _valid_rows(features2)
+    standard1 = np.full((len(features1), 6), np.nan)
+    standard2 = np.full((len(features2), 6), np.nan)
+    standard1[rows1] = _standard_features(features1[rows1])
+    standard2[rows2] = _standard_features(features2[rows2])
+    indices1, indices2 = spatialindex.EllipseIndex(standard1).intersecting_pairs(
+        spatialindex.EllipseIndex(standard2))
+
+    # The overlap error is at least one minus the ratio of the areas
+    det1 = features1[indices1, 2] * features1[indices1, 4] - \
+        features1[indices1, 3] ** 2
+    det2 = features2[indices2, 2] * features2[indices2, 4] - \
+        features2[indices2, 3] ** 2
+    area_ratio = np.sqrt(np.minimum(det1, det2) / np.maximum(det1, det2))
+    keep = 1 - area_ratio < max_error
+    indices1 = indices1[keep]
+    indices2 = indices2[keep]
+
+    errors = _overlap_errors_pairs(features1[indices1], features2[indices2],
+                                   num_angles)
+    keep = errors < max_error
+    return indices1[keep], indices2[keep], errors[keep]
+
+
+def overlap_error_matrix(features1, features2, homography=None,
+                         num_angles=128):
+    """Compute the matrix of overlap errors between the ellipses of two images.
+    See `overlap_errors`.
+
+    Parameters
+    ------
+    features1: numpy array or dict
+        Polynomial ellipse features of the first image
+    features2: numpy array or dict
+        Polynomial ellipse features of the second image
+    homography: numpy array, optional
+        3x3 matrix that maps points of the first image to the second image
+    num_angles: int, optional
+        Number of directions in which the intersection is integrated
+
+    Returns
+    ------
+    errors: numpy array
+        The overlap error of every pair of ellipses, 1 for ellipses that do
+        not intersect (or are not valid), shape (n1, n2)
+    """
+    features1 = _poly_features(features1)
+    features2 = _poly_features(features2)
+    errors = np.ones((len(features1), len(features2)))
+    indices1, indices2, pair_errors = overlap_errors(
+        features1, features2, homography, num_angles=num_angles)
+    errors[indices1, indices2] = pair_errors
+    return errors
+
+
+def _common_rows(features1, features2, homography, shape1, shape2):
+    """Get the rows of the valid ellipses of both images that lie in the
+    part of the scene that is visible in both images.
+    """
+    rows = []
+    for features, shape, H in [(features1, shape2, homography),
+                               (features2, shape1,
+                                None if homography is None
+                                else np.linalg.inv(homography))]:
+        if H is not None:
+            features = project_ellipses(features, H)
+        valid = _valid_rows(features)
+        if shape is not None:
+            # The bounding box of the ellipse should be inside the other image
+            det = features[valid, 2] * features[valid, 4] - \
+                features[valid, 3] ** 2
+            half_widths = np.sqrt(features[valid, 4] / det)
+            half_heights = np.sqrt(features[valid, 2] / det)
+            inside = ((features[valid, 0] - half_widths >= 0) &
+                      (features[valid, 1] - half_heights >= 0) &
+                      (features[valid, 0] + half_widths <= shape[1] - 1) &
+                      (features[valid, 1] + half_heights <= shape[0] - 1))
+            valid = valid[inside]
+        rows.append(valid)
+    return rows
+
+
+def _correspondences(indices1, indices2, errors):
+    """Match the pairs one-to-one, greedily in the order of increasing error.
+    """
+    matched1 = set()
+    matched2 = set()
+    correspondences = []
+    for k in np.argsort(errors, kind='mergesort'):
+        if indices1[k] not in matched1 and indices2[k] not in matched2:
+            matched1.add(indices1[k])
+            matched2.add(indices2[k])
+            correspondences.append(k)
+    return np.array(correspondences, dtype=int)
+
+
+def repeatability(features1, features2, homography=None, shape1=None,
+                  shape2=None, max_error=0.4, num_angles=128):
+    """Compute the repeatability of the regions detected in two images of
+    the same scene: the number of regions that correspond one-to-one with
+    an overlap error below `max_error`, relative to the smallest number of
+    regions in the part of the scene that is visible in both images.
+
+    Parameters
+    ------
+    features1: numpy array or dict
+        Polynomial ellipse features of the first image
+    features2: numpy array or dict
+        Polynomial ellipse features of the second image
+    homography: numpy array, optional
+        3x3 matrix that maps points of the first image to the second image
+    shape1: tuple, optional
+        The shape of the first image; if given, only the regions of the second
+        image that are inside the first image are counted
+    shape2: tuple, optional
+        The shape of the second image; if given, only the regions of the first
+        image that are inside the second image are counted
+    max_error: float, optional
+        The maximum overlap error of corresponding regions
+    num_angles: int, optional
+        Number of directions in which the intersections are integrated
+
+    Returns
+    ------
+    repeatability: float
+        The repeatability, between 0 and 1
+    num_correspondences: int
+        The number of corresponding regions
+    """
+    features1 = _poly_features(features1)
+    features2 = _poly_features(features2)
+    rows1, rows2 = _common_rows(features1, features2, homography,
+                                shape1, shape2)
+    if len(rows1) == 0 or len(rows2) == 0:
+        return 0., 0
+    indices1, indices2, errors = overlap_errors(
+        features1[rows1], features2[rows2], homography, max_error, num_angles)
+    num_correspondences = len(_correspondences(indices1, indices2, errors))
+    return (num_correspondences / float(min(len(rows1), len(rows2))),
+            num_correspondences)
+
+
+def matching_score(features1, features2, matches, homography=None,
+                   shape1=None, shape2=None, max_error=0.4, num_angles=128):
+    """Compute the matching score of the regions detected in two images of
+    the same scene: the number of correct matches (of regions with an overlap
+    error below `max_error`), relative to the smallest number of regions in
+    the part of the scene that is visible in both images.
+
+    Parameters
+    ------
+    features1: numpy array or dict
+        Polynomial ellipse features of the first image
+    features2: numpy array or dict
+        Polynomial ellipse features of the second image
+    matches: numpy array
+        The matches of the regions (e.g. by their descriptors), one per row:
+        the row of the region in `features1` and the row in `features2`
+    homography: numpy array, optional
+        3x3 matrix that maps points of the first image to the second image
+    shape1: tuple, optional
+        The shape of the first image
+    shape2: tuple, optional
+        The shape of the second image
+    max_error: float, optional
+        The maximum overlap error of correctly matched regions
+    num_angles: int, optional
+        Number of directions in which the intersections are integrated
+
+    Returns
+    ------
+    matching_score: float
+        The matching score, between 0 and 1
+    num_correct: int
+        The number of correct matches
+    """
+    features1 = _poly_features(features1)
+    features2 = _poly_features(features2)
+    rows1, rows2 = _common_rows(features1, features2, homography,
+                                shape1, shape2)
+    if len(rows1) == 0 or len(rows2) == 0:
+        return 0., 0
+    matches = np.asarray(matches, dtype=int).reshape(-1, 2)
+    matches = matches[np.isin(matches[:, 0], rows1) &
+                      np.isin(matches[:, 1], rows2)]
+    num_correct = 0
+    if len(matches) > 0:
+        features1 = features1[matches[:, 0]]
+        if homography is not None:
+            features1 = project_ellipses(features1, homography)
+        errors = _overlap_errors_pairs(features1, features2[matches[:, 1]],
+                                       num_angles)
+        num_correct = int(np.sum(errors < max_error))
+    return num_correct / float(min(len(rows1), len(rows2))), num_correct
@@ -0,0 +1,263 @@
+'''
+Binary storage of the ellipse features of many images in one file.
+'''
+
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import os
+import struct
+import numpy as np
+import six
+from . import helpers
+
+# The order in which the saliency types are stored
+REGION_TYPES = ['holes', 'islands', 'indentations', 'protrusions']
+
+_MAGIC = b'SRFEATS\x00'
+_VERSION = 1
+# magic, version, item size (4 or 8), number of columns
+_FILE_HEADER = struct.Struct('<8sIII')
+_FILE_HEADER_SIZE = 32
+_RECORD_MAGIC = b'SRIM'
+# magic, length of the name, number of regions per saliency type
+_RECORD_HEADER = struct.Struct('<4sI4Q')
+
+
+def _padded(size):
+    """Round a size up to a multiple of 8 bytes, so that the data
+    in the file stays aligned.
+    """
+    return size + (-size) % 8
+
+
+class FeatureStore(object):
+
+    """
+    File with the ellipse features of many images. The file starts with a
+    header, followed by one record per image: the number of regions per
+    saliency type, a name and the features of all regions, ordered by saliency
+    type. Records are only ever appended, and the features are loaded as
+    read-only views of a memory map of the file, without copying. Before an
+    append, records that other handles appended are added to the index, so
+    several handles can append to a file one after the other (but not at the
+    same time).
+
+    Parameters
+    ------
+    filename: str
+        The file to store the features in
+    mode: str, optional
+        'r' to read, 'a' to append to the file (it is created if it does not
+        exist), 'w' to create a new (empty) file
+    dtype: str, optional
+        'float64' or 'float32'; the type to store the features as when the
+        file is created. An existing file keeps its own type.
+    ncols: int, optional
+        The number of features per region when the file is created,
+        including the saliency type in the last column
+
+    Attributes
+    ------
+    index: list of tuples
+        For every image, ``(name, offset, num_regions)``, with the position of
+        the features in the file and a dict with the number of regions per
+        saliency type
+    """
+
+    def __init__(self, filename, mode='r', dtype='float64', ncols=6):
+        if mode not in ('r', 'a', 'w'):
+            raise ValueError("mode should be 'r', 'a' or 'w', got %s" % mode)
+        self.filename = filename
+        self.mode = mode
+        if mode == 'w' or (mode == 'a' and not os.path.exists(filename)):
+            self.dtype = np.dtype(dtype)
+            if self.dtype not in (np.dtype('float64'), np.dtype('float32')):
+                raise ValueError('dtype should be float64 or float32, got %s'
+                                 % dtype)
+            self.ncols = ncols
+            header = _FILE_HEADER.pack(_MAGIC, _VERSION, self.dtype.itemsize,
+                                       ncols)
+            with open(filename, 'wb') as f:
+                f.write(header.ljust(_FILE_HEADER_SIZE, b'\x00'))
+        self.index = []
+        self._map = None
+        self._end = _FILE_HEADER_SIZE
+        self._read_index()
+
+    def _read_index(self):
+        """Read the file header and the headers of all records.
+        An incomplete record at the end of the file (from an interrupted
+        append) is ignored.
+        """
+        size = os.path.getsize(self.filename)
+        with open(self.filename, 'rb') as f:
+            header = f.read(_FILE_HEADER_SIZE)
+            if len(header) < _FILE_HEADER_SIZE:
+                raise ValueError('%s is not a feature store' % self.filename)
+            magic, version, itemsize, ncols = _FILE_HEADER.unpack(
+                header[:_FILE_HEADER.size])
+            if magic != _MAGIC:
+                raise ValueError('%s is not a feature store' % self.filename)
+            if version != _VERSION:
+                raise ValueError('Unsupported feature store version %i'
+                                 % version)
+            self.dtype = np.dtype('float64' if itemsize == 8 else 'float32')
+            self.ncols = ncols
+            offset = _FILE_HEADER_SIZE
+            while offset + _RECORD_HEADER.size <= size:
+                f.seek(offset)
+                header = _RECORD_HEADER.unpack(f.read(_RECORD_HEADER.size))
+                magic, namelength, counts = header[0], header[1], header[2:]
+                if magic != _RECORD_MAGIC:
+                    break
+                name = f.read(namelength).decode('utf-8')
+                data_offset = offset + _padded(_RECORD_HEADER.size + namelength)
+                end = data_offset + sum(counts) * ncols * itemsize
+                if end > size:
+                    break
+                num_regions = dict(zip(REGION_TYPES, [int(c) for c in counts]))
+                self.index.append((name, data_offset, num_regions))
+                offset = end
+        self._end = offset
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Release the memory map of the file.
+        """
+        self._map = None
+
+    def append(self, num_regions, features, name=''):
+        """Append the features of an image.
+
+        Parameters
+        ------
+        num_regions: dict
+            The number of salient regions for each saliency type
+        features: dict
+            dictionary with ellipse features for each of the ellipses
+        name: str, optional
+            A name for the image, e.g. its file name; bytes are decoded as
+            UTF-8
+
+        Returns
+        ------
+        index: int
+            The index of the image in the store
+        """
+        if self.mode == 'r':
+            raise IOError('The feature store is opened for reading only')
+        counts = [int(num_regions.get(saltype, 0)) for saltype in REGION_TYPES]
+        blocks = []
+        for saltype, count in zip(REGION_TYPES, counts):
+            if count > 0:
+                block = np.asarray(features[saltype])[:count]
+                if block.shape[1] != self.ncols:
+                    raise ValueError('Expected %i features per region, got %i'
+                                     % (self.ncols, block.shape[1]))
+                blocks.append(block.astype(self.dtype))
+        # A str is bytes on Python 2
+        if isinstance(name, six.binary_type):
+            name = name.decode('utf-8')
+        namebytes = name.encode('utf-8')
+        header = _RECORD_HEADER.pack(_RECORD_MAGIC, len(namebytes), *counts)
+        header = (header + namebytes).ljust(
+            _padded(_RECORD_HEADER.size + len(namebytes)), b'\x00')
+        with open(self.filename, 'r+b') as f:
+            # Another handle or process may have appended since the index was
+            # read; only an incomplete record at the end is overwritten
+            if os.fstat(f.fileno()).st_size != self._end:
+                self.index = []
+                self._read_index()
+            f.seek(self._end)
+            f.truncate()
+            f.write(header)
+            for block in blocks:
+                f.write(np.ascontiguousarray(block).tobytes())
+        data_offset = self._end + len(header)
+        self.index.append((name, data_offset,
+                           dict(zip(REGION_TYPES, counts))))
+        self._end = data_offset + sum(counts) * self.ncols * self.dtype.itemsize
+        return len(self.index) - 1
+
+    def load(self, index):
+        """Load the features of an image, as read-only views of the file.
+
+        Parameters
+        ------
+        index: int
+            The index of the image in the store
+
+        Returns
+        ------
+        total_num_regions: int
+            the total number of salient regions of saliency types
+        num_regions: dict
+            The number of saleint regions for each saliency type
+        features: dict
+            dictionary with ellipse features for each of the ellipses
+        """
+        _, offset, num_regions = self.index[index]
+        total_num_regions = sum(num_regions.values())
+        if self._map is None or len(self._map) < self._end:
+            self._map = np.memmap(self.filename, dtype='uint8', mode='r')
+        rowsize = self.ncols * self.dtype.itemsize
+        features = {}
+        for saltype in REGION_TYPES:
+            count = num_regions[saltype]
+            block = self._map[offset:offset + count * rowsize]
+            features[saltype] = block.view(self.dtype).reshape(count,
+                                                               self.ncols)
+            offset += count * rowsize
+        return total_num_regions, dict(num_regions), features
+
+    def import_text(self, filename, name=None):
+        """Append the features of an image from a text file, as written by
+        `helpers.save_ellipse_features2file`.
+
+        Parameters
+        ------
+        filename: str
+            The text file to read the features from
+        name: str, optional
+            A name for the image, by default the name of the text file
+
+        Returns
+        ------
+        index: int
+            The index of the image in the store
+        """
+        _, num_regions, features = helpers.load_ellipse_features_from_file(
+            filename)
+        if name is None:
+            name = os.path.basename(filename)
+        return self.append(num_regions, features, name)
+
+    def export_text(self, index, filename):
+        """Write the features of an image to a text file, in the format of
+        `helpers.save_ellipse_features2file`.
+
+        Parameters
+        ------
+        index: int
+            The index of the image in the store
+        filename: str
+            The text file to write the features to
+
+        Returns
+        ------
+        total_num_regions: int
+            the total number of salient regions of saliency types
+        """
+        _, num_regions, features = self.load(index)
+        num_regions = dict((k, v) for (k, v) in six.iteritems(num_regions)
+                           if v > 0)
+        return helpers.save_ellipse_features2file(num_regions, features,
+                                                  filename)
@@ -6,16 +6,75 @@ from __future__ import absolute_import
 from numpy import linalg as LA
 import cv2
 import numpy as np
-import scipy.io as sio
-import matplotlib.pyplot as plt
 import math
+import os
 import six
 from six.moves import range
+from . import instrumentation
+
+# In headless mode, nothing is ever displayed. It can also be switched on
+# with the environment variable SALIENTREGIONS_HEADLESS.
+_headless = os.environ.get('SALIENTREGIONS_HEADLESS', '').lower() \
+    not in ('', '0', 'false', 'no')
+
+
+def set_headless(headless=True):
+    """Switch headless mode on or off. In headless mode, all visualization
+    is skipped, whatever the `visualize` arguments are.
+
+    Parameters
+    ----------
+    headless : bool, optional
+        Whether to switch headless mode on
+    """
+    global _headless
+    _headless = headless
+
+
+def is_headless():
+    """Whether headless mode is on.
+
+    Returns
+    ----------
+    headless : bool
+        True if visualization is switched off
+    """
+    return _headless
+
+
+def visualization_enabled(visualize=True):
+    """Whether to visualize, given the `visualize` argument of a function.
+
+    Parameters
+    ----------
+    visualize : bool, optional
+        visualizations flag
+
+    Returns
+    ----------
+    visualize : bool
+        True if `visualize` is set and headless mode is off
+    """
+    return bool(visualize) and not _headless
+
+
+def get_pyplot():
+    """Get `matplotlib.pyplot`. It is only imported when something
+    is plotted, because importing it is slow and needs a display backend.
+
+    Returns
+    ----------
+    plt : module
+        The `matplotlib.pyplot` module
+    """
+    import matplotlib.pyplot as plt
+    return plt
 
 
 def show_image(img, title=None):
     """Display the image.
-    When a key is pressed, the window is closed
+    When a key is pressed, the window is closed.
+    In headless mode, nothing is displayed.
 
     Parameters
     ----------
@@ -24,6 +83,9 @@ def show_image(img, title=None):
     title : str, optional
         Title of the image
     """
+    if _headless:
+        return
+    plt = get_pyplot()
     fig = plt.figure()
     plt.axis("off")
     if len(img.shape) == 3:
@@ -91,15 +153,15 @@ def visualize_elements(img, regions=None,
         indentations = regions.get("indentations", None)
         protrusions = regions.get("protrusions", None)
     if holes is not None:
-        img_to_show[[holes > 0]] = colormap['holes']
+        img_to_show[holes > 0] = colormap['holes']
     if islands is not None:
-        img_to_show[[islands > 0]] = colormap['islands']
+        img_to_show[islands > 0] = colormap['islands']
     if indentations is not None:
-        img_to_show[[indentations > 0]] = colormap['indentations']
+        img_to_show[indentations > 0] = colormap['indentations']
     if protrusions is not None:
-        img_to_show[[protrusions > 0]] = colormap['protrusions']
+        img_to_show[protrusions > 0] = colormap['protrusions']
 
-    if visualize:
+    if visualization_enabled(visualize):
         show_image(img_to_show, title=title)
     return img_to_show
 
@@ -132,7 +194,7 @@ def visualize_elements_ellipses(img, features,
     for region_type in features.keys():
         img_to_show = visualize_ellipses(img_to_show, features[region_type],
                                          colormap[region_type], visualize=False)
-    if visualize:
+    if visualization_enabled(visualize):
         show_image(img_to_show, title=title)
     return img_to_show
 
@@ -158,13 +220,14 @@ def read_matfile(filename, visualize=True):
     indentations: numpy array
         Binary image with indentations as foreground
     """
+    import scipy.io as sio
     matfile = sio.loadmat(filename)
     regions = matfile['saliency_masks'] * 255
     holes = regions[:,:, 0]
     islands = regions[:,:, 1]
     indentations = regions[:,:, 2]
     protrusions = regions[:,:, 3]
-    if visualize:
+    if visualization_enabled(visualize):
         show_image(holes, 'holes')
         show_image(islands, 'islands')
         show_image(indentations, 'indentations')
@@ -190,7 +253,7 @@ def image_diff(img1, img2, visualize=True):
     is_same: bool
         True if all pixels of the two images are equal
     """
-    if visualize:
+    if visualization_enabled(visualize):
         show_image(cv2.bitwise_xor(img1, img2), 'Difference between images')
     return np.all(img1 == img2)
 
@@ -212,6 +275,76 @@ def array_diff(arr1, arr2, rtol=1e-05, atol=1e-08):
     return np.allclose(arr1, arr2, rtol, atol)
 
 
+def integer_histogram(data, minlength=0, chunk_size=1 << 20):
+    """Count how often each value occurs in an array of non-negative integers,
+    such as the counts of levels per pixel of `MSSRDetector`. The array is
+    counted in chunks, so that the temporary arrays stay small.
+
+    Parameters
+    ------
+    data: numpy array
+        Array of non-negative integers, of any integer type
+    minlength: int, optional
+        The minimum length of the histogram
+    chunk_size: int, optional
+        The number of elements to count at once
+
+    Returns
+    ------
+    hist: numpy array
+        For every value from 0 to the maximum, the number of elements
+        with that value
+    """
+    flat = np.asarray(data).reshape(-1)
+    if flat.dtype.kind not in 'biu':
+        raise ValueError('Expected an array of integers, got %s' % flat.dtype)
+    hist = np.zeros(max(minlength, 1), dtype=np.int64)
+    for start in range(0, flat.size, chunk_size):
+        counts = np.bincount(flat[start:start + chunk_size])
+        if len(counts) > len(hist):
+            hist = np.concatenate([hist, np.zeros(len(counts) - len(hist),
+                                                  dtype=np.int64)])
+        hist[:len(counts)] += counts
+    return hist
+
+
+def histogram_percentile(hist, percentile):
+    """Get a percentile of the values that a histogram counts, as
+    `numpy.percentile` computes it (with linear interpolation) from the
+    values themselves.
+
+    Parameters
+    ------
+    hist: numpy array
+        For every value from 0 on, the number of times it occurs
+    percentile: float
+        The percentile, between 0 and 100
+
+    Returns
+    ------
+    value: float
+        The percentile of the values
+    """
+    cumulative = np.cumsum(hist)
+    count = int(cumulative[-1])
+    if count == 0:
+        raise ValueError('The histogram is empty')
+    # The position in the sorted values, and its neighbours
+    index = (count - 1) * (percentile / 100.)
+    previous = min(int(math.floor(index)), count - 1)
+    following = min(previous + 1, count - 1)
+    below = int(np.searchsorted(cumulative, previous, side='right'))
+    above = int(np.searchsorted(cumulative, following, side='right'))
+    if index >= count - 1:
+        return float(above)
+    # The same arithmetic as numpy, to get the same value in all cases
+    gamma = index - previous
+    diff = float(above - below)
+    if gamma >= 0.5:
+        return above - diff * (1 - gamma)
+    return below + diff * gamma
+
+
 def standard2poly_ellipse(half_major_axis, half_minor_axis, theta):
     """ Conversion of elliptic parameters to polynomial coefficients.
 
@@ -300,7 +433,75 @@ def poly2standard_ellipse(A, B, C):
 
     return half_major_axis, half_minor_axis, theta
 
-def binary_mask2ellipse_features_single(binary_mask, connectivity=4, saliency_type=1, min_square=False):
+def standard2poly_ellipses(half_major_axes, half_minor_axes, thetas):
+    """ Conversion of elliptic parameters to polynomial coefficients,
+    for many ellipses at once.
+
+    Parameters
+    ----------
+    half_major_axes: numpy array
+        Half of the length of each ellipse's major axis
+    half_minor_axes: numpy array
+        Half of the length of each ellipse's minor axis
+    thetas: numpy array
+        The ellipse orientation angles (radians) between the major and the x axis
+
+    Returns
+    ----------
+    A, B, C: numpy arrays
+        The coefficients of the polynomial equations of the ellipses :math:`Ax^2 + Bxy + Cy^2 = 1`
+    """
+    # The scalar conversion only uses element-wise operations
+    return standard2poly_ellipse(np.asarray(half_major_axes, dtype=float),
+                                 np.asarray(half_minor_axes, dtype=float),
+                                 np.asarray(thetas, dtype=float))
+
+def poly2standard_ellipses(A, B, C):
+    """ Conversion of elliptic polynomial coefficients to standard parameters,
+    for many ellipses at once. The eigenvalues are computed in closed form.
+
+    Parameters
+    ----------
+    A, B, C: numpy arrays
+        The coefficients of the polynomial equations of the ellipses :math:`Ax^2 + Bxy + Cy^2 = 1`
+
+    Returns
+    ----------
+    half_major_axes: numpy array
+        Half of the length of each ellipse's major axis
+    half_minor_axes: numpy array
+        Half of the length of each ellipse's minor axis
+    thetas: numpy array
+        The ellipse orientation angles (radians) between the major and the x axis
+
+     NOTE
+     ------
+     WARNING: The conversion might be correct only if the resulting angle is between 0 and pi/2!
+    """
+    A = np.asarray(A, dtype=float)
+    B = np.asarray(B, dtype=float)
+    C = np.asarray(C, dtype=float)
+
+    # eigenvalues of the matrix [[A, B], [B, C]]; the smallest one from the
+    # determinant, which is more accurate for elongated ellipses
+    e_max = (A + C) / 2 + np.hypot((A - C) / 2, B)
+    e_min = (A * C - B * B) / e_max
+
+    # derive the angle directly from the coefficients
+    with np.errstate(divide='ignore', invalid='ignore'):
+        half_angle = 0.5 * np.arctan(2 * B / (A - C))
+    thetas = np.where(B == 0,
+                      np.where(A < C, 0., np.pi / 2),
+                      np.where(A < C, half_angle, np.pi / 2 + half_angle))
+
+    # axis lengths
+    half_major_axes = 1 / np.sqrt(e_min)
+    half_minor_axes = 1 / np.sqrt(e_max)
+
+    return half_major_axes, half_minor_axes, thetas
+
+def binary_mask2ellipse_features_single(binary_mask, connectivity=4, saliency_type=1, min_square=False,
+                                        method=None):
     """ Conversion of a single saliency type of binary regions to ellipse features.
 
     Parameters
@@ -318,6 +519,12 @@ def binary_mask2ellipse_features_single(binary_mask, connectivity=4, saliency_ty
     min_square: bool, optional
         whether to use minimum sqrt fitting for ellipses
         (default is bounded rotated rectangle fitting)
+    method: str, optional
+        How to fit the ellipses: 'rect' (bounded rotated rectangle of the
+        contour), 'fit' (minimum square fit to the contour) or 'moments'
+        (ellipse with the same second order moments as the region, for all
+        regions at once, as MATLAB's `regionprops`).
+        By default, `min_square` decides between 'fit' and 'rect'.
 
     Returns
     ----------
@@ -344,12 +551,24 @@ def binary_mask2ellipse_features_single(binary_mask, connectivity=4, saliency_ty
     are the polynomial coefficients from the ellipse equation :math:`Ax^2 + Bxy + Cy^2 = 1`.
     """
 
+    if method is None:
+        method = 'fit' if min_square else 'rect'
+    if method == 'moments':
+        return _ellipse_features_moments(binary_mask, connectivity, saliency_type)
+    elif method not in ('rect', 'fit'):
+        raise ValueError("method should be 'rect', 'fit' or 'moments', got %s" % method)
+    min_square = method == 'fit'
+
     # num_regions, labels, stats, centroids = cv2.connectedComponentsWithStats(binary_mask, connectivity=connectivity)
     binary_mask2 = binary_mask.copy()
     _, contours, hierarchy = cv2.findContours(
         binary_mask2, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
 
-    indices_regions = np.where(hierarchy[0,:, 3] == -1)[0]
+    # An empty mask has no contours (and no hierarchy)
+    if hierarchy is None:
+        indices_regions = np.zeros(0, dtype=int)
+    else:
+        indices_regions = np.where(hierarchy[0,:, 3] == -1)[0]
     num_regions = len(indices_regions)
     features_standard = np.zeros((num_regions, 6), float)
     features_poly = np.zeros((num_regions, 6), float)
@@ -404,6 +623,77 @@ def binary_mask2ellipse_features_single(binary_mask, connectivity=4, saliency_ty
         i += 1
     return num_regions, features_standard, features_poly
 
+
+def _ellipse_features_moments(binary_mask, connectivity=4, saliency_type=1):
+    """ Conversion of a single saliency type of binary regions to the ellipses
+    with the same second order moments, for all regions at once.
+
+    Parameters
+    ----------
+    binary_mask: 2-D numpy array
+        Binary mask of the detected salient regions of the given saliency type
+    connectivity: int
+        Neighborhood connectivity
+    saliency_type: int
+        Type of salient regions
+
+    Returns
+    ----------
+    num_regions: int
+        The number of saleint regions of saliency_type
+    features_standard: numpy array
+        array with standard ellipse features for each of the ellipses for a given saliency type
+    features_poly: numpy array
+        array with polynomial ellipse features for each of the ellipses  for a given saliency type
+
+    Notes
+    ----------
+    The regions are the connected components of the mask, in the order of
+    their labels. As in MATLAB's `regionprops`, the variances include the
+    1/12 of a pixel and the angle (in radians) is the counter-clockwise
+    orientation of the major axis, between -pi/2 and pi/2.
+    """
+    nlabels, labels, stats, centroids = cv2.connectedComponentsWithStats(
+        binary_mask, connectivity=connectivity)
+    num_regions = nlabels - 1
+    features_standard = np.zeros((num_regions, 6), float)
+    features_poly = np.zeros((num_regions, 6), float)
+    if num_regions == 0:
+        return num_regions, features_standard, features_poly
+
+    # Central second order moments, summed per label
+    pixels = np.flatnonzero(labels)
+    pixel_labels = labels.ravel()[pixels]
+    dx = pixels % labels.shape[1] - centroids[pixel_labels, 0]
+    dy = pixels // labels.shape[1] - centroids[pixel_labels, 1]
+    area = stats[1:, cv2.CC_STAT_AREA].astype(float)
+    sxx = np.bincount(pixel_labels, dx * dx, nlabels)[1:] / area + 1 / 12.
+    syy = np.bincount(pixel_labels, dy * dy, nlabels)[1:] / area + 1 / 12.
+    sxy = np.bincount(pixel_labels, dx * dy, nlabels)[1:] / area
+
+    # The half axes of a uniform ellipse are twice the standard deviations
+    common = np.sqrt((sxx - syy) ** 2 + 4 * sxy ** 2)
+    a = np.fix(2 * np.sqrt((sxx + syy + common) / 2))
+    b = np.fix(2 * np.sqrt((sxx + syy - common) / 2))
+    # Angle of the major axis, clockwise in image coordinates
+    theta = 0.5 * np.arctan2(2 * sxy, sxx - syy)
+    angle_rad = np.where(theta == np.pi / 2, np.pi / 2, -theta) + 0.
+    A, B, C = standard2poly_ellipses(a, b, theta)
+
+    x0 = centroids[1:, 0]
+    y0 = centroids[1:, 1]
+    valid = (a > 0) & (b > 0)
+    features_poly[:, 0] = np.where(valid, x0, np.nan)
+    features_poly[:, 1] = np.where(valid, y0, np.nan)
+    features_poly[:, 2] = np.where(valid, A, np.nan)
+    features_poly[:, 3] = np.where(valid, B, np.nan)
+    features_poly[:, 4] = np.where(valid, C, np.nan)
+    features_poly[:, 5] = saliency_type
+    features_standard[valid] = np.column_stack(
+        [x0, y0, a, b, angle_rad,
+         np.full(num_regions, saliency_type, dtype=float)])[valid]
+    return num_regions, features_standard, features_poly
+
 def visualize_ellipses(img, features, color=(0, 0, 255), visualize=True):
     """ Visualise ellipses in an image
 
@@ -435,12 +725,12 @@ def visualize_ellipses(img, features, color=(0, 0, 255), visualize=True):
         angle_deg = math.degrees(angle_rad)
         img_to_show = cv2.ellipse(img_to_show, (int(x), int(y)), (int(b), int(a)), int(angle_deg), 0, 360, color, 2)
        # img_to_show = cv2.ellipse(img_to_show, (int(x), int(y)), (int(a), int(b)), int(angle_deg), 0, 360, color, 2)
-    if visualize:
+    if visualization_enabled(visualize):
         show_image(img_to_show)
     return img_to_show
 
 
-def binary_mask2ellipse_features(regions, connectivity=4, min_square=False):
+def binary_mask2ellipse_features(regions, connectivity=4, min_square=False, method=None):
     """ Conversion of all types of regions to ellipse features.
 
     Parameters
@@ -452,6 +742,9 @@ def binary_mask2ellipse_features(regions, connectivity=4, min_square=False):
     min_square: bool, optional
         whether to use minimum sqrt fitting for ellipses
         (default is bounded rotated rectangle fitting)
+    method: str, optional
+        How to fit the ellipses: 'rect', 'fit' or 'moments'
+        (see `binary_mask2ellipse_features_single`)
 
 
     Returns
@@ -490,8 +783,10 @@ def binary_mask2ellipse_features(regions, connectivity=4, min_square=False):
 
     for saltype in regions.keys():
        # print "Saliency type: ", saltype
-        num_regions_s, features_standard_s, features_poly_s =  binary_mask2ellipse_features_single(regions[saltype],
-                                                connectivity=connectivity,  saliency_type=region2int[saltype], min_square=min_square)
+        with instrumentation.stage('ellipse_fitting'):
+            num_regions_s, features_standard_s, features_poly_s =  binary_mask2ellipse_features_single(regions[saltype],
+                                                    connectivity=connectivity,  saliency_type=region2int[saltype], min_square=min_square,
+                                                    method=method)
         num_regions[saltype] = num_regions_s
         # print "Number of regions for that saliency type: ", num_regions_s
         features_standard[saltype] = features_standard_s
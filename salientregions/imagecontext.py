@@ -0,0 +1,202 @@
+'''
+Facts about an image that several binarizers and detectors need, such as its
+grayscale version, histogram and Otsu level, computed once and shared.
+'''
+
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import threading
+import cv2
+import numpy as np
+from six.moves import range
+from . import componenttree
+
+
+class ImageContext(object):
+
+    """
+    An image together with the facts about it that the binarizers and
+    detectors use. Every fact is computed when it is first needed and then
+    kept, so that detectors and binarizers that are given the same context
+    (for example DMSR and MSSR on the same frame) do not compute it again.
+
+    The binarizers and detectors accept a context wherever they accept an
+    image. A context can be shared by several threads.
+
+    Parameters
+    ------
+    img: numpy array
+        grayscale or color (BGR) image; it is not copied
+
+    Attributes
+    ------
+    img: numpy array
+        The image
+    shape: tuple of ints
+        The number of rows and columns of the image
+    size: int
+        The number of pixels of the image
+    """
+
+    def __init__(self, img):
+        self.img = img
+        self.shape = (img.shape[0], img.shape[1])
+        self.size = self.shape[0] * self.shape[1]
+        self._lock = threading.RLock()
+        self._facts = {}
+        self._component_counts = {}
+
+    def _fact(self, name, compute):
+        """Get a fact, computing it the first time.
+        """
+        fact = self._facts.get(name)
+        if fact is None:
+            with self._lock:
+                fact = self._facts.get(name)
+                if fact is None:
+                    fact = self._facts[name] = compute()
+        return fact
+
+    @property
+    def gray(self):
+        """The image converted to grayscale, or the image itself if it is
+        grayscale already.
+        """
+        return self._fact('gray', self._compute_gray)
+
+    def _compute_gray(self):
+        if len(self.img.shape) == 3:
+            return cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
+        return self.img
+
+    @property
+    def histogram(self):
+        """The number of pixels of each of the 256 gray levels.
+        """
+        return self._fact('histogram', lambda: np.bincount(
+            self.gray.ravel(), minlength=256).astype(np.int64))
+
+    @property
+    def cumulative_histogram(self):
+        """The number of pixels up to and including each gray level.
+        """
+        return self._fact('cumulative_histogram',
+                          lambda: np.cumsum(self.histogram))
+
+    @property
+    def otsu_threshold(self):
+        """The threshold of Otsu's method, as `cv2.threshold` computes it.
+        """
+        return self._fact('otsu_threshold',
+                          lambda: otsu_threshold(self.histogram))
+
+    @property
+    def sorted_order(self):
+        """The flat indices of the pixels, sorted (stably) by gray level.
+        """
+        return self._fact('sorted_order', lambda: np.argsort(
+            self.gray.ravel(), kind='mergesort'))
+
+    def threshold(self, level):
+        """Threshold the grayscale image.
+
+        Parameters
+        ------
+        level: int
+            The threshold; pixels above it are foreground
+
+        Returns
+        ------
+        binarized: numpy array
+            Binary image with values 0 and 255
+        """
+        _, binarized = cv2.threshold(self.gray, level, 255,
+                                     cv2.THRESH_BINARY)
+        return binarized
+
+    def component_counts(self, min_areas, connectivity=4):
+        """For every gray level, count the connected components of the
+        thresholded image that have at least a given area (see
+        `componenttree.count_components_per_level`). The counts are kept per
+        minimum area and connectivity.
+
+        Parameters
+        ------
+        min_areas: list of floats
+            The minimum areas to count components for
+        connectivity: int, optional
+            What connectivity to use to define CCs
+
+        Returns
+        ------
+        counts: numpy array
+            Array of shape ``(len(min_areas), 256)`` with the number of
+            components per minimum area and per level
+        """
+        key = (tuple(float(area) for area in min_areas), connectivity)
+        counts = self._component_counts.get(key)
+        if counts is None:
+            with self._lock:
+                counts = self._component_counts.get(key)
+                if counts is None:
+                    counts = componenttree.count_components_per_level(
+                        self.gray, min_areas, connectivity,
+                        hist=self.histogram, order=self.sorted_order)
+                    self._component_counts[key] = counts
+        return counts
+
+
+def as_context(img):
+    """Get the context of an image.
+
+    Parameters
+    ------
+    img: numpy array or ImageContext
+        grayscale or color image, or its context
+
+    Returns
+    ------
+    context: ImageContext
+        The given context, or a new context of the image
+    """
+    if isinstance(img, ImageContext):
+        return img
+    return ImageContext(img)
+
+
+def otsu_threshold(hist):
+    """Get the threshold of Otsu's method from a histogram, as
+    `cv2.threshold` with `cv2.THRESH_OTSU` computes it.
+
+    Parameters
+    ------
+    hist: numpy array
+        The number of pixels of each of the 256 gray levels
+
+    Returns
+    ------
+    threshold: int
+        The threshold; pixels above it are foreground
+    """
+    scale = 1. / hist.sum()
+    mu = float((np.arange(256) * hist).sum()) * scale
+    epsilon = np.finfo(np.float32).eps
+    mu1 = 0.
+    q1 = 0.
+    max_sigma = 0.
+    threshold = 0
+    # The same steps as OpenCV, to get the same threshold in all cases
+    for i in range(256):
+        p_i = hist[i] * scale
+        mu1 *= q1
+        q1 += p_i
+        q2 = 1. - q1
+        if min(q1, q2) < epsilon or max(q1, q2) > 1. - epsilon:
+            continue
+        mu1 = (mu1 + i * p_i) / q1
+        mu2 = (mu - q1 * mu1) / q2
+        sigma = q1 * q2 * (mu2 - mu1) * (mu2 - mu1)
+        if sigma > max_sigma:
+            max_sigma = sigma
+            threshold = i
+    return threshold
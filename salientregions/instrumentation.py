@@ -0,0 +1,338 @@
+'''
+Instrumentation of the detectors: wall time, call counts and peak memory
+per named stage.
+'''
+
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import threading
+from timeit import default_timer as _timer
+
+# The profilers that are active in each thread
+_state = threading.local()
+# Number of active profilers in all threads; when it is 0, stages do nothing
+_num_active = 0
+_num_active_lock = threading.Lock()
+# tracemalloc traces the whole process, so only one thread at a time records
+# the peak memory: the thread, the number of its profilers that record it and
+# whether they started tracemalloc
+_memory_lock = threading.Lock()
+_memory_thread = None
+_memory_users = 0
+_memory_started = False
+
+
+class _NullStage(object):
+
+    """Stage that does nothing, used when no profiler is active.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """Get a context manager that records a stage of the detection in the
+    profilers that are active in this thread. When no profiler is active,
+    this is a shared object that does nothing, so an inactive stage costs
+    a check of a global counter and a function call.
+
+    Parameters
+    ------
+    name: str
+        The name of the stage
+
+    Returns
+    ------
+    stage: context manager
+        The stage to use in a `with` statement
+    """
+    if _num_active == 0:
+        return _NULL_STAGE
+    profilers = getattr(_state, 'profilers', None)
+    if not profilers:
+        return _NULL_STAGE
+    return _Stage(name, profilers)
+
+
+def active_profilers():
+    """Get the profilers that are active in this thread.
+
+    Returns
+    ------
+    profilers: list
+        The active profilers, the innermost last
+    """
+    return list(getattr(_state, 'profilers', []))
+
+
+class _Stage(object):
+
+    """A stage that is being recorded by the given profilers.
+    """
+
+    def __init__(self, name, profilers):
+        self.name = name
+        self.profilers = list(profilers)
+
+    def __enter__(self):
+        self.memory = any(profiler.memory for profiler in self.profilers)
+        if self.memory:
+            self.start_memory = _enter_memory_stage()
+        self.start = _timer()
+        return self
+
+    def __exit__(self, *args):
+        elapsed = _timer() - self.start
+        peak = _exit_memory_stage() - self.start_memory if self.memory \
+            else None
+        for profiler in self.profilers:
+            profiler.record(self.name, elapsed,
+                            peak if profiler.memory else None)
+        return False
+
+
+def _get_tracemalloc():
+    """Get the tracemalloc module, if it can measure the peak memory of
+    each stage.
+
+    Returns
+    ------
+    tracemalloc: module
+        The tracemalloc module
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+    # Without reset_peak, the peak of a stage would be the peak since the
+    # profiler started
+    if tracemalloc is None or not hasattr(tracemalloc, 'reset_peak'):
+        raise RuntimeError('Recording the peak memory per stage needs '
+                           'tracemalloc.reset_peak, from Python 3.9 on')
+    return tracemalloc
+
+
+def _start_memory_profiling():
+    """Start recording the peak memory in this thread, starting tracemalloc
+    for the first profiler that records it.
+    """
+    global _memory_thread, _memory_users, _memory_started
+    tracemalloc = _get_tracemalloc()
+    thread = threading.current_thread()
+    with _memory_lock:
+        if _memory_users and _memory_thread is not thread:
+            raise RuntimeError('The peak memory is already recorded in '
+                               'another thread; tracemalloc measures the '
+                               'whole process, so only one thread can '
+                               'record it at a time')
+        if _memory_users == 0:
+            _memory_thread = thread
+            _memory_started = not tracemalloc.is_tracing()
+            if _memory_started:
+                tracemalloc.start()
+        _memory_users += 1
+
+
+def _stop_memory_profiling():
+    """Stop recording the peak memory for a profiler, stopping tracemalloc
+    after the last one if it was started for them.
+    """
+    global _memory_thread, _memory_users, _memory_started
+    with _memory_lock:
+        _memory_users -= 1
+        if _memory_users == 0:
+            _memory_thread = None
+            if _memory_started:
+                import tracemalloc
+                tracemalloc.stop()
+                _memory_started = False
+
+
+def _traced_memory():
+    """Get the current and peak memory traced by tracemalloc.
+    """
+    import tracemalloc
+    return tracemalloc.get_traced_memory()
+
+
+def _enter_memory_stage():
+    """Start measuring the peak memory of a stage in this thread.
+    The peak of tracemalloc is reset, so the peak so far is kept for the
+    enclosing stage.
+    """
+    import tracemalloc
+    stack = getattr(_state, 'memory_stack', None)
+    if stack is None:
+        stack = _state.memory_stack = []
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        stack[-1] = max(stack[-1], peak)
+    tracemalloc.reset_peak()
+    stack.append(current)
+    return current
+
+
+def _exit_memory_stage():
+    """Stop measuring the peak memory of the innermost stage in this thread.
+
+    Returns
+    ------
+    peak: int
+        The peak traced memory during the stage, in bytes
+    """
+    stack = _state.memory_stack
+    peak = max(stack.pop(), _traced_memory()[1])
+    if stack:
+        stack[-1] = max(stack[-1], peak)
+    return peak
+
+
+class Profiler(object):
+
+    """
+    Records the wall time, the number of calls and (optionally) the peak
+    memory of the stages of the detection that run while it is active.
+    A profiler is active in the thread that enters it as a context manager::
+
+        with Profiler() as profiler:
+            detector.detect(img)
+        print(profiler.report())
+
+    The stages are 'grayscale', 'binarization', 'filling', 'holes_islands',
+    'tophats', 'small_elements', 'mssr_level', 'component_trees' and
+    'ellipse_fitting'. Stages can be nested, for example 'small_elements' in
+    'holes_islands', and the time of a stage includes the stages in it.
+    Stages that run in other threads than the one of the profiler, such as
+    the chunks of a parallel `MSSRDetector`, are not recorded.
+
+    The peak memory is that of the whole process, as traced by
+    `tracemalloc`, so it includes what other threads allocate during a
+    stage. Only one thread at a time can record it: entering a profiler with
+    `memory` while one is active in another thread (for example in the
+    workers of `detect_many`) raises a RuntimeError.
+
+    Parameters
+    ------
+    name: str, optional
+        The name of what is profiled, for in the report
+    memory: bool, optional
+        Whether to record the peak memory of the stages with `tracemalloc`,
+        which slows down the stages. This needs `tracemalloc.reset_peak`
+        (Python 3.9 or later); entering the profiler raises a RuntimeError
+        otherwise.
+    callback: callable, optional
+        Function that is called with the report when the profiler exits
+
+    Attributes
+    ------
+    stages: dict
+        For each stage that was recorded, a dict with the number of 'calls',
+        the total wall 'time' in seconds and the 'peak_memory' in bytes
+        above the memory at the start of the stage (None without `memory`)
+    """
+
+    def __init__(self, name=None, memory=False, callback=None):
+        self.name = name
+        self.memory = memory
+        self.callback = callback
+        self.stages = {}
+        self.time = None
+        self.peak_memory = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        global _num_active
+        if self.memory:
+            _start_memory_profiling()
+            self._start_memory = _enter_memory_stage()
+        profilers = getattr(_state, 'profilers', None)
+        if profilers is None:
+            profilers = _state.profilers = []
+        profilers.append(self)
+        with _num_active_lock:
+            _num_active += 1
+        self._start = _timer()
+        return self
+
+    def __exit__(self, *args):
+        global _num_active
+        self.time = _timer() - self._start
+        with _num_active_lock:
+            _num_active -= 1
+        _state.profilers.remove(self)
+        if self.memory:
+            self.peak_memory = _exit_memory_stage() - self._start_memory
+            _stop_memory_profiling()
+        if self.callback is not None:
+            self.callback(self.report())
+        return False
+
+    def record(self, name, elapsed, peak_memory=None):
+        """Record a call of a stage.
+
+        Parameters
+        ------
+        name: str
+            The name of the stage
+        elapsed: float
+            The wall time of the call, in seconds
+        peak_memory: int, optional
+            The peak memory of the call, in bytes
+        """
+        with self._lock:
+            record = self.stages.get(name)
+            if record is None:
+                record = self.stages[name] = {'calls': 0, 'time': 0.,
+                                              'peak_memory': None}
+            record['calls'] += 1
+            record['time'] += elapsed
+            if peak_memory is not None:
+                record['peak_memory'] = max(record['peak_memory'] or 0,
+                                            peak_memory)
+
+    def report(self):
+        """Get the report of what was recorded.
+
+        Returns
+        ------
+        report: dict
+            The 'name', the total wall 'time' and 'peak_memory' while the
+            profiler was active, and per stage in 'stages' its number of
+            'calls', 'time' and 'peak_memory'. It only contains numbers,
+            strings and dicts, so it can be serialized as JSON.
+        """
+        with self._lock:
+            stages = dict((name, dict(record))
+                          for name, record in self.stages.items())
+        return {'name': self.name, 'time': self.time,
+                'peak_memory': self.peak_memory, 'stages': stages}
+
+
+def profile_call(callback, name, memory=False):
+    """Get a profiler for a single call of a detector, which passes its
+    report to the callback, or a no-op if there is no callback.
+
+    Parameters
+    ------
+    callback: callable or None
+        Function that is called with the report of the call
+    name: str
+        The name of the call, for in the report
+    memory: bool, optional
+        Whether to record the peak memory of the stages
+
+    Returns
+    ------
+    profiler: context manager
+        The profiler to use in a `with` statement
+    """
+    if callback is None:
+        return _NULL_STAGE
+    return Profiler(name=name, memory=memory, callback=callback)
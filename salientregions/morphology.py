@@ -0,0 +1,432 @@
+'''
+Morphological operations with large structuring elements.
+'''
+
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from abc import ABCMeta, abstractmethod
+import threading
+import cv2
+import numpy as np
+import six
+from six.moves import range
+
+# Process-wide cache of structuring elements, by size
+_SE_CACHE = {}
+_SE_CACHE_LOCK = threading.Lock()
+
+
+def get_structuring_element(size):
+    """Get an elliptic structuring element of the given size.
+    The structuring elements are cached, so that every size is only created
+    once per process. The returned arrays are read-only, because they are shared.
+
+    Parameters
+    ------
+    size: int
+        The width and height of the structuring element
+
+    Returns
+    ------
+    SE: numpy array
+        The structuring element
+    """
+    SE = _SE_CACHE.get(size)
+    if SE is None:
+        with _SE_CACHE_LOCK:
+            SE = _SE_CACHE.get(size)
+            if SE is None:
+                SE = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,
+                                               (size, size))
+                SE.setflags(write=False)
+                _SE_CACHE[size] = SE
+    return SE
+
+
+class Morphology(six.with_metaclass(ABCMeta, object)):
+
+    """ Abstract class for objects that perform the morphological operations
+    of the binary detector.
+    """
+    @abstractmethod
+    def opening(self, img, SE):
+        """ Subclasses should implement this method.
+        """
+        pass
+
+    @abstractmethod
+    def closing(self, img, SE):
+        """ Subclasses should implement this method.
+        """
+        pass
+
+    def tophat(self, img, SE):
+        """Perform a white tophat: the image minus its opening.
+
+        Parameters
+        ------
+        img: numpy array
+            binary image with values 0/255
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        tophat: numpy array
+            The tophat of the image
+        """
+        return cv2.subtract(img, self.opening(img, SE))
+
+    def blackhat(self, img, SE):
+        """Perform a black tophat: the closing of the image minus the image.
+
+        Parameters
+        ------
+        img: numpy array
+            binary image with values 0/255
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        blackhat: numpy array
+            The blackhat of the image
+        """
+        return cv2.subtract(self.closing(img, SE), img)
+
+
+class OpenCVMorphology(Morphology):
+
+    """
+    Performs the morphological operations with `cv2.morphologyEx`.
+    """
+
+    def opening(self, img, SE):
+        """Perform an opening.
+
+        Parameters
+        ------
+        img: numpy array
+            binary image with values 0/255
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        opened: numpy array
+            The opening of the image
+        """
+        return cv2.morphologyEx(img, cv2.MORPH_OPEN, SE)
+
+    def closing(self, img, SE):
+        """Perform a closing.
+
+        Parameters
+        ------
+        img: numpy array
+            binary image with values 0/255
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        closed: numpy array
+            The closing of the image
+        """
+        return cv2.morphologyEx(img, cv2.MORPH_CLOSE, SE)
+
+    def tophat(self, img, SE):
+        """Perform a white tophat: the image minus its opening.
+
+        Parameters
+        ------
+        img: numpy array
+            binary image with values 0/255
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        tophat: numpy array
+            The tophat of the image
+        """
+        return cv2.morphologyEx(img, cv2.MORPH_TOPHAT, SE)
+
+    def blackhat(self, img, SE):
+        """Perform a black tophat: the closing of the image minus the image.
+
+        Parameters
+        ------
+        img: numpy array
+            binary image with values 0/255
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        blackhat: numpy array
+            The blackhat of the image
+        """
+        return cv2.morphologyEx(img, cv2.MORPH_BLACKHAT, SE)
+
+
+class DecomposedMorphology(Morphology):
+
+    """
+    Performs the morphological operations with a sequence of small
+    structuring elements instead of one large SE. The SE is replaced by an
+    octagon: a rectangle (a horizontal and a vertical line) dilated a number
+    of times with a 3x3 cross. The octagon has the same size as the SE and is
+    chosen to differ from it in as few pixels as possible; rectangles,
+    crosses and diamonds are matched exactly. The cost of the operations grows
+    linearly with the radius of the SE, instead of with its area.
+
+    The operations are exact for the octagon, also at the image border.
+
+    Parameters
+    ------
+    max_error: float, optional
+        The maximum fraction of the pixels of the SE in which the octagon
+        may differ from it. For SEs that cannot be approximated this well,
+        the SE itself is used.
+
+    Attributes
+    ------
+    errors: dict
+        For every SE that was used (by shape and content), the number of
+        pixels in which the octagon differs from it
+    """
+
+    def __init__(self, max_error=0.1):
+        self.max_error = max_error
+        self.errors = {}
+        self._decompositions = {}
+
+    def decompose(self, SE):
+        """Find the octagon that approximates the SE best.
+
+        Parameters
+        ------
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        steps: list of tuples or None
+            The sequence of ``(kernel, iterations)`` to erode or dilate
+            with, or None if the SE cannot be approximated within `max_error`
+        error: int
+            The number of pixels in which the octagon differs from the SE
+        """
+        key = (SE.shape, SE.tobytes())
+        # The steps and error are kept together, so that threads that share
+        # the backend never see one without the other
+        cached = self._decompositions.get(key)
+        if cached is not None:
+            return cached
+
+        target = SE > 0
+        vradius, hradius = SE.shape[0] // 2, SE.shape[1] // 2
+        cross = cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3))
+        best_steps, best_error = None, None
+        for ncross in range(min(vradius, hradius) + 1):
+            steps = []
+            if hradius > ncross:
+                steps.append((np.ones((1, 2 * (hradius - ncross) + 1),
+                                      dtype='uint8'), 1))
+            if vradius > ncross:
+                steps.append((np.ones((2 * (vradius - ncross) + 1, 1),
+                                      dtype='uint8'), 1))
+            if ncross > 0:
+                steps.append((cross, ncross))
+            shape = np.zeros(SE.shape, dtype='uint8')
+            shape[vradius, hradius] = 255
+            for kernel, iterations in steps:
+                shape = cv2.dilate(shape, kernel, iterations=iterations)
+            error = int(np.count_nonzero((shape > 0) != target))
+            if best_error is None or error < best_error:
+                best_steps, best_error = steps, error
+            if error == 0:
+                break
+        if best_error > self.max_error * np.count_nonzero(target):
+            best_steps = None
+        self.errors[key] = best_error
+        self._decompositions[key] = (best_steps, best_error)
+        return best_steps, best_error
+
+    def _apply(self, img, steps, operation, border, value):
+        """Erode or dilate with a sequence of kernels. The image is padded with
+        a neutral border that is large enough for all intermediate results,
+        so that the result is that of a single erosion or dilation.
+        """
+        if len(steps) == 0:
+            return img.copy()
+        padded = cv2.copyMakeBorder(img, border[0], border[0],
+                                    border[1], border[1],
+                                    cv2.BORDER_CONSTANT, value=value)
+        for kernel, iterations in steps:
+            padded = operation(padded, kernel, iterations=iterations)
+        return padded[border[0]:border[0] + img.shape[0],
+                      border[1]:border[1] + img.shape[1]]
+
+    def opening(self, img, SE):
+        """Perform an opening.
+
+        Parameters
+        ------
+        img: numpy array
+            binary image with values 0/255
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        opened: numpy array
+            The opening of the image
+        """
+        steps, _ = self.decompose(SE)
+        if steps is None:
+            return cv2.morphologyEx(img, cv2.MORPH_OPEN, SE)
+        border = (SE.shape[0] // 2, SE.shape[1] // 2)
+        eroded = self._apply(img, steps, cv2.erode, border, 255)
+        return self._apply(eroded, steps, cv2.dilate, border, 0)
+
+    def closing(self, img, SE):
+        """Perform a closing.
+
+        Parameters
+        ------
+        img: numpy array
+            binary image with values 0/255
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        closed: numpy array
+            The closing of the image
+        """
+        steps, _ = self.decompose(SE)
+        if steps is None:
+            return cv2.morphologyEx(img, cv2.MORPH_CLOSE, SE)
+        border = (SE.shape[0] // 2, SE.shape[1] // 2)
+        dilated = self._apply(img, steps, cv2.dilate, border, 0)
+        return self._apply(dilated, steps, cv2.erode, border, 255)
+
+
+class DistanceTransformMorphology(Morphology):
+
+    """
+    Performs the morphological operations with thresholds of the Euclidean
+    distance transform, so that the cost does not depend on the size of the SE.
+    The SE is replaced by the Euclidean disc ``i**2 + j**2 <= T`` that
+    differs from it in as few pixels as possible. The elliptic SEs of
+    OpenCV are not exactly such discs, but the difference is small for
+    large SEs. The operations are exact for the disc, also at the image border.
+
+    Parameters
+    ------
+    max_error: float, optional
+        The maximum fraction of the pixels of the SE in which the disc
+        may differ from it. For SEs that cannot be approximated this well,
+        the SE itself is used.
+
+    Attributes
+    ------
+    errors: dict
+        For every SE that was used (by shape and content), the number of
+        pixels in which the disc differs from it
+    """
+
+    def __init__(self, max_error=0.05):
+        self.max_error = max_error
+        self.errors = {}
+        self._discs = {}
+
+    def disc(self, SE):
+        """Find the Euclidean disc that approximates the SE best.
+
+        Parameters
+        ------
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        sqradius: int or None
+            The squared radius T of the disc, or None if the SE cannot be
+            approximated within `max_error`
+        error: int
+            The number of pixels in which the disc differs from the SE
+        """
+        key = (SE.shape, SE.tobytes())
+        # The radius and error are kept together, so that threads that share
+        # the backend never see one without the other
+        cached = self._discs.get(key)
+        if cached is not None:
+            return cached
+
+        target = SE > 0
+        vradius, hradius = SE.shape[0] // 2, SE.shape[1] // 2
+        rows, cols = np.mgrid[-vradius:vradius + 1, -hradius:hradius + 1]
+        sqdist = rows ** 2 + cols ** 2
+        best_sqradius, best_error = None, None
+        for sqradius in np.unique(sqdist):
+            error = int(np.count_nonzero((sqdist <= sqradius) != target))
+            if best_error is None or error < best_error:
+                best_sqradius, best_error = int(sqradius), error
+        if best_error > self.max_error * np.count_nonzero(target):
+            best_sqradius = None
+        self.errors[key] = best_error
+        self._discs[key] = (best_sqradius, best_error)
+        return best_sqradius, best_error
+
+    def opening(self, img, SE):
+        """Perform an opening.
+
+        Parameters
+        ------
+        img: numpy array
+            binary image with values 0/255
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        opened: numpy array
+            The opening of the image
+        """
+        sqradius, _ = self.disc(SE)
+        if sqradius is None:
+            return cv2.morphologyEx(img, cv2.MORPH_OPEN, SE)
+        # Squared distances are integers, so this separates T and T + 1
+        threshold = np.sqrt(sqradius + 0.5)
+        # A pixel stays after the erosion if all background pixels are
+        # further away than the radius (outside the image does not count)
+        dist = cv2.distanceTransform(img, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+        eroded = np.array(255 * (dist > threshold), dtype='uint8')
+        # A pixel is in the dilation if an eroded pixel is within the radius
+        dist = cv2.distanceTransform(cv2.bitwise_not(eroded), cv2.DIST_L2,
+                                     cv2.DIST_MASK_PRECISE)
+        return np.array(255 * (dist <= threshold), dtype='uint8')
+
+    def closing(self, img, SE):
+        """Perform a closing.
+
+        Parameters
+        ------
+        img: numpy array
+            binary image with values 0/255
+        SE: numpy array
+            The structuring element
+
+        Returns
+        ------
+        closed: numpy array
+            The closing of the image
+        """
+        sqradius, _ = self.disc(SE)
+        if sqradius is None:
+            return cv2.morphologyEx(img, cv2.MORPH_CLOSE, SE)
+        # The disc is symmetric, so closing is opening of the inverse image
+        return cv2.bitwise_not(self.opening(cv2.bitwise_not(img), SE))
@@ -0,0 +1,431 @@
+'''
+Spatial index over ellipse features, for region and overlap queries.
+'''
+
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import numpy as np
+from six.moves import range
+from . import helpers
+
+# Order in which the features of the saliency types are concatenated
+_REGION_TYPES = ['holes', 'islands', 'indentations', 'protrusions']
+# Number of bisection steps for the distance between two ellipses
+_BISECTION_STEPS = 60
+
+
+def _as_features(features):
+    """Get the standard ellipse features as a 2-D float array.
+    A dict is concatenated in the order of the saliency types.
+    """
+    if isinstance(features, dict):
+        blocks = [np.asarray(features[saltype], dtype=float).reshape(-1, 6)
+                  for saltype in _REGION_TYPES if saltype in features]
+        if not blocks:
+            return np.zeros((0, 6))
+        return np.vstack(blocks)
+    features = np.asarray(features, dtype=float)
+    return features.reshape(-1, features.shape[-1])
+
+
+def ellipse_matrices(features):
+    """Get the matrices of the ellipse equations from the standard features.
+
+    Parameters
+    ------
+    features: numpy array
+        Standard ellipse features, one ellipse per row, of format
+        ``x0 y0 a b angle ...``, as returned by
+        `helpers.binary_mask2ellipse_features`
+
+    Returns
+    ------
+    centers: numpy array
+        The centers of the ellipses, shape (n, 2)
+    matrices: numpy array
+        The matrices :math:`M` of the ellipses :math:`(p-c)^T M (p-c) <= 1`,
+        shape (n, 2, 2)
+    """
+    features = _as_features(features)
+    # The polynomial features use the opposite angle (see
+    # `helpers.binary_mask2ellipse_features_single`)
+    A, B, C = helpers.standard2poly_ellipses(features[:, 2], features[:, 3],
+                                             -features[:, 4])
+    matrices = np.empty((len(features), 2, 2))
+    matrices[:, 0, 0] = A
+    matrices[:, 0, 1] = B
+    matrices[:, 1, 0] = B
+    matrices[:, 1, 1] = C
+    return features[:, :2].copy(), matrices
+
+
+def ellipse_extents(features):
+    """Get the half width and half height of the axis-aligned
+    bounding boxes of ellipses.
+
+    Parameters
+    ------
+    features: numpy array
+        Standard ellipse features, one ellipse per row
+
+    Returns
+    ------
+    half_widths: numpy array
+        Half of the width of each bounding box
+    half_heights: numpy array
+        Half of the height of each bounding box
+    """
+    features = _as_features(features)
+    a = features[:, 2]
+    b = features[:, 3]
+    cos_sq = np.cos(features[:, 4]) ** 2
+    sin_sq = 1 - cos_sq
+    half_widths = np.sqrt(a * a * cos_sq + b * b * sin_sq)
+    half_heights = np.sqrt(a * a * sin_sq + b * b * cos_sq)
+    return half_widths, half_heights
+
+
+def ellipses_intersect_box(features, box):
+    """Test which ellipses intersect an axis-aligned box.
+
+    Parameters
+    ------
+    features: numpy array
+        Standard ellipse features, one ellipse per row
+    box: tuple
+        ``(xmin, ymin, xmax, ymax)``
+
+    Returns
+    ------
+    intersect: numpy array
+        For every ellipse, whether it intersects the box
+    """
+    xmin, ymin, xmax, ymax = [float(v) for v in box]
+    centers, matrices = ellipse_matrices(features)
+    inside = ((centers[:, 0] >= xmin) & (centers[:, 0] <= xmax) &
+              (centers[:, 1] >= ymin) & (centers[:, 1] <= ymax))
+    # Otherwise, the ellipse intersects the box iff it intersects an edge:
+    # minimize the quadratic form of the ellipse along each edge
+    corners = np.array([[xmin, ymin], [xmax, ymin], [xmax, ymax],
+                        [xmin, ymax]])
+    directions = np.roll(corners, -1, axis=0) - corners
+    intersect = inside
+    for corner, direction in zip(corners, directions):
+        offset = corner - centers
+        Md = np.einsum('nij,j->ni', matrices, direction)
+        dMd = np.dot(Md, direction)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(-np.einsum('ni,ni->n', offset, Md) / dMd, 0, 1)
+        t = np.where(dMd > 0, t, 0)
+        closest = offset + t[:, None] * direction
+        value = np.einsum('ni,nij,nj->n', closest, matrices, closest)
+        intersect = intersect | (value <= 1)
+    return intersect
+
+
+def ellipses_intersect(features1, features2):
+    """Test which pairs of ellipses intersect.
+
+    Parameters
+    ------
+    features1: numpy array
+        Standard ellipse features, one ellipse per row
+    features2: numpy array
+        Standard ellipse features, of as many ellipses as `features1`,
+        or of a single ellipse
+
+    Returns
+    ------
+    intersect: numpy array
+        For every row, whether the two ellipses intersect
+
+    Notes
+    ------
+    The first ellipse is mapped to the unit disc, in which the minimum of the
+    quadratic form of the second ellipse is found with `minimize_on_unit_disc`.
+    """
+    features1 = _as_features(features1)
+    features2 = _as_features(features2)
+    features1, features2 = np.broadcast_arrays(features1, features2)
+    if len(features1) == 0:
+        return np.zeros(0, dtype=bool)
+    _, matrices2 = ellipse_matrices(features2)
+
+    # Map the first ellipse to the unit disc: p = c1 + R diag(a, b) u
+    angle = -features1[:, 4]
+    cos = np.cos(angle)
+    sin = np.sin(angle)
+    L = np.empty((len(features1), 2, 2))
+    L[:, 0, 0] = cos * features1[:, 2]
+    L[:, 0, 1] = -sin * features1[:, 3]
+    L[:, 1, 0] = sin * features1[:, 2]
+    L[:, 1, 1] = cos * features1[:, 3]
+    H = np.einsum('nki,nkl,nlj->nij', L, matrices2, L)
+    # The center of the second ellipse, in the mapped coordinates
+    u0 = np.linalg.solve(L, (features2[:, :2] - features1[:, :2])[..., None])
+    _, value = minimize_on_unit_disc(H, u0[..., 0])
+    return value <= 1
+
+
+def minimize_on_unit_disc(H, u0):
+    """Minimize the quadratic forms :math:`(u-u_0)^T H (u-u_0)` over the
+    unit disc.
+
+    Parameters
+    ------
+    H: numpy array
+        Symmetric positive definite matrices, shape (n, 2, 2)
+    u0: numpy array
+        The centers of the quadratic forms, shape (n, 2)
+
+    Returns
+    ------
+    u: numpy array
+        The minimizers, shape (n, 2)
+    value: numpy array
+        The minima
+
+    Notes
+    ------
+    If the center is outside the disc, the minimizer is on the unit circle,
+    where it is found by bisection on the Lagrange multiplier.
+    """
+    h, V = np.linalg.eigh(H)
+    w0 = np.einsum('nki,nk->ni', V, u0)
+    norm_sq = np.sum(w0 * w0, axis=1)
+
+    # Find the multiplier lam for which the minimizer is on the unit circle
+    low = np.zeros(len(h))
+    high = h[:, 1] * np.sqrt(norm_sq)
+    for _ in range(_BISECTION_STEPS):
+        lam = (low + high) / 2
+        w = h * w0 / (h + lam[:, None])
+        outside = np.sum(w * w, axis=1) > 1
+        low = np.where(outside, lam, low)
+        high = np.where(outside, high, lam)
+    lam = high[:, None]
+    w = np.where((norm_sq <= 1)[:, None], w0, h * w0 / (h + lam))
+    value = np.sum(h * (w - w0) ** 2, axis=1)
+    return np.einsum('nik,nk->ni', V, w), value
+
+
+class EllipseIndex(object):
+
+    """
+    Spatial index over ellipses, for queries of the ellipses that intersect a
+    box or another ellipse, and of the ellipses with their centroid close to
+    given points. The centroids are stored in KD-trees, one for every size
+    class of the ellipses, such that the bounding boxes of the ellipses can
+    be found in sub-linear time.
+
+    Parameters
+    ------
+    features: numpy array or dict
+        Standard ellipse features, one ellipse per row, of format
+        ``x0 y0 a b angle saliency_type``, or a dict of these per saliency
+        type (as returned by `helpers.binary_mask2ellipse_features`), which
+        are concatenated in the order holes, islands, indentations,
+        protrusions.
+
+    Attributes
+    ------
+    features: numpy array
+        The features of all ellipses; the results of the queries are indices
+        of its rows. Rows that are not valid ellipses (with NaN or zero axes)
+        are never returned.
+    """
+
+    def __init__(self, features):
+        # scipy.spatial is slow to import, so only import it when it is used
+        from scipy.spatial import cKDTree
+        self.features = _as_features(features)
+        valid = np.all(np.isfinite(self.features[:, :5]), axis=1)
+        valid[valid] = ((self.features[valid, 2] > 0) &
+                        (self.features[valid, 3] > 0))
+        self._rows = np.flatnonzero(valid)
+        self.half_widths = np.zeros(len(self.features))
+        self.half_heights = np.zeros(len(self.features))
+        self.half_widths[self._rows], self.half_heights[self._rows] = \
+            ellipse_extents(self.features[self._rows])
+        centers = self.features[self._rows, :2]
+        self.tree = cKDTree(centers.reshape(-1, 2))
+
+        # Group the ellipses in size classes, of extents within a factor 2
+        extents = np.maximum(self.half_widths[self._rows],
+                             self.half_heights[self._rows])
+        size_classes = np.floor(np.log2(np.maximum(extents, 1))).astype(int)
+        self._classes = []
+        for size_class in np.unique(size_classes):
+            rows = self._rows[size_classes == size_class]
+            self._classes.append((rows, cKDTree(self.features[rows, :2]),
+                                  self.half_widths[rows].max(),
+                                  self.half_heights[rows].max()))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _box_candidates(self, box):
+        """Get the ellipses of which the bounding box intersects a box.
+        """
+        xmin, ymin, xmax, ymax = [float(v) for v in box]
+        center = [(xmin + xmax) / 2, (ymin + ymax) / 2]
+        half_width = (xmax - xmin) / 2
+        half_height = (ymax - ymin) / 2
+        candidates = []
+        for rows, tree, max_half_width, max_half_height in self._classes:
+            radius = max(half_width + max_half_width,
+                         half_height + max_half_height)
+            found = rows[tree.query_ball_point(center, radius, p=np.inf)]
+            found = found[
+                (np.abs(self.features[found, 0] - center[0]) <=
+                 half_width + self.half_widths[found]) &
+                (np.abs(self.features[found, 1] - center[1]) <=
+                 half_height + self.half_heights[found])]
+            candidates.append(found)
+        if not candidates:
+            return np.zeros(0, dtype=int)
+        return np.sort(np.concatenate(candidates))
+
+    def query_box(self, box, exact=True):
+        """Find the ellipses that intersect an axis-aligned box.
+
+        Parameters
+        ------
+        box: tuple
+            ``(xmin, ymin, xmax, ymax)``
+        exact: bool, optional
+            If False, return all ellipses of which the bounding box intersects
+            the box
+
+        Returns
+        ------
+        indices: numpy array
+            The (sorted) rows of the features of the ellipses
+        """
+        candidates = self._box_candidates(box)
+        if exact and len(candidates) > 0:
+            candidates = candidates[ellipses_intersect_box(
+                self.features[candidates], box)]
+        return candidates
+
+    def query_ellipse(self, ellipse, exact=True):
+        """Find the ellipses that intersect an ellipse.
+
+        Parameters
+        ------
+        ellipse: numpy array
+            Standard features ``x0 y0 a b angle ...`` of the ellipse
+        exact: bool, optional
+            If False, return all ellipses of which the bounding box intersects
+            the bounding box of the ellipse
+
+        Returns
+        ------
+        indices: numpy array
+            The (sorted) rows of the features of the ellipses
+        """
+        ellipse = np.asarray(ellipse, dtype=float).ravel()
+        half_widths, half_heights = ellipse_extents(ellipse[None, :6])
+        box = (ellipse[0] - half_widths[0], ellipse[1] - half_heights[0],
+               ellipse[0] + half_widths[0], ellipse[1] + half_heights[0])
+        candidates = self._box_candidates(box)
+        if exact and len(candidates) > 0:
+            candidates = candidates[ellipses_intersect(
+                self.features[candidates], ellipse[None, :])]
+        return candidates
+
+    def query_radius(self, point, distance):
+        """Find the ellipses with their centroid within a distance of a point.
+
+        Parameters
+        ------
+        point: tuple
+            ``(x, y)``
+        distance: float
+            The maximum distance between the point and the centroids
+
+        Returns
+        ------
+        indices: numpy array
+            The (sorted) rows of the features of the ellipses
+        """
+        found = self.tree.query_ball_point(point, distance)
+        return np.sort(self._rows[np.asarray(found, dtype=int)])
+
+    def intersecting_pairs(self, other, exact=True):
+        """Find all pairs of an ellipse of this index and an ellipse of
+        another index that intersect.
+
+        Parameters
+        ------
+        other: EllipseIndex
+            The index of the other ellipses
+        exact: bool, optional
+            If False, return all pairs of which the bounding boxes intersect
+
+        Returns
+        ------
+        indices: numpy array
+            The rows of the features of the ellipses in this index
+        other_indices: numpy array
+            The rows of the features of the intersecting ellipses in `other`
+        """
+        indices = [np.zeros(0, dtype=int)]
+        other_indices = [np.zeros(0, dtype=int)]
+        # Compare the centroids of every pair of size classes
+        for rows, tree, max_half_width, max_half_height in self._classes:
+            for (other_rows, other_tree, other_max_half_width,
+                 other_max_half_height) in other._classes:
+                radius = max(max_half_width + other_max_half_width,
+                             max_half_height + other_max_half_height)
+                pairs = tree.sparse_distance_matrix(
+                    other_tree, radius, p=np.inf, output_type='ndarray')
+                found = rows[pairs['i']]
+                other_found = other_rows[pairs['j']]
+                overlap = (
+                    (np.abs(self.features[found, 0] -
+                            other.features[other_found, 0]) <=
+                     self.half_widths[found] +
+                     other.half_widths[other_found]) &
+                    (np.abs(self.features[found, 1] -
+                            other.features[other_found, 1]) <=
+                     self.half_heights[found] +
+                     other.half_heights[other_found]))
+                indices.append(found[overlap])
+                other_indices.append(other_found[overlap])
+        indices = np.concatenate(indices)
+        other_indices = np.concatenate(other_indices)
+        if exact and len(indices) > 0:
+            intersect = ellipses_intersect(self.features[indices],
+                                           other.features[other_indices])
+            indices = indices[intersect]
+            other_indices = other_indices[intersect]
+        order = np.lexsort((other_indices, indices))
+        return indices[order], other_indices[order]
+
+    def candidate_matches(self, other, distance):
+        """Find all pairs of an ellipse of this index and an ellipse of
+        another index of which the centroids are within a distance.
+
+        Parameters
+        ------
+        other: EllipseIndex
+            The index of the ellipses to match with
+        distance: float
+            The maximum distance between the centroids
+
+        Returns
+        ------
+        indices: numpy array
+            The rows of the features of the ellipses in this index
+        other_indices: numpy array
+            The rows of the features of the matching ellipses in `other`
+        distances: numpy array
+            The distances between the centroids
+        """
+        pairs = self.tree.sparse_distance_matrix(other.tree, distance,
+                                                 output_type='ndarray')
+        order = np.lexsort((pairs['j'], pairs['i']))
+        pairs = pairs[order]
+        return (self._rows[pairs['i']], other._rows[pairs['j']],
+                pairs['v'].astype(float))
@@ -0,0 +1,506 @@
+'''
+Synthetic images with known salient regions, for benchmarks and regression
+tests at any image size.
+'''
+
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import cv2
+import numpy as np
+from six.moves import range
+
+# Fixed-point precision of the coordinates when drawing
+_SHIFT = 4
+_SCALE = 1 << _SHIFT
+# Maximum number of attempts to place a nested region
+_PLACEMENT_ATTEMPTS = 50
+# Length and width of the protrusions and indentations, relative to the body
+_APPENDAGE_LENGTH = (0.2, 0.3)
+_APPENDAGE_WIDTH = (0.08, 0.14)
+# Gray level of the background and the bodies, and the step per nesting level
+_BACKGROUND_LEVEL = 50
+_FOREGROUND_LEVEL = 200
+_LEVEL_STEP = 20
+
+
+def _draw_count(rng, count):
+    """Draw a number from an int or an inclusive ``(min, max)`` range.
+    """
+    if np.isscalar(count):
+        return int(count)
+    return int(rng.randint(count[0], count[1] + 1))
+
+
+def _uniform(rng, bounds):
+    """Draw a float from a ``(min, max)`` range.
+    """
+    return rng.uniform(bounds[0], bounds[1])
+
+
+class SyntheticImage(object):
+
+    """
+    Binary and grayscale image, made up of bodies with holes, islands,
+    indentations and protrusions, of which the salient regions are known.
+    The image is divided into square cells, and each cell holds at most one
+    body: a foreground disc with thin protrusions sticking out of it and thin
+    indentations cut into it. Inside a body are elliptical holes, inside
+    those holes islands, inside those islands holes again, up to the given
+    nesting depth.
+
+    Every cell is generated from its own random state, derived from the seed
+    and the position of the cell, so any part of the image can be rendered
+    on its own, and is the same as that part of the whole image. This
+    makes it possible to stream tiles of images that do not fit in memory.
+
+    The ground truth has the format of `BinaryDetector.detect`: the holes are
+    the background regions that do not touch the image border, the islands
+    the foreground regions, the protrusions the parts of the protrusions
+    outside the bodies and the indentations the parts of the indentations
+    inside the bodies. A detector only finds regions larger than its lambda,
+    and only finds the protrusions and indentations of bodies larger than its
+    `area_factor` times the image size, if its structuring element is wider
+    than them (at most 14% of the body radius). It finds them slightly
+    shorter where they meet the body.
+
+    Parameters
+    ------
+    shape: tuple of ints
+        The shape (rows, columns) of the image
+    seed: int, optional
+        The seed of the random generator
+    cell_size: int, optional
+        The size of the cells in pixels
+    fill: float, optional
+        The fraction of the cells that holds a body
+    body_size: tuple of floats, optional
+        The range of the radius of the bodies, relative to half the cell size
+    num_holes: int or tuple of ints, optional
+        The number of holes in a body (or in a nested island), or the range
+        ``(min, max)`` to draw it from. Regions that do not fit in the
+        region around them are left out.
+    num_islands: int or tuple of ints, optional
+        The number of islands in a hole, or the range to draw it from
+    nesting: int, optional
+        The number of levels of holes and islands in a body: 1 for only holes,
+        2 for islands in the holes, 3 for holes in those islands, and so on
+    region_size: tuple of floats, optional
+        The range of the major axis of the nested holes and islands, relative
+        to the radius of the region they are in
+    num_indentations: int or tuple of ints, optional
+        The number of indentations of a body, or the range to draw it from
+    num_protrusions: int or tuple of ints, optional
+        The number of protrusions of a body, or the range to draw it from
+    noise: float, optional
+        The amplitude of the uniform noise on the grayscale image
+
+    Note
+    ------
+    The grayscale image has gray level 50 for the background and 200 for the
+    bodies, each nested level being 20 lighter (holes) or darker (islands)
+    than the one of the same kind around it. With up to four nesting levels
+    and a noise of at most 30, thresholding it at 128 gives the binary image.
+    """
+
+    def __init__(self, shape, seed=0, cell_size=256, fill=1.,
+                 body_size=(0.45, 0.6), num_holes=(1, 3), num_islands=(0, 2),
+                 nesting=2, region_size=(0.2, 0.4), num_indentations=(0, 2),
+                 num_protrusions=(0, 2), noise=20.):
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.seed = seed
+        self.cell_size = int(cell_size)
+        self.fill = fill
+        self.body_size = body_size
+        self.num_holes = num_holes
+        self.num_islands = num_islands
+        self.nesting = nesting
+        self.region_size = region_size
+        self.num_indentations = num_indentations
+        self.num_protrusions = num_protrusions
+        self.noise = noise
+        self.grid_shape = (self.shape[0] // self.cell_size,
+                           self.shape[1] // self.cell_size)
+
+    def _full_box(self, box):
+        """Get the box of the whole image if no box is given.
+        """
+        if box is None:
+            return (slice(0, self.shape[0]), slice(0, self.shape[1]))
+        return box
+
+    def _random_state(self, row, col):
+        """Get the random state of a cell, from the seed and its position.
+        """
+        return np.random.RandomState([self.seed & 0xffffffff, row, col])
+
+    def body(self, row, col):
+        """Generate the body in a cell.
+
+        Parameters
+        ------
+        row: int
+            The row of the cell in the grid
+        col: int
+            The column of the cell in the grid
+
+        Returns
+        ------
+        body: dict or None
+            The 'cell' ``(row, col)``, the 'center' ``(x, y)`` and 'radius'
+            of the body, the polygons (arrays of ``(x, y)`` points) of its
+            'protrusions' and 'indentations', and its 'regions': the nested
+            holes and islands, as tuples ``(center, axes, angle, depth)``
+            with the angle in degrees and the depth 2 for holes in the body,
+            3 for islands in those, and so on. None if the cell is empty.
+        """
+        rng = self._random_state(row, col)
+        if rng.uniform() >= self.fill:
+            return None
+        half = self.cell_size / 2.
+        radius = _uniform(rng, self.body_size) * half
+        if radius < 2:
+            return None
+        # Place the center such that the body with its protrusions
+        # stays within the cell
+        reach = radius * (1 + _APPENDAGE_LENGTH[1])
+        jitter = max(half - reach - 2, 0)
+        center = (col * self.cell_size + half + rng.uniform(-jitter, jitter),
+                  row * self.cell_size + half + rng.uniform(-jitter, jitter))
+
+        # Protrusions and indentations, at spread out angles
+        nprot = _draw_count(rng, self.num_protrusions)
+        nind = _draw_count(rng, self.num_indentations)
+        kinds = ['protrusions'] * nprot + ['indentations'] * nind
+        rng.shuffle(kinds)
+        body = {'cell': (row, col), 'center': center, 'radius': radius,
+                'protrusions': [], 'indentations': [], 'regions': []}
+        start = rng.uniform(0, 2 * np.pi)
+        for i, kind in enumerate(kinds):
+            angle = start + 2 * np.pi * (i + rng.uniform(0.3, 0.7)) \
+                / len(kinds)
+            length = _uniform(rng, _APPENDAGE_LENGTH) * radius
+            width = _uniform(rng, _APPENDAGE_WIDTH) * radius
+            if kind == 'protrusions':
+                inner, outer = radius - width, radius + length
+            else:
+                inner, outer = radius - length, radius + width
+            body[kind].append(_bar(center, angle, inner, outer, width))
+
+        # Nested holes and islands, away from the indentations
+        inner_radius = radius * (1 - _APPENDAGE_LENGTH[1]) if nind > 0 \
+            else radius
+        self._nest(rng, body['regions'], center, inner_radius - 2, 2)
+        return body
+
+    def _nest(self, rng, regions, center, radius, depth):
+        """Place the regions of a nesting level within a circle.
+        """
+        if depth > self.nesting + 1:
+            return
+        count = _draw_count(rng, self.num_holes if depth % 2 == 0
+                            else self.num_islands)
+        gap = 0.05 * radius + 2
+        # Keep several regions away from the center, to leave room for all
+        inner = 0.25 if count > 1 else 0.
+        placed = []
+        for _ in range(count):
+            major = _uniform(rng, self.region_size) * radius
+            minor = major * rng.uniform(0.6, 1.)
+            if minor < 2:
+                continue
+            for _ in range(_PLACEMENT_ATTEMPTS):
+                distance = (radius - major - gap) * np.sqrt(
+                    rng.uniform(inner, 1))
+                if distance < 0:
+                    break
+                phi = rng.uniform(0, 2 * np.pi)
+                point = (center[0] + distance * np.cos(phi),
+                         center[1] + distance * np.sin(phi))
+                if all(np.hypot(point[0] - p[0], point[1] - p[1])
+                       >= major + r + gap for p, r in placed):
+                    placed.append((point, major))
+                    regions.append((point, (major, minor),
+                                    rng.uniform(0, 180), depth))
+                    self._nest(rng, regions, point, minor - 2, depth + 1)
+                    break
+
+    def bodies(self, box=None):
+        """Generate the bodies in the cells that overlap a box.
+
+        Parameters
+        ------
+        box: tuple of slices, optional
+            The box (rows, columns) in the image, by default the whole image
+
+        Returns
+        ------
+        bodies: list of dicts
+            The bodies, as returned by `body`
+        """
+        rows, cols = self._full_box(box)
+        first_row = rows.start // self.cell_size
+        last_row = min(-(-rows.stop // self.cell_size), self.grid_shape[0])
+        first_col = cols.start // self.cell_size
+        last_col = min(-(-cols.stop // self.cell_size), self.grid_shape[1])
+        bodies = []
+        for row in range(first_row, last_row):
+            for col in range(first_col, last_col):
+                body = self.body(row, col)
+                if body is not None:
+                    bodies.append(body)
+        return bodies
+
+    def _render(self, box, ground_truth):
+        """Render the nesting depth of every pixel in a box and, optionally,
+        the masks of the bodies and of their protrusions and indentations.
+        Every body is drawn in its own cell and copied into the box, so that
+        a pixel does not depend on the box it is rendered in.
+        """
+        rows, cols = box
+        shape = (rows.stop - rows.start, cols.stop - cols.start)
+        depth = np.zeros(shape, dtype='uint8')
+        bodymask = appendages = None
+        if ground_truth:
+            bodymask = np.zeros(shape, dtype='uint8')
+            appendages = {'protrusions': np.zeros(shape, dtype='uint8'),
+                          'indentations': np.zeros(shape, dtype='uint8')}
+        for body in self.bodies(box):
+            row, col = body['cell']
+            top, left = row * self.cell_size, col * self.cell_size
+            # The part of the cell within the box
+            top_in, left_in = max(top, rows.start), max(left, cols.start)
+            bottom_in = min(top + self.cell_size, rows.stop)
+            right_in = min(left + self.cell_size, cols.stop)
+            target = (slice(top_in - rows.start, bottom_in - rows.start),
+                      slice(left_in - cols.start, right_in - cols.start))
+            source = (slice(top_in - top, bottom_in - top),
+                      slice(left_in - left, right_in - left))
+            cell = self._render_body(body, (left, top), ground_truth)
+            depth[target] = cell[0][source]
+            if ground_truth:
+                bodymask[target] = cell[1][source]
+                for kind in appendages:
+                    appendages[kind][target] = cell[2][kind][source]
+        return depth, bodymask, appendages
+
+    def _render_body(self, body, origin, ground_truth):
+        """Render a body in its cell, with the top left corner at `origin`.
+        """
+        shape = (self.cell_size, self.cell_size)
+        depth = np.zeros(shape, dtype='uint8')
+        center = _fixed(body['center'], origin)
+        radius = int(round(body['radius'] * _SCALE))
+        cv2.circle(depth, center, radius, 1, -1, cv2.LINE_8, _SHIFT)
+        appendages = {}
+        for kind, value in (('protrusions', 1), ('indentations', 0)):
+            appendages[kind] = np.zeros(shape, dtype='uint8') \
+                if ground_truth else None
+            polygons = [_fixed_polygon(polygon, origin)
+                        for polygon in body[kind]]
+            if polygons:
+                cv2.fillPoly(depth, polygons, value, cv2.LINE_8, _SHIFT)
+                if ground_truth:
+                    cv2.fillPoly(appendages[kind], polygons, 255,
+                                 cv2.LINE_8, _SHIFT)
+        bodymask = None
+        if ground_truth:
+            bodymask = np.zeros(shape, dtype='uint8')
+            cv2.circle(bodymask, center, radius, 255, -1, cv2.LINE_8, _SHIFT)
+        for point, axes, angle, level in body['regions']:
+            cv2.ellipse(depth, _fixed(point, origin),
+                        (int(round(axes[0] * _SCALE)),
+                         int(round(axes[1] * _SCALE))),
+                        angle, 0, 360, level, -1, cv2.LINE_8, _SHIFT)
+        return depth, bodymask, appendages
+
+    def binary(self, box=None):
+        """Render the binary image.
+
+        Parameters
+        ------
+        box: tuple of slices, optional
+            The box (rows, columns) to render, by default the whole image
+
+        Returns
+        ------
+        img: 2-dimensional numpy array with values 0/255
+            The binary image within the box
+        """
+        depth, _, _ = self._render(self._full_box(box), False)
+        return _binary_from_depth(depth)
+
+    def grayscale(self, box=None):
+        """Render the grayscale image.
+
+        Parameters
+        ------
+        box: tuple of slices, optional
+            The box (rows, columns) to render, by default the whole image
+
+        Returns
+        ------
+        img: 2-dimensional numpy array of type uint8
+            The grayscale image within the box
+        """
+        box = self._full_box(box)
+        depth, _, _ = self._render(box, False)
+        return self._grayscale_from_depth(depth, box)
+
+    def ground_truth(self, box=None):
+        """Render the masks of the salient regions.
+
+        Parameters
+        ------
+        box: tuple of slices, optional
+            The box (rows, columns) to render, by default the whole image
+
+        Returns
+        ------
+        regions: dict
+            For each type of region, the mask of the regions within the box,
+            as returned by `BinaryDetector.detect`
+        """
+        depth, bodymask, appendages = self._render(self._full_box(box), True)
+        return _regions_from_depth(depth, bodymask, appendages)
+
+    def tiles(self, tile_shape=(1024, 1024), grayscale=False,
+              ground_truth=False):
+        """Render the image tile by tile, row by row, so that only one tile
+        is in memory at a time.
+
+        Parameters
+        ------
+        tile_shape: tuple of ints, optional
+            The shape (rows, columns) of the tiles; the tiles at the bottom
+            and right edges can be smaller
+        grayscale: bool, optional
+            Whether to render the grayscale image instead of the binary image
+        ground_truth: bool, optional
+            Whether to also render the masks of the salient regions
+
+        Returns
+        ------
+        tiles: generator
+            For every tile ``(box, img, regions)``, with the box (rows,
+            columns) of the tile in the image, the tile of the image and the
+            masks of the salient regions in the tile (None without
+            `ground_truth`)
+        """
+        for top in range(0, self.shape[0], tile_shape[0]):
+            for left in range(0, self.shape[1], tile_shape[1]):
+                box = (slice(top, min(top + tile_shape[0], self.shape[0])),
+                       slice(left, min(left + tile_shape[1], self.shape[1])))
+                depth, bodymask, appendages = self._render(box, ground_truth)
+                if grayscale:
+                    img = self._grayscale_from_depth(depth, box)
+                else:
+                    img = _binary_from_depth(depth)
+                regions = _regions_from_depth(depth, bodymask, appendages) \
+                    if ground_truth else None
+                yield box, img, regions
+
+    def _grayscale_from_depth(self, depth, box):
+        """Get the grayscale image from the nesting depths, with noise that
+        only depends on the position of a pixel in the whole image.
+        """
+        levels = np.arange(256)
+        lut = np.where(levels % 2 == 1,
+                       _FOREGROUND_LEVEL - _LEVEL_STEP * (levels // 2),
+                       _BACKGROUND_LEVEL + _LEVEL_STEP * (levels // 2))
+        gray = lut[depth].astype(float)
+        if self.noise > 0:
+            gray += self.noise * (2 * _pixel_noise(self.seed, box) - 1)
+        return np.clip(np.round(gray), 0, 255).astype('uint8')
+
+
+def _bar(center, angle, inner, outer, width):
+    """Get the polygon of a bar along a ray from the center of a body,
+    between two distances from the center.
+    """
+    direction = np.array([np.cos(angle), np.sin(angle)])
+    normal = np.array([-direction[1], direction[0]]) * width / 2.
+    start = np.array(center) + inner * direction
+    end = np.array(center) + outer * direction
+    return np.array([start - normal, end - normal, end + normal,
+                     start + normal])
+
+
+def _fixed(point, origin):
+    """Convert a point to fixed-point coordinates relative to an origin.
+    """
+    return (int(round(point[0] * _SCALE)) - origin[0] * _SCALE,
+            int(round(point[1] * _SCALE)) - origin[1] * _SCALE)
+
+
+def _fixed_polygon(polygon, origin):
+    """Convert a polygon to fixed-point coordinates relative to an origin.
+    """
+    points = np.round(np.asarray(polygon) * _SCALE).astype(np.int32)
+    return points - np.array(origin, dtype=np.int32) * _SCALE
+
+
+def _binary_from_depth(depth):
+    """Get the binary image from the nesting depths: the odd depths
+    are foreground.
+    """
+    return ((depth & 1) * 255).astype('uint8')
+
+
+def _regions_from_depth(depth, bodymask, appendages):
+    """Get the masks of the salient regions from the nesting depths and the
+    masks of the bodies and their protrusions and indentations.
+    """
+    holes = np.where((depth > 0) & (depth % 2 == 0), 255, 0).astype('uint8')
+    return {'holes': holes,
+            'islands': _binary_from_depth(depth),
+            'indentations': cv2.bitwise_and(appendages['indentations'],
+                                            bodymask),
+            'protrusions': cv2.bitwise_and(appendages['protrusions'],
+                                           cv2.bitwise_not(bodymask))}
+
+
+def _pixel_noise(seed, box):
+    """Get uniform noise in [0, 1) for the pixels in a box, from a hash of
+    the seed and the position of every pixel in the image.
+    """
+    rows = np.arange(box[0].start, box[0].stop, dtype=np.uint64)[:, None]
+    cols = np.arange(box[1].start, box[1].stop, dtype=np.uint64)[None, :]
+    h = rows * np.uint64(0x9E3779B97F4A7C15) \
+        ^ (cols + np.uint64(seed & 0xffffffff)) * np.uint64(0xC2B2AE3D27D4EB4F)
+    h ^= h >> np.uint64(31)
+    h *= np.uint64(0xBF58476D1CE4E5B9)
+    h ^= h >> np.uint64(29)
+    h *= np.uint64(0x94D049BB133111EB)
+    h ^= h >> np.uint64(32)
+    return (h >> np.uint64(11)).astype(float) / float(1 << 53)
+
+
+def generate(shape, seed=0, **kwargs):
+    """Generate a synthetic binary and grayscale image with the masks of its
+    salient regions.
+
+    Parameters
+    ------
+    shape: tuple of ints
+        The shape (rows, columns) of the image
+    seed: int, optional
+        The seed of the random generator
+    **kwargs:
+        The other parameters of `SyntheticImage`
+
+    Returns
+    ------
+    binary: 2-dimensional numpy array with values 0/255
+        The binary image
+    grayscale: 2-dimensional numpy array of type uint8
+        The grayscale image
+    regions: dict
+        For each type of region, the mask of the regions, as returned by
+        `BinaryDetector.detect`
+    """
+    synthetic = SyntheticImage(shape, seed=seed, **kwargs)
+    box = synthetic._full_box(None)
+    depth, bodymask, appendages = synthetic._render(box, True)
+    return (_binary_from_depth(depth),
+            synthetic._grayscale_from_depth(depth, box),
+            _regions_from_depth(depth, bodymask, appendages))
@@ -0,0 +1,751 @@
+'''
+Tiled detection of salient regions in images that do not fit in memory.
+The image is read tile by tile; connected components that cross tile borders
+are merged with a union-find over the seams, and the morphological operations
+are computed on tiles with a halo, so the results are identical to those of
+the detection on the whole image.
+'''
+
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from collections import OrderedDict
+import cv2
+import numpy as np
+from six.moves import range
+from . import binarization
+from .binarydetector import _morphology_margin
+from .detectors import SalientDetector
+from .imagecontext import otsu_threshold
+from .morphology import OpenCVMorphology
+
+
+def _read(img, box):
+    """Read a box of an image (any object with a shape that can be sliced,
+    such as a numpy array or memory map) as a numpy array.
+    """
+    return np.asarray(img[box])
+
+
+def _intersect(box1, box2):
+    """Get the intersection of two boxes, or None if they do not intersect.
+    """
+    top = max(box1[0].start, box2[0].start)
+    bottom = min(box1[0].stop, box2[0].stop)
+    left = max(box1[1].start, box2[1].start)
+    right = min(box1[1].stop, box2[1].stop)
+    if top >= bottom or left >= right:
+        return None
+    return slice(top, bottom), slice(left, right)
+
+
+def _relative(box, origin):
+    """Get a box relative to the top left corner of another box.
+    """
+    return (slice(box[0].start - origin[0].start,
+                  box[0].stop - origin[0].start),
+            slice(box[1].start - origin[1].start,
+                  box[1].stop - origin[1].start))
+
+
+def _shifted(box, origin):
+    """Get the box in the image of a box relative to the top left corner of
+    another box; the inverse of `_relative`.
+    """
+    return (slice(box[0].start + origin[0].start,
+                  box[0].stop + origin[0].start),
+            slice(box[1].start + origin[1].start,
+                  box[1].stop + origin[1].start))
+
+
+def _grown(box, margin, shape):
+    """Grow a box by a margin, clipped to an image.
+    """
+    return (slice(max(box[0].start - margin[0], 0),
+                  min(box[0].stop + margin[0], shape[0])),
+            slice(max(box[1].start - margin[1], 0),
+                  min(box[1].stop + margin[1], shape[1])))
+
+
+class TiledLabeling(object):
+
+    """
+    Connected components of a binary image that is given tile by tile.
+    Every tile is labeled on its own, and the labels that touch across
+    the seams between the tiles are merged with a union-find. Only one row
+    of pixels along the seams is kept while labeling; the labels of a tile
+    are computed again from its mask when they are needed.
+
+    Parameters
+    ------
+    shape: tuple of ints
+        The shape (rows, columns) of the image
+    mask: callable
+        Function that takes a box (a tuple of slices) within the image and
+        returns the binary mask of that box; it should give the same mask
+        every time it is called for the same tile
+    tile_shape: tuple of ints, optional
+        The shape of the tiles
+    connectivity: int, optional
+        What connectivity to use to define CCs
+    cache_size: int, optional
+        The number of tiles of labels to keep in memory for `crop`
+
+    Attributes
+    ------
+    num_components: int
+        The number of connected components
+    area: numpy array
+        For every component (index 1 and up), its area
+    bbox: numpy array
+        For every component, its bounding box ``top, left, bottom, right``,
+        with the bottom and right exclusive
+    touches_border: numpy array
+        For every component, whether it touches the border of the image
+    """
+
+    def __init__(self, shape, mask, tile_shape=(1024, 1024), connectivity=4,
+                 cache_size=None):
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.mask = mask
+        self.tile_shape = (int(tile_shape[0]), int(tile_shape[1]))
+        self.connectivity = connectivity
+        self.grid_shape = (-(-self.shape[0] // self.tile_shape[0]),
+                           -(-self.shape[1] // self.tile_shape[1]))
+        if cache_size is None:
+            cache_size = 3 * self.grid_shape[1] + 1
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._offsets = {}
+        self._label()
+
+    def tile_box(self, row, col):
+        """Get the box of a tile.
+
+        Parameters
+        ------
+        row: int
+            The row of the tile in the grid
+        col: int
+            The column of the tile in the grid
+
+        Returns
+        ------
+        box: tuple of slices
+            The box of the tile in the image
+        """
+        top, left = row * self.tile_shape[0], col * self.tile_shape[1]
+        return (slice(top, min(top + self.tile_shape[0], self.shape[0])),
+                slice(left, min(left + self.tile_shape[1], self.shape[1])))
+
+    def _local_labels(self, row, col):
+        """Label the mask of a tile on its own.
+        """
+        mask = np.asarray(self.mask(self.tile_box(row, col)))
+        mask = np.where(mask > 0, 255, 0).astype('uint8')
+        return cv2.connectedComponentsWithStats(
+            mask, connectivity=self.connectivity, ltype=cv2.CV_32S)
+
+    def _label(self):
+        """Label all tiles, row by row, and merge the labels across the seams.
+        """
+        first = []
+        second = []
+        stats = [np.zeros((1, 5), dtype=np.int64)]
+        next_id = 1
+        above = np.zeros(self.shape[1], dtype=np.int64)
+        for row in range(self.grid_shape[0]):
+            new_above = np.zeros(self.shape[1], dtype=np.int64)
+            left_column = None
+            for col in range(self.grid_shape[1]):
+                rows, cols = self.tile_box(row, col)
+                nlabels, labels, tilestats, _ = self._local_labels(row, col)
+                self._offsets[(row, col)] = (next_id - 1, nlabels)
+                ids = np.where(labels > 0, labels + (next_id - 1), 0)
+                tilestats = tilestats[1:].astype(np.int64)
+                tilestats[:, cv2.CC_STAT_LEFT] += cols.start
+                tilestats[:, cv2.CC_STAT_TOP] += rows.start
+                stats.append(tilestats)
+                next_id += nlabels - 1
+
+                # Pairs of labels that touch across the seams
+                if row > 0:
+                    self._seam_pairs(above, ids[0], cols.start, first, second)
+                if left_column is not None:
+                    self._seam_pairs(left_column, ids[:, 0], 0, first,
+                                     second)
+                left_column = ids[:, -1].copy()
+                new_above[cols] = ids[-1]
+            above = new_above
+
+        stats = np.vstack(stats)
+        self._merge(next_id, first, second, stats)
+
+    def _seam_pairs(self, before, after, start, first, second):
+        """Collect the pairs of labels that touch across a seam.
+
+        Parameters
+        ------
+        before: numpy array
+            The labels of the pixels on the one side of the seam
+        after: numpy array
+            The labels of the pixels on the other side of the seam, which
+            are next to ``before[start:start + len(after)]``
+        start: int
+            The position of the first pixel of `after` in `before`
+        first: list
+            The list to append the labels on the one side to
+        second: list
+            The list to append the labels on the other side to
+        """
+        shifts = [0] if self.connectivity == 4 else [-1, 0, 1]
+        positions = np.arange(len(after))
+        for shift in shifts:
+            neighbour = positions + start + shift
+            valid = (neighbour >= 0) & (neighbour < len(before))
+            a = after[valid]
+            b = before[neighbour[valid]]
+            touching = (a > 0) & (b > 0)
+            first.append(a[touching])
+            second.append(b[touching])
+
+    def _merge(self, num_ids, first, second, stats):
+        """Merge the labels of all tiles into components and compute the
+        statistics of the components.
+        """
+        # scipy.sparse is slow to import, so only import it when it is used
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+
+        first = np.concatenate(first) if first else np.zeros(0, np.int64)
+        second = np.concatenate(second) if second else np.zeros(0, np.int64)
+        graph = coo_matrix((np.ones(len(first), dtype=bool), (first, second)),
+                           shape=(num_ids, num_ids))
+        _, groups = connected_components(graph, directed=False)
+        # Number the components from 1, in the order of their first label
+        _, first_ids, components = np.unique(groups[1:], return_index=True,
+                                             return_inverse=True)
+        order = np.argsort(np.argsort(first_ids))
+        components = order[components].astype(np.int64) + 1
+        self._components = np.concatenate([[0], components])
+        self.num_components = len(first_ids)
+
+        n = self.num_components + 1
+        ids = self._components[1:]
+        self.area = np.bincount(ids, weights=stats[1:, cv2.CC_STAT_AREA],
+                                minlength=n).astype(np.int64)
+        top = stats[1:, cv2.CC_STAT_TOP]
+        left = stats[1:, cv2.CC_STAT_LEFT]
+        bottom = top + stats[1:, cv2.CC_STAT_HEIGHT]
+        right = left + stats[1:, cv2.CC_STAT_WIDTH]
+        self.bbox = np.zeros((n, 4), dtype=np.int64)
+        self.bbox[:, 0] = self.shape[0]
+        self.bbox[:, 1] = self.shape[1]
+        np.minimum.at(self.bbox[:, 0], ids, top)
+        np.minimum.at(self.bbox[:, 1], ids, left)
+        np.maximum.at(self.bbox[:, 2], ids, bottom)
+        np.maximum.at(self.bbox[:, 3], ids, right)
+        self.touches_border = (self.bbox[:, 0] <= 0) \
+            | (self.bbox[:, 1] <= 0) | (self.bbox[:, 2] >= self.shape[0]) \
+            | (self.bbox[:, 3] >= self.shape[1])
+        self.touches_border[0] = False
+
+    def labels(self, row, col):
+        """Get the component of every pixel of a tile.
+
+        Parameters
+        ------
+        row: int
+            The row of the tile in the grid
+        col: int
+            The column of the tile in the grid
+
+        Returns
+        ------
+        labels: numpy array
+            For every pixel of the tile the component (from 1) it belongs
+            to, or 0 for the background
+        """
+        key = (row, col)
+        labels = self._cache.get(key)
+        if labels is not None:
+            # Mark the tile as recently used
+            self._cache[key] = self._cache.pop(key)
+            return labels
+        nlabels, local, _, _ = self._local_labels(row, col)
+        offset, expected = self._offsets[key]
+        if nlabels != expected:
+            raise ValueError('The mask of tile %s changed since labeling'
+                             % (key,))
+        lut = np.concatenate([[0], self._components[offset + 1:
+                                                    offset + nlabels]])
+        labels = lut.astype(np.int32)[local]
+        if self.cache_size > 0:
+            self._cache[key] = labels
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return labels
+
+    def crop(self, box):
+        """Get the component of every pixel in a box.
+
+        Parameters
+        ------
+        box: tuple of slices
+            The box within the image
+
+        Returns
+        ------
+        labels: numpy array
+            For every pixel of the box the component it belongs to, or 0
+        """
+        rows, cols = box
+        result = np.zeros((rows.stop - rows.start, cols.stop - cols.start),
+                          dtype=np.int32)
+        for row in range(rows.start // self.tile_shape[0],
+                         -(-rows.stop // self.tile_shape[0])):
+            for col in range(cols.start // self.tile_shape[1],
+                             -(-cols.stop // self.tile_shape[1])):
+                tile = self.tile_box(row, col)
+                part = _intersect(tile, box)
+                result[_relative(part, box)] = \
+                    self.labels(row, col)[_relative(part, tile)]
+        return result
+
+    def clear_cache(self):
+        """Release the labels of the tiles that are kept in memory.
+        """
+        self._cache.clear()
+
+
+class TiledBinaryDetector(object):
+
+    """
+    Find the salient regions of a binary image tile by tile, with the same
+    result as `BinaryDetector`. The image can be anything with a shape that
+    can be sliced, such as a numpy array, `numpy.memmap` or HDF5 dataset,
+    and the regions can be written to such arrays, so the image and the
+    regions never have to be in memory at once.
+
+    The connected components are labeled per tile and merged across the
+    seams (see `TiledLabeling`). The tophats and blackhats are computed on
+    the tiles with a halo of twice the radius of the SE, which is all the
+    context that they depend on. Filling a significant hole or island needs
+    one extra labeling of its bounding box.
+
+    Parameters
+    ------
+    SE: numpy array
+        The structuring element to use in processing the image
+    lam: float
+        lambda, minimumm area of a connected component
+    area_factor: float
+        factor that describes the minimum area of a significent CC
+    connectivity: int
+        What connectivity to use to define CCs
+    tile_shape: tuple of ints, optional
+        The shape of the tiles
+    morphology: Morphology object, optional
+        Morphology object that performs the tophat and blackhat.
+        By default, we use `cv2.morphologyEx`
+
+    Note
+    ------
+    The image is read several times: once per labeling, of which there are up
+    to four per polarity (the CCs, the filled image and the two kinds of
+    protrusions), and once more to write the regions. Besides one tile of the
+    regions, the memory use is a few rows of tiles of labels per labeling,
+    and a label lookup table with one entry per component per tile.
+    """
+
+    def __init__(self, SE, lam, area_factor, connectivity,
+                 tile_shape=(1024, 1024), morphology=None):
+        self.SE = SE
+        self.lam = lam
+        self.area_factor = area_factor
+        self.connectivity = connectivity
+        self.tile_shape = (int(tile_shape[0]), int(tile_shape[1]))
+        if morphology is None:
+            morphology = OpenCVMorphology()
+        self.morphology = morphology
+
+    def detect(self, img, find_holes=True, find_islands=True,
+               find_indentations=True, find_protrusions=True, out=None):
+        """Find salient regions of the types specified.
+
+        Parameters
+        ------
+        img: array-like
+            binary image to detect regions, with values 0/255
+        find_holes: bool, optional
+            Whether to detect regions of type hole
+        find_islands: bool, optional
+            Whether to detect regions of type island
+        find_indentations: bool, optional
+            Whether to detect regions of type indentation
+        find_protrusions: bool, optional
+            Whether to detect regions of type protrusion
+        out: dict, optional
+            For each type of region, the array (for example a
+            `numpy.memmap`) to write the mask to. By default, numpy arrays
+            are created.
+
+        Returns
+        ------
+        regions: dict
+            For each type of region, the mask with detected regions.
+        """
+        types = [saltype for saltype, find in
+                 (('holes', find_holes), ('islands', find_islands),
+                  ('indentations', find_indentations),
+                  ('protrusions', find_protrusions)) if find]
+        if out is None:
+            out = {}
+        regions = {}
+        for saltype in types:
+            regions[saltype] = out.get(saltype)
+            if regions[saltype] is None:
+                regions[saltype] = np.zeros(img.shape[:2], dtype='uint8')
+        for box, tile_regions in self.detect_tiles(
+                img, find_holes, find_islands, find_indentations,
+                find_protrusions):
+            for saltype in types:
+                regions[saltype][box] = tile_regions[saltype]
+        return regions
+
+    def detect_tiles(self, img, find_holes=True, find_islands=True,
+                     find_indentations=True, find_protrusions=True):
+        """Find salient regions of the types specified, and generate them
+        tile by tile.
+
+        Parameters
+        ------
+        img: array-like
+            binary image to detect regions, with values 0/255
+        find_holes: bool, optional
+            Whether to detect regions of type hole
+        find_islands: bool, optional
+            Whether to detect regions of type island
+        find_indentations: bool, optional
+            Whether to detect regions of type indentation
+        find_protrusions: bool, optional
+            Whether to detect regions of type protrusion
+
+        Returns
+        ------
+        tiles: generator
+            For every tile, row by row, ``(box, regions)``: the box of the
+            tile in the image and for each type of region the mask of the
+            detected regions in the tile
+        """
+        shape = (img.shape[0], img.shape[1])
+        foreground = _Polarity(self, img, shape, True)
+        background = _Polarity(self, img, shape, False)
+        # The holes are the background CCs that do not touch the border,
+        # and the islands the foreground CCs.
+        if find_protrusions:
+            foreground.prepare_protrusions(background)
+        if find_indentations:
+            background.prepare_protrusions(foreground)
+
+        grid = background.cc.grid_shape
+        for row in range(grid[0]):
+            for col in range(grid[1]):
+                box = background.cc.tile_box(row, col)
+                regions = {}
+                if find_holes:
+                    regions['holes'] = background.holes(row, col)
+                if find_islands:
+                    regions['islands'] = foreground.holes(row, col)
+                if find_indentations:
+                    regions['indentations'] = background.protrusions(box)
+                if find_protrusions:
+                    regions['protrusions'] = foreground.protrusions(box)
+                yield box, regions
+
+
+class _Polarity(object):
+
+    """
+    The labelings of one polarity of a binary image: its CCs of either the
+    foreground or the background, and for the protrusions of the foreground
+    (or the indentations of the background) the filled image and the
+    protrusions of the significant CCs and holes.
+    """
+
+    def __init__(self, detector, img, shape, foreground):
+        self.detector = detector
+        self.img = img
+        self.shape = shape
+        self.foreground = foreground
+        self.margin = _morphology_margin(detector.SE)
+        self.min_area = detector.area_factor * shape[0] * shape[1]
+        tile_shape = detector.tile_shape
+        # Number of rows of tiles that a tile with its halo touches
+        halo_rows = 2 * (-(-self.margin[0] // tile_shape[0])) + 1
+        self.cache_size = halo_rows * (-(-shape[1] // tile_shape[1])) + 1
+        self.cc = self._labeling(self.object_mask)
+
+    def _labeling(self, mask, shape=None):
+        return TiledLabeling(self.shape if shape is None else shape, mask,
+                             self.detector.tile_shape,
+                             self.detector.connectivity, self.cache_size)
+
+    def object_mask(self, box):
+        """Get the mask of the pixels of this polarity in a box.
+        """
+        tile = _read(self.img, box)
+        return tile > 0 if self.foreground else tile == 0
+
+    def holes(self, row, col):
+        """Get the mask of the CCs of this polarity that are regions of type
+        hole (of the image of the opposite polarity) in a tile.
+        """
+        cc = self.cc
+        keep = ~cc.touches_border & (cc.area >= self.detector.lam)
+        keep[0] = False
+        return np.where(keep[cc.labels(row, col)], 255, 0).astype('uint8')
+
+    def prepare_protrusions(self, other):
+        """Label the filled image and the protrusions of its significant CCs
+        and of the significant holes, with `other` the opposite polarity.
+        """
+        self.other = other
+        other_cc = other.cc
+        # The holes of the filled image, regardless of their size
+        self._fill_lut = ~other_cc.touches_border
+        self._fill_lut[0] = False
+        self.filled = self._labeling(self.filled_mask)
+        significant = self.filled.area > self.min_area
+        significant[0] = False
+        self.significant_ccs = [
+            (label, self._padded_box(self.filled.bbox[label]))
+            for label in np.flatnonzero(significant)]
+        self.tophats = self._labeling(self.tophat_mask)
+
+        # The significant holes, filled within their padded bounding box
+        significant = ~other_cc.touches_border \
+            & (other_cc.area >= self.detector.lam) \
+            & (other_cc.area > self.min_area)
+        significant[0] = False
+        self.significant_holes = []
+        for label in np.flatnonzero(significant):
+            box = self._padded_box(other_cc.bbox[label])
+            outside = self._labeling(
+                lambda part, label=label, box=box:
+                    other_cc.crop(_shifted(part, box)) != label,
+                shape=(box[0].stop - box[0].start,
+                       box[1].stop - box[1].start))
+            self.significant_holes.append((label, box, outside))
+        self.blackhats = self._labeling(self.blackhat_mask)
+
+    def _padded_box(self, bbox):
+        return _grown((slice(bbox[0], bbox[2]), slice(bbox[1], bbox[3])),
+                      self.margin, self.shape)
+
+    def filled_mask(self, box):
+        """Get the mask of the filled image in a box.
+        """
+        return self.object_mask(box) | self._fill_lut[self.other.cc.crop(box)]
+
+    def tophat_mask(self, box):
+        """Get the tophats of the significant CCs of the filled image
+        in a box.
+        """
+        result = np.zeros((box[0].stop - box[0].start,
+                           box[1].stop - box[1].start), dtype='uint8')
+        halo = _grown(box, self.margin, self.shape)
+        for label, ccbox in self.significant_ccs:
+            if _intersect(ccbox, box) is None:
+                continue
+            crop = _intersect(ccbox, halo)
+            ccimage = np.where(self.filled.crop(crop) == label, 255,
+                               0).astype('uint8')
+            wth = self.detector.morphology.tophat(ccimage, self.detector.SE)
+            part = _intersect(crop, box)
+            result[_relative(part, box)] += wth[_relative(part, crop)]
+        return result
+
+    def blackhat_mask(self, box):
+        """Get the blackhats of the filled significant holes in a box.
+        """
+        result = np.zeros((box[0].stop - box[0].start,
+                           box[1].stop - box[1].start), dtype='uint8')
+        halo = _grown(box, self.margin, self.shape)
+        for label, holebox, outside in self.significant_holes:
+            if _intersect(holebox, box) is None:
+                continue
+            crop = _intersect(holebox, halo)
+            # Filled: all but what is connected to the border of the box
+            # outside the hole
+            reached = outside.touches_border[
+                outside.crop(_relative(crop, holebox))]
+            ccimage_filled = np.where(reached, 0, 255).astype('uint8')
+            bth = self.detector.morphology.blackhat(ccimage_filled,
+                                                    self.detector.SE)
+            part = _intersect(crop, box)
+            result[_relative(part, box)] += bth[_relative(part, crop)]
+        return result
+
+    def protrusions(self, box):
+        """Get the mask of the protrusions in a tile, without the elements
+        that are small or touch the border.
+        """
+        result = np.zeros((box[0].stop - box[0].start,
+                           box[1].stop - box[1].start), dtype='uint8')
+        row = box[0].start // self.detector.tile_shape[0]
+        col = box[1].start // self.detector.tile_shape[1]
+        for labeling in (self.tophats, self.blackhats):
+            keep = ~labeling.touches_border \
+                & (labeling.area >= self.detector.lam)
+            keep[0] = False
+            result = cv2.add(result, np.where(
+                keep[labeling.labels(row, col)], 255, 0).astype('uint8'))
+        return result
+
+
+class TiledSalientDetector(SalientDetector):
+
+    """Find salient regions of all four types in color or grayscale images
+    tile by tile, with the same result as `SalientDetector`. The image can be
+    anything with a shape that can be sliced, such as a numpy array,
+    `numpy.memmap` or HDF5 dataset, and the regions can be written to such
+    arrays (see `TiledBinaryDetector`).
+
+    Parameters
+    ------
+    tile_shape: tuple of ints, optional
+        The shape of the tiles
+    binarizer: Binarizer object, optional
+        A `ThresholdBinarizer`, or an `OtsuBinarizer` (the default), whose
+        threshold is computed from the histogram of all tiles. The
+        `DatadrivenBinarizer` needs the connected components of all gray
+        levels of the whole image, and is not supported.
+    **kwargs
+        Other arguments to pass along to the constructor of `Detector`
+    """
+
+    def __init__(self, tile_shape=(1024, 1024), binarizer=None, **kwargs):
+        if binarizer is None:
+            binarizer = binarization.OtsuBinarizer()
+        if not isinstance(binarizer, (binarization.ThresholdBinarizer,
+                                      binarization.OtsuBinarizer)):
+            raise ValueError('Tiled detection needs a ThresholdBinarizer or '
+                             'OtsuBinarizer, got %s' %
+                             type(binarizer).__name__)
+        super(TiledSalientDetector, self).__init__(binarizer=binarizer,
+                                                   **kwargs)
+        self.tile_shape = (int(tile_shape[0]), int(tile_shape[1]))
+        self.threshold = None
+
+    def detect(self, img, find_holes=True, find_islands=True,
+               find_indentations=True, find_protrusions=True,
+               visualize=True, out=None):
+        """Find salient regions of the types specified.
+
+        Parameters
+        ------
+        img: array-like
+            grayscale or color image to detect regions
+        find_holes: bool, optional
+            Whether to detect regions of type hole
+        find_islands: bool, optional
+            Whether to detect regions of type island
+        find_indentations: bool, optional
+            Whether to detect regions of type indentation
+        find_protrusions: bool, optional
+            Whether to detect regions of type protrusion
+        visualize: bool, optional
+            Ignored; the tiled detection has no visualization
+        out: dict, optional
+            For each type of region, the array to write the mask to
+
+        Returns
+        ------
+        regions: dict
+            For each type of region, the mask with detected regions.
+        """
+        bindetector, binarized = self._binary_detector(img)
+        return bindetector.detect(binarized, find_holes, find_islands,
+                                  find_indentations, find_protrusions, out)
+
+    def detect_tiles(self, img, find_holes=True, find_islands=True,
+                     find_indentations=True, find_protrusions=True):
+        """Find salient regions of the types specified, and generate them
+        tile by tile (see `TiledBinaryDetector.detect_tiles`).
+        """
+        bindetector, binarized = self._binary_detector(img)
+        return bindetector.detect_tiles(binarized, find_holes, find_islands,
+                                        find_indentations, find_protrusions)
+
+    def _binary_detector(self, img):
+        """Get the tiled binary detector and the binarized image.
+        """
+        shape = (img.shape[0], img.shape[1])
+        self.get_SE(shape[0] * shape[1])
+        gray = _GrayscaleView(img)
+        if isinstance(self.binarizer, binarization.OtsuBinarizer):
+            self.threshold = otsu_threshold(gray_histogram(gray,
+                                                           self.tile_shape))
+        else:
+            self.threshold = self.binarizer.threshold
+        bindetector = TiledBinaryDetector(
+            SE=self.SE, lam=self.lam, area_factor=self.area_factor,
+            connectivity=self.connectivity, tile_shape=self.tile_shape,
+            morphology=self.morphology)
+        return bindetector, _BinarizedView(gray, self.threshold)
+
+
+class _GrayscaleView(object):
+
+    """View of an image as grayscale, converted when a box is read.
+    """
+
+    def __init__(self, img):
+        self.img = img
+        self.shape = (img.shape[0], img.shape[1])
+
+    def __getitem__(self, box):
+        tile = _read(self.img, box)
+        if len(tile.shape) == 3:
+            tile = cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY)
+        return tile
+
+
+class _BinarizedView(object):
+
+    """View of a grayscale image as binary, thresholded when a box is read.
+    """
+
+    def __init__(self, gray, threshold):
+        self.gray = gray
+        self.threshold = threshold
+        self.shape = gray.shape
+
+    def __getitem__(self, box):
+        _, binarized = cv2.threshold(_read(self.gray, box), self.threshold,
+                                     255, cv2.THRESH_BINARY)
+        return binarized
+
+
+def gray_histogram(gray, tile_shape=(1024, 1024)):
+    """Compute the histogram of a grayscale image tile by tile.
+
+    Parameters
+    ------
+    gray: array-like
+        The grayscale image, of type uint8
+    tile_shape: tuple of ints, optional
+        The shape of the tiles
+
+    Returns
+    ------
+    hist: numpy array
+        The number of pixels of each of the 256 gray levels
+    """
+    hist = np.zeros(256, dtype=np.int64)
+    for top in range(0, gray.shape[0], tile_shape[0]):
+        for left in range(0, gray.shape[1], tile_shape[1]):
+            tile = _read(gray, (slice(top, top + tile_shape[0]),
+                                slice(left, left + tile_shape[1])))
+            hist += np.bincount(tile.ravel(), minlength=256)
+    return hist
@@ -14,5 +14,6 @@ setup(
     long_description=readme,
     author='Netherlands eScience Center',
     url='https://github.com/NLeSC/SalientRegions-python',
-    packages=find_packages(exclude=('tests'))
+    packages=find_packages(exclude=('tests', 'tests.*',
+                                    'benchmarks', 'benchmarks.*'))
 )
@@ -9,7 +9,11 @@ from __future__ import absolute_import
 import sys
 import os
 sys.path.insert(0, os.path.abspath('..'))
+# The root of the repository, for the benchmarks wherever the tests are run
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
 
 import salientregions
 import salientregions.detectors as salientregions_detectors
 import salientregions.binarydetector as salientregions_binarydetector
+import benchmarks.run as benchmarks_run
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Testing the benchmark suite.
+"""
+from __future__ import absolute_import
+from .context import salientregions as sr
+from .context import benchmarks_run as run
+import unittest
+import copy
+import json
+import os
+import shutil
+import tempfile
+
+
+class BenchmarksTester(unittest.TestCase):
+
+    '''
+    Tests for running the benchmarks and comparing them with a baseline
+    '''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # The command line switches on the headless mode
+        self.headless = sr.is_headless()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        sr.set_headless(self.headless)
+
+    def test_run_benchmarks(self):
+        '''
+        Test a small run of the benchmarks and the comparison with a baseline.
+        '''
+        results = run.run_benchmarks(
+            sizes=[0.01], names=['fill_image', 'ellipse_features'], repeat=2,
+            bundled=False, verbose=False)
+        assert sorted(results['results'].keys()) == [
+            'ellipse_features/0.01MP', 'fill_image/0.01MP']
+        case = results['results']['ellipse_features/0.01MP']
+        assert len(case['times']) == 2 and case['min'] == min(case['times'])
+        assert case['stages']['ellipse_fitting'] > 0
+        assert case['shape'][0] * case['shape'][1] < 11000
+
+        baseline = copy.deepcopy(results)
+        baseline['results']['fill_image/0.01MP']['min'] /= 2.
+        baseline['results']['ellipse_features/0.01MP']['min'] *= 2.
+        baseline['results']['other/0.01MP'] = {'min': 1.}
+        comparison = run.compare(results, baseline, tolerance=0.2)
+        assert [row[0] for row in comparison] == [
+            'ellipse_features/0.01MP', 'fill_image/0.01MP']
+        assert [row[4] for row in comparison] == [False, True]
+
+    def test_main(self):
+        '''
+        Test the command line, which fails when there is a regression or
+        no baseline.
+        '''
+        output = os.path.join(self.tmpdir, 'results.json')
+        args = ['--sizes', '0.01', '--benchmarks', 'fill_image',
+                '--repeat', '1', '--no-bundled', '--synthetic', '0.1',
+                '--output', output]
+        baseline = os.path.join(self.tmpdir, 'baseline.json')
+        assert run.main(args + ['--baseline', baseline]) == 2
+        assert not os.path.exists(output)
+        assert run.main(args + ['--baseline', baseline,
+                                '--record-baseline']) == 0
+        with open(baseline) as f:
+            assert 'fill_image/0.01MP' in json.load(f)['results']
+        with open(output) as f:
+            results = json.load(f)
+        assert 'fill_image/0.01MP' in results['results']
+        assert results['results']['fill_image/synthetic-0.1MP']['shape'] == \
+            [316, 316]
+        assert results['metadata']['repeat'] == 1
+        results['results']['fill_image/0.01MP']['min'] = 1e-12
+        with open(baseline, 'w') as f:
+            json.dump(results, f)
+        assert run.main(args + ['--baseline', baseline]) == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -218,3 +218,101 @@ class BinaryDetectorTester(unittest.TestCase):
                 filled_true,
                 filled,
                 visualize=False)
+
+    def test_low_memory(self):
+        '''
+        Test that the low-memory mode gives the same regions, reusing the
+        buffers of its workspace.
+        '''
+        workspace = salientregions_binarydetector.Workspace()
+        for tup in [self.binary_noise, self.binary_nested]:
+            image, filled_true, holes_true, islands_true, indents_true, prots_true, binarydetector = tup
+            detector = sr.BinaryDetector(
+                SE=binarydetector.SE, lam=binarydetector.lam,
+                area_factor=binarydetector.area_factor,
+                connectivity=binarydetector.connectivity, low_memory=True,
+                workspace=workspace)
+            filled = salientregions_binarydetector._fill_image(
+                image, 4, workspace)
+            assert sr.image_diff(filled_true, filled, visualize=False)
+            for _ in range(2):
+                results = detector.detect(image, visualize=False)
+                buffers = dict(workspace._buffers)
+                for regtype, truth in zip(
+                        ['holes', 'islands', 'indentations', 'protrusions'],
+                        [holes_true, islands_true, indents_true,
+                         prots_true]):
+                    assert sr.image_diff(truth, results[regtype],
+                                         visualize=False)
+            # The second call reused the buffers of the first
+            assert all(workspace._buffers[name] is buffers[name]
+                       for name in buffers)
+            assert workspace.nbytes < detector.estimated_peak_memory
+            assert detector.estimated_peak_memory < detector.memory_estimate(
+                image.shape)
+            assert detector._filled is None
+            with sr.instrumentation.Profiler() as profiler:
+                detector.detect(image, visualize=False)
+            assert profiler.report()['stages']['filling']['calls'] == 2
+
+    def test_memory_budget(self):
+        '''
+        Test that an image larger than the memory budget is refused.
+        '''
+        image, _, _, _, _, _, binarydetector = self.binary_noise
+        estimate = binarydetector.memory_estimate(image.shape)
+        detector = sr.BinaryDetector(
+            SE=binarydetector.SE, lam=binarydetector.lam,
+            area_factor=binarydetector.area_factor,
+            connectivity=binarydetector.connectivity,
+            memory_budget=estimate)
+        assert detector.low_memory
+        detector.detect(image, visualize=False)
+        detector.memory_budget = estimate - 1
+        self.assertRaises(MemoryError, detector.detect, image,
+                          visualize=False)
+        self.assertRaises(ValueError, sr.BinaryDetector, binarydetector.SE,
+                          50, 0.05, 4, incremental=True, low_memory=True)
+
+    def test_incremental(self):
+        '''
+        Test that the incremental mode gives the same regions, reusing the
+        results kept in the state of the calls and not in the detector.
+        '''
+        image, _, holes_true, islands_true, indents_true, prots_true, \
+            binarydetector = self.binary_nested
+        detector = sr.BinaryDetector(
+            SE=binarydetector.SE, lam=binarydetector.lam,
+            area_factor=binarydetector.area_factor,
+            connectivity=binarydetector.connectivity, incremental=True)
+        state = salientregions_binarydetector.IncrementalState()
+        for _ in range(2):
+            results = detector.detect(image, visualize=False, state=state)
+            for regtype, truth in zip(
+                    ['holes', 'islands', 'indentations', 'protrusions'],
+                    [holes_true, islands_true, indents_true, prots_true]):
+                assert sr.image_diff(truth, results[regtype],
+                                     visualize=False)
+            assert state.cache and not state.new_cache
+            assert sorted(state.previous_tophat.keys()) == [
+                'indentations', 'protrusions']
+        # Without a state, nothing is kept between the calls
+        results = detector.detect(image, visualize=False)
+        assert sr.image_diff(prots_true, results['protrusions'],
+                             visualize=False)
+
+    def test_padded_box(self):
+        '''
+        Test the helper method `padded_box`, including clipping at the border.
+        '''
+        image, _, _, _, _, _, _ = self.binary_nested
+        _, _, stats, _ = cv2.connectedComponentsWithStats(image, connectivity=4)
+        for stat in stats[1:]:
+            rows, cols = salientregions_binarydetector._padded_box(
+                stat, image.shape, (5, 7))
+            assert rows.start == max(stat[cv2.CC_STAT_TOP] - 5, 0)
+            assert rows.stop == min(
+                stat[cv2.CC_STAT_TOP] + stat[cv2.CC_STAT_HEIGHT] + 5, image.shape[0])
+            assert cols.start == max(stat[cv2.CC_STAT_LEFT] - 7, 0)
+            assert cols.stop == min(
+                stat[cv2.CC_STAT_LEFT] + stat[cv2.CC_STAT_WIDTH] + 7, image.shape[1])
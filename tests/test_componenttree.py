@@ -0,0 +1,120 @@
+"""
+Testing the component tree functions.
+"""
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from .context import salientregions as sr
+import unittest
+import cv2
+import os
+import numpy as np
+
+
+class ComponentCountTester(unittest.TestCase):
+
+    '''
+    Tests for the single-sweep count of connected components per level
+    '''
+
+    def setUp(self):
+        '''
+        Load the test image
+        '''
+        testdata_path = os.path.normpath(
+            os.path.join(
+                os.path.dirname(
+                    os.path.abspath(__file__)),
+                'images/Gray/'))
+        self.image = cv2.imread(
+            os.path.join(
+                testdata_path,
+                'Gray_scale.png'),
+            cv2.IMREAD_GRAYSCALE)
+        self.min_areas = (1, 24, 0.001 * self.image.size,
+                          0.01 * self.image.size)
+
+    def counts_per_threshold(self, connectivity):
+        '''
+        Count the CCs per level by thresholding and labeling each level.
+        '''
+        counts = np.zeros((len(self.min_areas), 256), dtype=int)
+        for t in range(256):
+            _, bint = cv2.threshold(self.image, t, 255, cv2.THRESH_BINARY)
+            _, _, stats, _ = cv2.connectedComponentsWithStats(
+                bint, connectivity=connectivity)
+            areas = stats[:, cv2.CC_STAT_AREA]
+            for i, min_area in enumerate(self.min_areas):
+                counts[i, t] = (areas >= min_area).sum()
+        return counts
+
+    def test_counts_connectivity4(self):
+        '''
+        Test `count_components_per_level` with connectivity 4.
+        '''
+        counts = sr.componenttree.count_components_per_level(
+            self.image, self.min_areas, connectivity=4)
+        assert np.all(counts == self.counts_per_threshold(4))
+
+    def test_counts_connectivity8(self):
+        '''
+        Test `count_components_per_level` with connectivity 8.
+        '''
+        counts = sr.componenttree.count_components_per_level(
+            self.image, self.min_areas, connectivity=8)
+        assert np.all(counts == self.counts_per_threshold(8))
+
+
+class RegionLevelCountTester(unittest.TestCase):
+
+    '''
+    Tests for the count of levels per pixel from the component trees
+    '''
+
+    def setUp(self):
+        '''
+        Load the test image, at a smaller size
+        '''
+        testdata_path = os.path.normpath(
+            os.path.join(
+                os.path.dirname(
+                    os.path.abspath(__file__)),
+                'images/Gray/'))
+        image = cv2.imread(
+            os.path.join(
+                testdata_path,
+                'Gray_scale.png'),
+            cv2.IMREAD_GRAYSCALE)
+        self.image = cv2.resize(image, (image.shape[1] // 4,
+                                        image.shape[0] // 4))
+        self.SE = np.ones((3, 3), dtype='uint8')
+
+    def counts_per_threshold(self, levels, lam, connectivity):
+        '''
+        Count the levels per pixel by detecting the regions of each level.
+        '''
+        detector = sr.BinaryDetector(self.SE, lam, 0.05, connectivity)
+        counts = {'holes': np.zeros(self.image.shape, dtype=int),
+                  'islands': np.zeros(self.image.shape, dtype=int)}
+        for t in levels:
+            _, bint = cv2.threshold(self.image, t, 255, cv2.THRESH_BINARY)
+            regions = detector.detect(bint, find_indentations=False,
+                                      find_protrusions=False, visualize=False)
+            for regtype in counts:
+                counts[regtype] += regions[regtype] > 0
+        return counts
+
+    def test_counts(self):
+        '''
+        Test `count_region_levels` for several levels and connectivities.
+        '''
+        for levels, lam, connectivity in [(range(256), 10, 4),
+                                          (range(-5, 270, 6), 4, 8)]:
+            expected = self.counts_per_threshold(levels, lam, connectivity)
+            counts = sr.componenttree.count_region_levels(
+                self.image, list(levels), lam, connectivity)
+            for regtype in expected:
+                assert expected[regtype].any()
+                assert np.array_equal(counts[regtype], expected[regtype])
+        counts = sr.componenttree.count_region_levels(
+            self.image, [100], 10, regtypes=['islands'])
+        assert list(counts.keys()) == ['islands']
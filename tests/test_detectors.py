@@ -45,6 +45,12 @@ class SETester(unittest.TestCase):
         self.detector.get_SE(100 * 110)
         SE = self.detector.SE
         assert np.all(SE == self.SE_true)
+        # A copy of the shared structuring element, which can be changed
+        assert SE.flags.writeable
+        SE[0, 0] = 1 - SE[0, 0]
+        shared, _ = self.detector.structuring_element(100 * 110)
+        assert not shared.flags.writeable
+        assert np.all(shared == self.SE_true)
 
     def test_getlam(self):
         '''
@@ -195,6 +201,48 @@ class SalientRegionDetectorTester(unittest.TestCase):
             self.islands_true_color,
             visualize=False)
 
+    def test_detect_context(self):
+        '''
+        Tests that a detector can be used for images of different sizes,
+        and by several threads at once, with the same results as a new detector
+        '''
+        from multiprocessing.pool import ThreadPool
+        small = cv2.resize(self.img_gray, None, fx=0.5, fy=0.5)
+        images = [small, self.img_color, small, self.img_color]
+        expected = [sr.SalientDetector().detect(img, visualize=False)
+                    for img in images]
+        pool = ThreadPool(4)
+        contexts = pool.map(
+            lambda img: self.det_default.detect_context(img, visualize=False),
+            images)
+        pool.close()
+        pool.join()
+        for context, regions in zip(contexts, expected):
+            assert context.binarizer.lam == context.lam
+            for regtype in regions.keys():
+                assert np.array_equal(context.regions[regtype],
+                                      regions[regtype])
+        assert self.det_default.binarizer is None
+
+    def test_detect_many(self):
+        '''
+        Tests that detecting a series of images with a pool of workers gives
+        the same results as detecting them one by one
+        '''
+        images = [self.img_color, self.img_gray, self.img_color]
+        expected = [self.det_default.detect(img, visualize=False)
+                    for img in images]
+        for ordered in [True, False]:
+            results = list(self.det_default.detect_many(
+                images, n_jobs=2, ordered=ordered))
+            assert len(results) == len(images)
+            if ordered:
+                assert [index for index, _ in results] == [0, 1, 2]
+            for index, regions in results:
+                for regtype in expected[index].keys():
+                    assert np.array_equal(regions[regtype],
+                                          expected[index][regtype])
+
 
 class MSSRDetectorTester(unittest.TestCase):
 
@@ -249,6 +297,20 @@ class MSSRDetectorTester(unittest.TestCase):
             lam_factor=lam_factor,
             area_factor=area_factor,
             connectivity=connectivity)
+        self.det_incremental = sr.MSSRDetector(
+            min_thres=min_thres, max_thres=max_thres, step=stepsize,
+            perc=perc, SE_size_factor=SE_size_factor,
+            lam_factor=lam_factor,
+            area_factor=area_factor,
+            connectivity=connectivity,
+            incremental=True)
+        self.det_parallel = sr.MSSRDetector(
+            min_thres=min_thres, max_thres=max_thres, step=stepsize,
+            perc=perc, SE_size_factor=SE_size_factor,
+            lam_factor=lam_factor,
+            area_factor=area_factor,
+            connectivity=connectivity,
+            n_jobs=4)
 
     # def test_gray(self):
     # 
@@ -278,3 +340,124 @@ class MSSRDetectorTester(unittest.TestCase):
             regions['islands'],
             self.islands_true,
             visualize=False)
+
+    def test_incremental(self):
+        '''
+        Test that the incremental MSSRA detector gives the same results
+        '''
+        regions = self.det.detect(self.img_color,
+                                  visualize=False)
+        regions_incremental = self.det_incremental.detect(self.img_color,
+                                                          visualize=False)
+        for regtype in regions.keys():
+            assert sr.image_diff(
+                self.det.regions_sum[regtype],
+                self.det_incremental.regions_sum[regtype],
+                visualize=False)
+            assert sr.image_diff(
+                regions[regtype],
+                regions_incremental[regtype],
+                visualize=False)
+
+    def test_parallel(self):
+        '''
+        Test that the MSSRA detector gives the same results when the
+        threshold levels are processed in parallel
+        '''
+        regions = self.det.detect(self.img_color,
+                                  visualize=False)
+        regions_parallel = self.det_parallel.detect(self.img_color,
+                                                    visualize=False)
+        for regtype in regions.keys():
+            assert np.array_equal(
+                self.det.regions_sum[regtype],
+                self.det_parallel.regions_sum[regtype])
+            assert np.array_equal(
+                regions[regtype],
+                regions_parallel[regtype])
+
+    def test_component_trees(self):
+        '''
+        Test that the holes and islands from the component trees are those
+        of the detection level by level
+        '''
+        regions = self.det.detect(self.img_color, find_indentations=False,
+                                  find_protrusions=False, visualize=False)
+        det_levels = sr.MSSRDetector(
+            min_thres=1, max_thres=255, step=10, perc=0.6,
+            SE_size_factor=0.02, lam_factor=5, area_factor=0.03,
+            connectivity=4, component_trees=False)
+        regions_levels = det_levels.detect(
+            self.img_color, find_indentations=False, find_protrusions=False,
+            visualize=False)
+        assert sorted(regions.keys()) == ['holes', 'islands']
+        for regtype in regions.keys():
+            assert np.array_equal(self.det.regions_sum[regtype],
+                                  det_levels.regions_sum[regtype])
+            assert np.array_equal(regions[regtype], regions_levels[regtype])
+        assert np.array_equal(self.det.bint, det_levels.bint)
+
+    def test_level_masks(self):
+        '''
+        Test that the kept masks of the levels add up to the counts
+        '''
+        detector = sr.MSSRDetector(
+            min_thres=1, max_thres=255, step=10, perc=0.6,
+            SE_size_factor=0.02, lam_factor=5, area_factor=0.03,
+            connectivity=4, keep_level_masks=True, n_jobs=2)
+        regions = detector.detect(self.img_color, visualize=False)
+        self.det.detect(self.img_color, visualize=False)
+        accumulator = detector.accumulator
+        assert accumulator.levels == list(range(1, 256, 10))
+        for regtype in regions:
+            counts = detector.regions_sum[regtype]
+            assert counts.dtype == np.uint8
+            assert np.array_equal(counts, self.det.regions_sum[regtype])
+            total = np.zeros(counts.shape, dtype=int)
+            for level in accumulator.levels:
+                total += accumulator.level_mask(regtype, level) > 0
+            assert np.array_equal(total, counts)
+
+    def test_accumulator(self):
+        '''
+        Test the type of the counts and the in-place additions
+        '''
+        mask = np.zeros((5, 6), dtype='uint8')
+        mask[1:3, 2:5] = 255
+        for num_levels, dtype in [(255, np.uint8), (256, np.uint16),
+                                  (70000, np.uint32)]:
+            accumulator = sr.LevelAccumulator(mask.shape, num_levels,
+                                              ['holes'])
+            counts = accumulator.counts['holes']
+            assert counts.dtype == dtype
+            accumulator.add({'holes': mask}, [3, 4, 5])
+            other = sr.LevelAccumulator(mask.shape, num_levels, ['holes'])
+            other.add({'holes': 255 - mask}, [6])
+            accumulator.merge(other)
+            assert accumulator.counts['holes'] is counts
+            assert np.array_equal(counts, np.where(mask > 0, 3, 1))
+            self.assertRaises(ValueError, accumulator.level_mask, 'holes', 3)
+
+    def test_quantized(self):
+        '''
+        Test that the levels that do not change the thresholded image of
+        an image with few gray levels are counted as the level before them
+        '''
+        gray = cv2.cvtColor(self.img_color, cv2.COLOR_BGR2GRAY)
+        gray = cv2.resize(gray, (gray.shape[1] // 2, gray.shape[0] // 2))
+        quantized = (gray // 64) * 64 + 10
+        detector = sr.MSSRDetector(min_thres=-3, max_thres=260, step=2,
+                                   SE_size_factor=0.05, lam_factor=5,
+                                   area_factor=0.03, connectivity=4)
+        detector.detect(quantized, visualize=False)
+        bindetector = sr.BinaryDetector(detector.SE, detector.lam, 0.03, 4)
+        expected = dict((regtype, np.zeros(gray.shape, dtype='uint8'))
+                        for regtype in detector.regions_sum)
+        for t in range(-3, 261, 2):
+            _, bint = cv2.threshold(quantized, t, 255, cv2.THRESH_BINARY)
+            regions = bindetector.detect(bint, visualize=False)
+            for regtype in expected:
+                expected[regtype] += regions[regtype] > 0
+        for regtype in expected:
+            assert np.array_equal(detector.regions_sum[regtype],
+                                  expected[regtype])
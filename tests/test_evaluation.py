@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Testing the evaluation of detected regions.
+"""
+from __future__ import absolute_import
+from .context import salientregions as sr
+import unittest
+import numpy as np
+
+
+class EvaluationTester(unittest.TestCase):
+
+    '''
+    Tests for the overlap errors, repeatability and matching score
+    '''
+
+    def setUp(self):
+        '''
+        Create random ellipses and a homography.
+        '''
+        rng = np.random.RandomState(0)
+        n = 300
+        a = rng.rand(n) ** 2 * 30 + 2
+        b = a * (0.3 + 0.7 * rng.rand(n))
+        theta = (rng.rand(n) - 0.5) * np.pi
+        A, B, C = sr.helpers.standard2poly_ellipses(a, b, theta)
+        self.features = np.column_stack([rng.rand(n, 2) * 300 + 50, A, B, C,
+                                         np.ones(n)])
+        self.shifted = self.features.copy()
+        self.shifted[:, :2] += rng.randn(n, 2) * 3
+        self.homography = np.array([[1.1, 0.05, 10],
+                                    [0.02, 0.95, -5],
+                                    [1e-4, 2e-4, 1]])
+
+    def raster_error(self, features1, features2, step=0.1):
+        '''
+        Compute the overlap error of two ellipses on a fine grid.
+        '''
+        x, y = np.round((features1[:2] + features2[:2]) / 2)
+        points = np.mgrid[x - 50:x + 50:step, y - 50:y + 50:step]
+        inside = []
+        for f in [features1, features2]:
+            dx = points[0] - f[0]
+            dy = points[1] - f[1]
+            inside.append(f[2] * dx * dx + 2 * f[3] * dx * dy +
+                          f[4] * dy * dy <= 1)
+        return 1 - np.sum(inside[0] & inside[1]) / \
+            float(np.sum(inside[0] | inside[1]))
+
+    def test_overlap_errors(self):
+        '''
+        Test the overlap errors against a rasterization, and that all
+        overlapping pairs are found.
+        '''
+        indices1, indices2, errors = sr.evaluation.overlap_errors(
+            self.features[:50], self.shifted[:50])
+        for k in np.flatnonzero(indices1 == indices2)[:5]:
+            raster = self.raster_error(self.features[indices1[k]],
+                                       self.shifted[indices2[k]])
+            assert abs(errors[k] - raster) < 0.005
+        matrix = sr.evaluation.overlap_error_matrix(self.features,
+                                                    self.features)
+        assert np.allclose(np.diag(matrix), 0)
+        assert np.all(matrix >= 0) and np.all(matrix <= 1)
+        assert np.allclose(matrix, matrix.T, atol=1e-3)
+        selected = sr.evaluation.overlap_errors(
+            self.features, self.features, max_error=0.5)
+        assert np.array_equal(selected[2], matrix[matrix < 0.5])
+
+    def test_project_ellipses(self):
+        '''
+        Test the projection of ellipses with a homography.
+        '''
+        scaling = np.diag([2., 2., 1.])
+        projected = sr.evaluation.project_ellipses(self.features, scaling)
+        assert np.allclose(projected[:, :2], self.features[:, :2] * 2)
+        assert np.allclose(projected[:, 2:5], self.features[:, 2:5] / 4)
+        projected = sr.evaluation.project_ellipses(self.features,
+                                                   self.homography)
+        back = sr.evaluation.project_ellipses(
+            projected, np.linalg.inv(self.homography))
+        assert np.allclose(back, self.features)
+
+    def test_repeatability(self):
+        '''
+        Test the repeatability and matching score of projected ellipses.
+        '''
+        projected = sr.evaluation.project_ellipses(self.features,
+                                                   self.homography)
+        score, num = sr.evaluation.repeatability(self.features, projected,
+                                                 self.homography)
+        assert score == 1 and num == len(self.features)
+        score, num = sr.evaluation.repeatability(
+            self.features, projected, self.homography, (400, 400), (300, 300))
+        assert 0 < num < len(self.features) and score == 1
+        matches = np.column_stack([np.arange(len(self.features))] * 2)
+        score, num_correct = sr.evaluation.matching_score(
+            self.features, projected, matches, self.homography,
+            (400, 400), (300, 300))
+        assert score == 1 and num_correct == num
+        wrong_matches = np.column_stack([matches[:, 0],
+                                         np.roll(matches[:, 1], 1)])
+        score, num_correct = sr.evaluation.matching_score(
+            self.features, projected, wrong_matches, self.homography)
+        assert num_correct < len(self.features) // 10
+        score, num = sr.evaluation.repeatability(self.features, self.shifted)
+        assert 0 < score < 1
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Testing the binary feature store.
+"""
+from __future__ import absolute_import
+from .context import salientregions as sr
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+class FeatureStoreTester(unittest.TestCase):
+
+    '''
+    Tests for the class `FeatureStore`
+    '''
+
+    def setUp(self):
+        '''
+        Create a temporary directory and the features of a few images.
+        '''
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'features.srf')
+        rng = np.random.RandomState(0)
+        self.images = []
+        for counts in [(1, 2, 3, 1), (0, 5, 0, 2), (0, 0, 0, 0)]:
+            num_regions = {}
+            features = {}
+            for i, saltype in enumerate(sr.featurestore.REGION_TYPES):
+                num_regions[saltype] = counts[i]
+                features[saltype] = rng.rand(counts[i], 6)
+                features[saltype][:, 5] = i + 1
+            self.images.append((num_regions, features))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assert_image(self, store, index, num_regions, features):
+        '''
+        Check that the store has the features of an image.
+        '''
+        total, num_regions_loaded, features_loaded = store.load(index)
+        assert total == sum(num_regions.values())
+        assert num_regions_loaded == num_regions
+        for saltype in sr.featurestore.REGION_TYPES:
+            assert features_loaded[saltype].dtype == store.dtype
+            assert np.allclose(features_loaded[saltype], features[saltype],
+                               rtol=1e-6, atol=0)
+
+    def test_roundtrip(self):
+        '''
+        Test that appended images are loaded exactly, as read-only views,
+        also after reopening the file.
+        '''
+        with sr.featurestore.FeatureStore(self.filename, 'w') as store:
+            for i, (num_regions, features) in enumerate(self.images):
+                assert store.append(num_regions, features, 'img%i' % i) == i
+            self.assert_image(store, 0, *self.images[0])
+        store = sr.featurestore.FeatureStore(self.filename)
+        assert len(store) == len(self.images)
+        assert [entry[0] for entry in store.index] == ['img0', 'img1', 'img2']
+        for i, (num_regions, features) in enumerate(self.images):
+            _, _, loaded = store.load(i)
+            for saltype in sr.featurestore.REGION_TYPES:
+                assert np.array_equal(loaded[saltype], features[saltype])
+                assert not loaded[saltype].flags.writeable
+        self.assertRaises(IOError, store.append, *self.images[0])
+
+    def test_float32(self):
+        '''
+        Test a store of float32 features, which keeps its type when appended to.
+        '''
+        store = sr.featurestore.FeatureStore(self.filename, 'w',
+                                             dtype='float32')
+        store.append(*self.images[0])
+        store = sr.featurestore.FeatureStore(self.filename, 'a')
+        assert store.dtype == np.float32
+        store.append(*self.images[1])
+        assert len(store) == 2
+        self.assert_image(store, 1, *self.images[1])
+        self.assertRaises(ValueError, sr.featurestore.FeatureStore,
+                          self.filename, 'w', dtype='int32')
+
+    def test_incomplete_record(self):
+        '''
+        Test that an incomplete record at the end of the file is ignored,
+        and overwritten by the next append.
+        '''
+        store = sr.featurestore.FeatureStore(self.filename, 'w')
+        store.append(*self.images[0])
+        size = os.path.getsize(self.filename)
+        store.append(*self.images[1])
+        with open(self.filename, 'r+b') as f:
+            f.truncate(os.path.getsize(self.filename) - 8)
+        store = sr.featurestore.FeatureStore(self.filename, 'a')
+        assert len(store) == 1
+        store.append(*self.images[1])
+        store = sr.featurestore.FeatureStore(self.filename)
+        assert len(store) == 2
+        assert os.path.getsize(self.filename) > size
+        self.assert_image(store, 1, *self.images[1])
+
+    def test_two_handles(self):
+        '''
+        Test that appends through two handles keep the records of both.
+        '''
+        first = sr.featurestore.FeatureStore(self.filename, 'w')
+        second = sr.featurestore.FeatureStore(self.filename, 'a')
+        first.append(*self.images[0], name='img0')
+        second.append(*self.images[1], name='img1')
+        first.append(*self.images[2], name='img2')
+        assert [entry[0] for entry in first.index] == ['img0', 'img1', 'img2']
+        store = sr.featurestore.FeatureStore(self.filename)
+        assert [entry[0] for entry in store.index] == ['img0', 'img1', 'img2']
+        for i, (num_regions, features) in enumerate(self.images):
+            self.assert_image(store, i, num_regions, features)
+
+    def test_invalid_file(self):
+        '''
+        Test that files that are not feature stores, also empty or shorter
+        than the header, are refused.
+        '''
+        for content in [b'', b'SRFEATS\x00', b'x' * 64]:
+            with open(self.filename, 'wb') as f:
+                f.write(content)
+            self.assertRaises(ValueError, sr.featurestore.FeatureStore,
+                              self.filename)
+
+    def test_bytes_name(self):
+        '''
+        Test that a name given as UTF-8 bytes is stored as text.
+        '''
+        store = sr.featurestore.FeatureStore(self.filename, 'w')
+        store.append(*self.images[0], name=u'caf\xe9'.encode('utf-8'))
+        store = sr.featurestore.FeatureStore(self.filename)
+        assert store.index[0][0] == u'caf\xe9'
+
+    def test_text(self):
+        '''
+        Test the import and export of the text format.
+        '''
+        text_filename = os.path.join(self.tmpdir, 'ellipse_features.txt')
+        sr.helpers.save_ellipse_features2file(*self.images[0],
+                                              filename=text_filename)
+        store = sr.featurestore.FeatureStore(self.filename, 'w')
+        index = store.import_text(text_filename)
+        assert store.index[index][0] == 'ellipse_features.txt'
+        total, num_regions, features = \
+            sr.helpers.load_ellipse_features_from_file(text_filename)
+        self.assert_image(store, index, num_regions, features)
+        exported = os.path.join(self.tmpdir, 'exported.txt')
+        assert store.export_text(index, exported) == total
+        total2, num_regions2, features2 = \
+            sr.helpers.load_ellipse_features_from_file(exported)
+        assert total2 == total
+        assert num_regions2 == num_regions
+        for saltype in sr.featurestore.REGION_TYPES:
+            assert np.allclose(features2[saltype], features[saltype])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -143,6 +143,45 @@ class HelpersEllipseTester(unittest.TestCase):
 
         assert sr.helpers.array_diff(params, true_params, 1e-5, 1e-8)
 
+    def test_ellipses_arrays(self):
+        '''
+        Test that the array versions `standard2poly_ellipses` and
+        `poly2standard_ellipses` give the same results as the scalar functions.
+        '''
+        features = np.array([self.features_standard_ellipse1,
+                             self.features_standard_ellipse2,
+                             self.features_standard_ellipse3,
+                             self.features_standard_ellipse4,
+                             [0, 0, self.half_major_axis_len,
+                              self.half_minor_axis_len, self.theta, 0]],
+                            dtype=float)
+        features[:4, 4] = np.radians(features[:4, 4])
+        coeffs = sr.helpers.standard2poly_ellipses(
+            features[:, 2], features[:, 3], features[:, 4])
+        params = sr.helpers.poly2standard_ellipses(*coeffs)
+        for i in range(len(features)):
+            coeff = sr.helpers.standard2poly_ellipse(*features[i, 2:5])
+            assert np.array_equal([c[i] for c in coeffs], coeff)
+            param = sr.helpers.poly2standard_ellipse(*coeff)
+            assert np.allclose([p[i] for p in params], param)
+        # Random ellipses with angles between 0 and pi/2
+        rng = np.random.RandomState(0)
+        axes = np.sort(rng.uniform(1, 50, (2, 100)), axis=0)
+        thetas = rng.uniform(0.01, np.pi / 2 - 0.01, 100)
+        coeffs = sr.helpers.standard2poly_ellipses(axes[1], axes[0], thetas)
+        params = sr.helpers.poly2standard_ellipses(*coeffs)
+        for i in range(len(thetas)):
+            param = sr.helpers.poly2standard_ellipse(
+                *[c[i] for c in coeffs])
+            assert np.allclose([p[i] for p in params], param)
+        params = sr.helpers.poly2standard_ellipses(
+            [self.standard_coeff[0]], [self.standard_coeff[1]],
+            [self.standard_coeff[2]])
+        assert sr.helpers.array_diff(
+            np.ravel(params),
+            [self.half_major_axis_len, self.half_minor_axis_len, self.theta],
+            1e-5, 1e-8)
+
     def test_mask2features_poly_ellipse1(self):
         '''
         Test the function `binary_mask2ellipse_features_single` for test image 1.
@@ -208,3 +247,150 @@ class HelpersEllipseTester(unittest.TestCase):
             features,
             self.rtol,
             self.atol)
+
+    def test_mask2features_moments(self):
+        '''
+        Test the function `binary_mask2ellipse_features_single` with the
+        moments method, which should give the features of MATLAB for all test images.
+        '''
+        masks = [self.ellipse1_mask, self.ellipse2_mask,
+                 self.ellipse3_mask, self.ellipse4_mask]
+        features_poly_true = [self.features_poly_ellipse1,
+                              self.features_poly_ellipse2,
+                              self.features_poly_ellipse3,
+                              self.features_poly_ellipse4]
+        features_standard_true = [self.features_standard_ellipse1,
+                                  self.features_standard_ellipse2,
+                                  self.features_standard_ellipse3,
+                                  self.features_standard_ellipse4]
+        for mask, poly_true, standard_true in zip(
+                masks, features_poly_true, features_standard_true):
+            num_regions, features_standard, features_poly = \
+                sr.helpers.binary_mask2ellipse_features_single(
+                    mask, self.connectivty, 2, method='moments')
+            assert num_regions == 1
+            assert sr.helpers.array_diff(poly_true, features_poly[0],
+                                         1e-6, 1e-9)
+            features_standard[0, 4] = np.degrees(features_standard[0, 4])
+            assert sr.helpers.array_diff(standard_true, features_standard[0],
+                                         0, 0.1)
+
+    def test_mask2features_methods(self):
+        '''
+        Test that all methods find the same regions, with consistent features.
+        '''
+        regions = {'holes': self.ellipse3_mask, 'islands': self.ellipse4_mask}
+        for method in ['rect', 'fit', 'moments']:
+            num_regions, features_standard, features_poly = \
+                sr.helpers.binary_mask2ellipse_features(
+                    regions, self.connectivty, method=method)
+            for saltype in regions.keys():
+                assert num_regions[saltype] == 1
+                assert features_poly[saltype].shape == (1, 6)
+                assert sr.helpers.array_diff(features_poly[saltype][0, :2],
+                                             features_standard[saltype][0, :2])
+        self.assertRaises(ValueError,
+                          sr.helpers.binary_mask2ellipse_features_single,
+                          self.ellipse1_mask, method='unknown')
+
+
+class HeadlessTester(unittest.TestCase):
+
+    '''
+    Tests for the headless mode and the lazy imports
+    '''
+
+    def run_python(self, code, **env):
+        '''
+        Run code in a new python process and return its output.
+        '''
+        import subprocess
+        import sys
+        environment = dict(os.environ, **env)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        environment['PYTHONPATH'] = root
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         env=environment)
+        return output.decode().strip()
+
+    def test_lazy_imports(self):
+        '''
+        Test that importing the package does not import matplotlib or scipy.io.
+        '''
+        output = self.run_python(
+            'import sys, salientregions\n'
+            'print(any(m.startswith("matplotlib") or m == "scipy.io" '
+            'for m in sys.modules))')
+        assert output == 'False'
+
+    def test_headless(self):
+        '''
+        Test that nothing is visualized (nor is matplotlib imported) in
+        headless mode, also when it is switched on from the environment.
+        '''
+        code = ('import sys, numpy as np, salientregions as sr\n'
+                'img = np.zeros((20, 20), dtype="uint8")\n'
+                'img[5:15, 5:15] = 255\n'
+                'sr.set_headless()\n'
+                'sr.show_image(img)\n'
+                'sr.SalientDetector(SE_size_factor=0.2).detect(img)\n'
+                'print(sr.is_headless(), "matplotlib" in sys.modules)')
+        assert self.run_python(code) == 'True False'
+        code = ('import sys, numpy as np, salientregions as sr\n'
+                'img = np.zeros((20, 20), dtype="uint8")\n'
+                'sr.visualize_elements(img, holes=img)\n'
+                'print(sr.is_headless(), "matplotlib" in sys.modules)')
+        assert self.run_python(
+            code, SALIENTREGIONS_HEADLESS='1') == 'True False'
+
+
+class HistogramTester(unittest.TestCase):
+
+    '''
+    Tests for the histogram helpers
+    '''
+
+    def test_integer_histogram(self):
+        '''
+        Test the histogram of arrays of several integer types.
+        '''
+        rng = np.random.RandomState(0)
+        data = rng.randint(0, 300, size=(70, 80))
+        for dtype in ('uint16', 'int32', 'int64'):
+            hist = sr.helpers.integer_histogram(data.astype(dtype),
+                                                chunk_size=1000)
+            assert np.array_equal(hist, np.bincount(data.ravel()))
+        hist = sr.helpers.integer_histogram(np.zeros((3, 3), 'uint8'),
+                                            minlength=256)
+        assert len(hist) == 256 and hist[0] == 9
+        self.assertRaises(ValueError, sr.helpers.integer_histogram,
+                          np.zeros(3))
+
+    def test_histogram_percentile(self):
+        '''
+        Test that the percentile is the one of `numpy.percentile`.
+        '''
+        rng = np.random.RandomState(1)
+        for size in (1, 2, 7, 1000):
+            data = rng.randint(0, 40, size=size).astype('uint8')
+            hist = sr.helpers.integer_histogram(data)
+            for percentile in (0, 12.5, 50, 60, 70, 99, 100):
+                assert sr.helpers.histogram_percentile(hist, percentile) == \
+                    np.percentile(data, percentile)
+
+    def test_threshold_cumsum(self):
+        '''
+        Test the thresholding of the counts of `MSSRDetector`.
+        '''
+        detector = sr.MSSRDetector(perc=0.7)
+        rng = np.random.RandomState(2)
+        data = (rng.rand(50, 60) ** 2 * 200).astype('uint8')
+        thres = np.percentile(data[data > 0], 70)
+        expected = np.where(data > thres, 255, 0)
+        for dtype in ('uint8', 'uint16', 'int32'):
+            binarized = detector.threshold_cumsum(data.astype(dtype))
+            assert binarized.dtype == np.uint8
+            assert np.array_equal(binarized, expected)
+        binary = np.where(data > 100, 7, 0).astype('uint8')
+        assert np.array_equal(detector.threshold_cumsum(binary),
+                              np.where(binary > 0, 255, 0))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Testing the shared image context.
+"""
+from __future__ import absolute_import
+from .context import salientregions as sr
+import unittest
+import cv2
+import os
+import numpy as np
+
+
+class ImageContextTester(unittest.TestCase):
+
+    '''
+    Tests for the class `ImageContext`
+    '''
+
+    def setUp(self):
+        images_path = os.path.normpath(os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'images'))
+        self.color = cv2.imread(os.path.join(images_path, 'Color',
+                                             'color.png'))
+        self.gray = cv2.cvtColor(self.color, cv2.COLOR_BGR2GRAY)
+        self.context = sr.imagecontext.ImageContext(self.color)
+
+    def test_facts(self):
+        '''
+        Test the facts of the context, and that they are computed once.
+        '''
+        context = self.context
+        assert context.shape == self.gray.shape
+        assert context.size == self.gray.size
+        assert np.array_equal(context.gray, self.gray)
+        assert context.gray is context.gray
+        hist = np.bincount(self.gray.ravel(), minlength=256)
+        assert np.array_equal(context.histogram, hist)
+        assert np.array_equal(context.cumulative_histogram, np.cumsum(hist))
+        otsu, _ = cv2.threshold(self.gray, 0, 255,
+                                cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        assert context.otsu_threshold == otsu
+        values = self.gray.ravel()[context.sorted_order]
+        assert np.all(np.diff(values.astype(int)) >= 0)
+        counts = context.component_counts((10, 100), 8)
+        assert context.component_counts([10., 100.], 8) is counts
+        assert np.array_equal(
+            counts, sr.componenttree.count_components_per_level(
+                self.gray, (10, 100), 8))
+        # A grayscale image is used as it is
+        gray_context = sr.imagecontext.ImageContext(self.gray)
+        assert gray_context.gray is self.gray
+        assert sr.imagecontext.as_context(gray_context) is gray_context
+
+    def test_binarizers(self):
+        '''
+        Test that the binarizers give the same result for a context.
+        '''
+        binarizers = [sr.ThresholdBinarizer(100), sr.OtsuBinarizer(),
+                      sr.DatadrivenBinarizer(lam=24, connectivity=8)]
+        for binarizer in binarizers:
+            expected = binarizer.binarize(self.gray, visualize=False)
+            assert np.array_equal(
+                binarizer.binarize(self.context, visualize=False), expected)
+            assert np.array_equal(
+                binarizer.binarize_context(self.context, visualize=False),
+                expected)
+        assert len(self.context._component_counts) == 1
+
+    def test_detectors(self):
+        '''
+        Test that the detectors give the same result for a context, and
+        share its grayscale image.
+        '''
+        detectors = [sr.SalientDetector(SE_size_factor=0.05),
+                     sr.MSSRDetector(step=32, SE_size_factor=0.05)]
+        for detector in detectors:
+            expected = detector.detect(self.color, visualize=False)
+            result = detector.detect_context(self.context, visualize=False)
+            assert result.image is self.context
+            assert result.gray is self.context.gray
+            for regtype in expected:
+                assert np.array_equal(result.regions[regtype],
+                                      expected[regtype])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Testing the instrumentation of the detectors.
+"""
+from __future__ import absolute_import
+from .context import salientregions as sr
+import unittest
+import threading
+import os
+import cv2
+import numpy as np
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Whether the peak memory of each stage can be recorded
+can_profile_memory = hasattr(tracemalloc, 'reset_peak')
+
+
+class ProfilerTester(unittest.TestCase):
+
+    '''
+    Tests for the class `Profiler` and the stages of the detectors
+    '''
+
+    def setUp(self):
+        '''
+        Load the test image.
+        '''
+        testdata_path = os.path.normpath(
+            os.path.join(
+                os.path.dirname(
+                    os.path.abspath(__file__)),
+                'images/Binary/'))
+        self.image = cv2.imread(
+            os.path.join(
+                testdata_path,
+                'Binary_all_types_noise.png'), cv2.IMREAD_GRAYSCALE)
+        self.detector_kwargs = {'SE_size_factor': 0.15, 'lam_factor': 4,
+                                'area_factor': 0.05, 'connectivity': 4}
+
+    def test_disabled(self):
+        '''
+        Test that the stages do nothing without an active profiler.
+        '''
+        stage = sr.instrumentation.stage('filling')
+        assert stage is sr.instrumentation.stage('tophats')
+        with stage:
+            pass
+        assert sr.instrumentation.active_profilers() == []
+
+    def test_profiler(self):
+        '''
+        Test the stages recorded for a detection and ellipse fitting.
+        '''
+        detector = sr.SalientDetector(
+            binarizer=sr.ThresholdBinarizer(128), **self.detector_kwargs)
+        with sr.instrumentation.Profiler(name='test') as profiler:
+            regions = detector.detect(self.image, visualize=False)
+            sr.binary_mask2ellipse_features(regions)
+        report = profiler.report()
+        assert report['name'] == 'test'
+        stages = report['stages']
+        assert set(stages.keys()) == set(
+            ['grayscale', 'binarization', 'filling', 'holes_islands',
+             'tophats', 'small_elements', 'ellipse_fitting'])
+        assert stages['filling']['calls'] == 2
+        assert stages['ellipse_fitting']['calls'] == 4
+        for record in stages.values():
+            assert 0 <= record['time'] <= report['time']
+            assert record['peak_memory'] is None
+        assert stages['small_elements']['time'] <= \
+            stages['holes_islands']['time'] + stages['tophats']['time']
+        assert sr.instrumentation.active_profilers() == []
+
+    @unittest.skipUnless(can_profile_memory, 'needs tracemalloc.reset_peak')
+    def test_callback(self):
+        '''
+        Test that a detector with a callback reports every call, with the
+        peak memory, and that the regions do not change.
+        '''
+        reports = []
+        detector = sr.MSSRDetector(min_thres=0, max_thres=255, step=64,
+                                   profile=reports.append,
+                                   profile_memory=True,
+                                   **self.detector_kwargs)
+        regions = detector.detect(self.image, visualize=False)
+        detector.detect(self.image, visualize=False)
+        assert len(reports) == 2
+        assert reports[0]['name'] == 'MSSRDetector'
+        assert reports[0]['stages']['mssr_level']['calls'] == 4
+        assert reports[0]['peak_memory'] >= \
+            reports[0]['stages']['mssr_level']['peak_memory'] > 0
+        expected = sr.MSSRDetector(min_thres=0, max_thres=255, step=64,
+                                   **self.detector_kwargs).detect(
+            self.image, visualize=False)
+        for regtype in expected.keys():
+            assert np.array_equal(regions[regtype], expected[regtype])
+
+    def test_threads(self):
+        '''
+        Test that a profiler only records the stages of its own thread.
+        '''
+        detector = sr.SalientDetector(
+            binarizer=sr.ThresholdBinarizer(128), **self.detector_kwargs)
+        with sr.instrumentation.Profiler() as profiler:
+            thread = threading.Thread(
+                target=detector.detect, args=(self.image,),
+                kwargs={'visualize': False})
+            thread.start()
+            thread.join()
+            assert profiler.report()['stages'] == {}
+            with sr.instrumentation.Profiler() as inner:
+                detector.detect(self.image, visualize=False)
+        assert inner.report()['stages'] == profiler.report()['stages']
+
+    @unittest.skipUnless(can_profile_memory, 'needs tracemalloc.reset_peak')
+    def test_memory_threads(self):
+        '''
+        Test that the peak memory is recorded by one thread at a time, and
+        that tracemalloc runs until the last profiler that records it exits.
+        '''
+        errors = []
+
+        def profile():
+            try:
+                with sr.instrumentation.Profiler(memory=True):
+                    pass
+            except RuntimeError as error:
+                errors.append(error)
+
+        was_tracing = tracemalloc.is_tracing()
+        with sr.instrumentation.Profiler(memory=True) as outer:
+            with sr.instrumentation.Profiler(memory=True):
+                pass
+            assert tracemalloc.is_tracing()
+            thread = threading.Thread(target=profile)
+            thread.start()
+            thread.join()
+            assert len(errors) == 1
+            with sr.instrumentation.stage('filling'):
+                np.ones(1 << 20, dtype='uint8')
+        assert outer.report()['stages']['filling']['peak_memory'] >= 1 << 20
+        assert tracemalloc.is_tracing() == was_tracing
+        # Another thread can record it once the profilers have exited
+        thread = threading.Thread(target=profile)
+        thread.start()
+        thread.join()
+        assert len(errors) == 1
+
+    def test_memory_unsupported(self):
+        '''
+        Test that recording the peak memory without tracemalloc.reset_peak
+        is refused.
+        '''
+        if can_profile_memory:
+            reset_peak = tracemalloc.reset_peak
+            del tracemalloc.reset_peak
+        try:
+            profiler = sr.instrumentation.Profiler(memory=True)
+            self.assertRaises(RuntimeError, profiler.__enter__)
+            assert sr.instrumentation.active_profilers() == []
+        finally:
+            if can_profile_memory:
+                tracemalloc.reset_peak = reset_peak
+
+
+if __name__ == '__main__':
+    unittest.main()
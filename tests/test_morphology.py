@@ -0,0 +1,172 @@
+"""
+Testing the morphology functions.
+"""
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from .context import salientregions as sr
+import unittest
+import cv2
+import os
+import numpy as np
+
+
+class MorphologyTester(unittest.TestCase):
+
+    '''
+    Tests for the structuring element cache and the morphology backends
+    '''
+
+    def setUp(self):
+        '''
+        Load the test image
+        '''
+        testdata_path = os.path.normpath(
+            os.path.join(
+                os.path.dirname(
+                    os.path.abspath(__file__)),
+                'images/Binary/'))
+        self.image = cv2.imread(
+            os.path.join(
+                testdata_path,
+                'Binary_all_types_noise.png'),
+            cv2.IMREAD_GRAYSCALE)
+        self.decomposed = sr.morphology.DecomposedMorphology()
+        self.distance = sr.morphology.DistanceTransformMorphology()
+        self.fixtures = [
+            os.path.normpath(os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                'images', folder, filename))
+            for folder, filename in [('Binary', 'Binary_nested.png'),
+                                     ('Color', 'color.png'),
+                                     ('Gray', 'Gray_scale.png')]]
+
+    def test_SE_cache(self):
+        '''
+        Test that the cached SE is created once, is read-only and is
+        the same as the SE created by OpenCV.
+        '''
+        SE = sr.morphology.get_structuring_element(41)
+        assert SE is sr.morphology.get_structuring_element(41)
+        assert not SE.flags.writeable
+        assert np.array_equal(
+            SE, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (41, 41)))
+
+    def test_abstract(self):
+        '''
+        Test that a morphology without opening and closing cannot be made.
+        '''
+        self.assertRaises(TypeError, sr.morphology.Morphology)
+
+    def test_opencv(self):
+        '''
+        Test that the OpenCV backend gives the result of `cv2.morphologyEx`.
+        '''
+        SE = sr.morphology.get_structuring_element(21)
+        morphology = sr.morphology.OpenCVMorphology()
+        assert np.array_equal(
+            morphology.tophat(self.image, SE),
+            cv2.morphologyEx(self.image, cv2.MORPH_TOPHAT, SE))
+        assert np.array_equal(
+            morphology.blackhat(self.image, SE),
+            cv2.morphologyEx(self.image, cv2.MORPH_BLACKHAT, SE))
+
+    def test_decomposed_exact(self):
+        '''
+        Test that SEs that are octagons are decomposed exactly.
+        '''
+        SEs = [cv2.getStructuringElement(cv2.MORPH_CROSS, (3, 3)),
+               cv2.getStructuringElement(cv2.MORPH_RECT, (15, 9)),
+               sr.morphology.get_structuring_element(3)]
+        for SE in SEs:
+            steps, error = self.decomposed.decompose(SE)
+            assert steps is not None
+            assert error == 0
+            assert np.array_equal(
+                self.decomposed.tophat(self.image, SE),
+                cv2.morphologyEx(self.image, cv2.MORPH_TOPHAT, SE))
+            assert np.array_equal(
+                self.decomposed.blackhat(self.image, SE),
+                cv2.morphologyEx(self.image, cv2.MORPH_BLACKHAT, SE))
+
+    def test_decomposed_octagon(self):
+        '''
+        Test that a disc is replaced by an octagon within the error bound,
+        and that the operations are exact for that octagon.
+        '''
+        SE = sr.morphology.get_structuring_element(41)
+        steps, error = self.decomposed.decompose(SE)
+        assert steps is not None
+        assert 0 < error <= self.decomposed.max_error * np.count_nonzero(SE)
+        octagon = np.zeros(SE.shape, dtype='uint8')
+        octagon[20, 20] = 1
+        for kernel, iterations in steps:
+            octagon = cv2.dilate(octagon, kernel, iterations=iterations)
+        assert error == np.count_nonzero(octagon != SE)
+        assert np.array_equal(
+            self.decomposed.tophat(self.image, SE),
+            cv2.morphologyEx(self.image, cv2.MORPH_TOPHAT, octagon))
+        assert np.array_equal(
+            self.decomposed.blackhat(self.image, SE),
+            cv2.morphologyEx(self.image, cv2.MORPH_BLACKHAT, octagon))
+
+    def test_decomposed_fallback(self):
+        '''
+        Test that the SE itself is used if it cannot be approximated well enough.
+        '''
+        SE = sr.morphology.get_structuring_element(5)
+        steps, error = self.decomposed.decompose(SE)
+        assert steps is None
+        assert np.array_equal(
+            self.decomposed.tophat(self.image, SE),
+            cv2.morphologyEx(self.image, cv2.MORPH_TOPHAT, SE))
+
+    def test_distance_disc(self):
+        '''
+        Test that the distance transform operations are exact for the
+        Euclidean disc that replaces the SE, on the test images.
+        '''
+        SE = sr.morphology.get_structuring_element(41)
+        sqradius, error = self.distance.disc(SE)
+        assert sqradius is not None
+        assert 0 < error <= self.distance.max_error * np.count_nonzero(SE)
+        rows, cols = np.mgrid[-20:21, -20:21]
+        disc = np.array(rows ** 2 + cols ** 2 <= sqradius, dtype='uint8')
+        assert error == np.count_nonzero(disc != SE)
+        for filename in self.fixtures:
+            image = cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
+            _, image = cv2.threshold(image, 127, 255, cv2.THRESH_BINARY)
+            assert np.array_equal(
+                self.distance.tophat(image, SE),
+                cv2.morphologyEx(image, cv2.MORPH_TOPHAT, disc))
+            assert np.array_equal(
+                self.distance.blackhat(image, SE),
+                cv2.morphologyEx(image, cv2.MORPH_BLACKHAT, disc))
+
+    def test_distance_detector(self):
+        '''
+        Test that the regions found with the distance transform are (almost)
+        the same as with OpenCV, on the test images.
+        '''
+        for filename in self.fixtures:
+            image = cv2.imread(filename)
+            regions = sr.SalientDetector(SE_size_factor=0.15).detect(
+                image, visualize=False)
+            regions_distance = sr.SalientDetector(
+                SE_size_factor=0.15, morphology=self.distance).detect(
+                image, visualize=False)
+            for regtype in regions.keys():
+                ndiff = np.count_nonzero(
+                    regions[regtype] != regions_distance[regtype])
+                assert ndiff <= 0.05 * np.count_nonzero(regions[regtype])
+
+    def test_detector(self):
+        '''
+        Test that the detector uses the given backend.
+        '''
+        det = sr.SalientDetector(
+            binarizer=sr.ThresholdBinarizer(127),
+            SE_size_factor=0.05,
+            morphology=self.decomposed)
+        regions = det.detect(self.image, visualize=False)
+        assert 'protrusions' in regions
+        assert len(self.decomposed.errors) == 1
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Testing the spatial index over ellipse features.
+"""
+from __future__ import absolute_import
+from .context import salientregions as sr
+import unittest
+import numpy as np
+
+
+class EllipseIndexTester(unittest.TestCase):
+
+    '''
+    Tests for the class `EllipseIndex` and the intersection tests
+    '''
+
+    def setUp(self):
+        '''
+        Create random ellipses, including some that are not valid.
+        '''
+        rng = np.random.RandomState(1)
+        n = 500
+        self.features = np.zeros((n, 6))
+        self.features[:, :2] = rng.rand(n, 2) * 400
+        self.features[:, 2] = rng.rand(n) ** 3 * 40 + 1
+        self.features[:, 3] = self.features[:, 2] * (0.2 + 0.8 * rng.rand(n))
+        self.features[:, 4] = (rng.rand(n) - 0.5) * np.pi
+        self.features[:, 5] = 1
+        self.features[3, 2:4] = 0
+        self.features[4, :5] = np.nan
+        self.valid = np.setdiff1d(np.arange(n), [3, 4])
+        self.index = sr.spatialindex.EllipseIndex(self.features)
+
+    def inside(self, features, points):
+        '''
+        For every point, whether it is inside the ellipse.
+        '''
+        centers, matrices = sr.spatialindex.ellipse_matrices(features[None])
+        d = points - centers[0]
+        return np.einsum('ni,ij,nj->n', d, matrices[0], d) <= 1
+
+    def sample(self, features, num=100):
+        '''
+        Sample points on and in an ellipse.
+        '''
+        angle = -features[4]
+        t = np.linspace(0, 2 * np.pi, num)
+        r = np.sqrt(np.linspace(0, 1, num // 4))
+        u = np.outer(r, np.cos(t)).ravel() * features[2]
+        v = np.outer(r, np.sin(t)).ravel() * features[3]
+        return np.column_stack([
+            features[0] + np.cos(angle) * u - np.sin(angle) * v,
+            features[1] + np.sin(angle) * u + np.cos(angle) * v])
+
+    def test_matrices(self):
+        '''
+        Test that the matrices agree with the polynomial features, and
+        the bounding boxes with the sampled ellipses.
+        '''
+        _, matrices = sr.spatialindex.ellipse_matrices(self.features[:1])
+        A, B, C = sr.helpers.standard2poly_ellipse(
+            self.features[0, 2], self.features[0, 3], -self.features[0, 4])
+        assert np.allclose(matrices[0], [[A, B], [B, C]])
+        half_widths, half_heights = sr.spatialindex.ellipse_extents(
+            self.features)
+        for i in self.valid[:10]:
+            points = self.sample(self.features[i], 2000)
+            assert np.allclose(np.abs(points - self.features[i, :2]).max(0),
+                               [half_widths[i], half_heights[i]], rtol=1e-4)
+            assert self.inside(self.features[i], points * 0.999 +
+                               self.features[i, :2] * 0.001).all()
+
+    def test_query_box(self):
+        '''
+        Test that the ellipses intersecting a box are found.
+        '''
+        box = (100, 150, 180, 190)
+        found = self.index.query_box(box)
+        expected = []
+        for i in self.valid:
+            points = self.sample(self.features[i])
+            if np.any(np.all(points >= box[:2], axis=1) &
+                      np.all(points <= box[2:], axis=1)):
+                expected.append(i)
+        assert set(expected) <= set(found)
+        assert len(found) > 0
+        bounding = self.index.query_box(box, exact=False)
+        assert set(found) <= set(bounding)
+        assert len(self.index.query_box((0, 0, 400, 400))) == len(self.valid)
+        assert 3 not in bounding and 4 not in bounding
+
+    def test_query_ellipse(self):
+        '''
+        Test the intersection of ellipses against sampled points, and that
+        the index finds the same ellipses as testing all of them.
+        '''
+        ellipse = np.array([200, 200, 60, 15, 0.7, 1])
+        found = self.index.query_ellipse(ellipse)
+        intersect = sr.spatialindex.ellipses_intersect(
+            self.features[self.valid], ellipse)
+        assert np.array_equal(found, self.valid[intersect])
+        points = self.sample(ellipse, 400)
+        for i in self.valid:
+            sampled = self.inside(self.features[i], points).any()
+            if sampled:
+                assert i in found
+        reverse = sr.spatialindex.ellipses_intersect(
+            ellipse, self.features[self.valid])
+        assert np.array_equal(intersect, reverse)
+
+    def test_candidate_matches(self):
+        '''
+        Test the matching of centroids within a distance.
+        '''
+        other_features = self.features.copy()
+        other_features[:, :2] += 3
+        other = sr.spatialindex.EllipseIndex(
+            {'holes': other_features[:200], 'islands': other_features[200:]})
+        assert len(other) == len(self.valid)
+        indices, other_indices, distances = self.index.candidate_matches(
+            other, 10)
+        centers = self.features[self.valid, :2]
+        all_distances = np.hypot(
+            centers[:, None, 0] - centers[None, :, 0] - 3,
+            centers[:, None, 1] - centers[None, :, 1] - 3)
+        rows, cols = np.nonzero(all_distances <= 10)
+        assert np.array_equal(indices, self.valid[rows])
+        assert np.array_equal(other_indices, self.valid[cols])
+        assert np.allclose(distances, all_distances[rows, cols])
+        near = self.index.query_radius((200, 200), 50)
+        assert np.array_equal(near, self.valid[
+            np.hypot(centers[:, 0] - 200, centers[:, 1] - 200) <= 50])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Testing the synthetic image generator.
+"""
+from __future__ import absolute_import
+from .context import salientregions as sr
+import unittest
+import cv2
+import numpy as np
+
+
+class SyntheticTester(unittest.TestCase):
+
+    '''
+    Tests for the class `SyntheticImage` and the function `generate`
+    '''
+
+    def setUp(self):
+        self.shape = (600, 900)
+        self.kwargs = {'cell_size': 300, 'nesting': 3, 'num_holes': 1,
+                       'num_islands': 1, 'region_size': (0.5, 0.6),
+                       'num_indentations': (1, 2), 'num_protrusions': (1, 2)}
+        self.synthetic = sr.synthetic.SyntheticImage(self.shape, seed=3,
+                                                     **self.kwargs)
+        self.binary, self.gray, self.regions = sr.synthetic.generate(
+            self.shape, seed=3, **self.kwargs)
+
+    def test_deterministic(self):
+        '''
+        Test that the images only depend on the seed.
+        '''
+        binary, gray, regions = sr.synthetic.generate(self.shape, seed=3,
+                                                      **self.kwargs)
+        assert np.array_equal(binary, self.binary)
+        assert np.array_equal(gray, self.gray)
+        for saltype in regions:
+            assert np.array_equal(regions[saltype], self.regions[saltype])
+        other, _, _ = sr.synthetic.generate(self.shape, seed=4, **self.kwargs)
+        assert not np.array_equal(other, self.binary)
+
+    def test_images(self):
+        '''
+        Test the binary and grayscale images and the bodies in them.
+        '''
+        assert self.binary.shape == self.shape
+        assert set(np.unique(self.binary)) == set([0, 255])
+        assert np.array_equal((self.gray >= 128) * 255, self.binary)
+        assert np.array_equal(self.synthetic.binary(), self.binary)
+        assert np.array_equal(self.synthetic.grayscale(), self.gray)
+        bodies = self.synthetic.bodies()
+        assert len(bodies) == 2 * 3
+        depths = set(region[3] for body in bodies
+                     for region in body['regions'])
+        assert depths == set([2, 3, 4])
+
+    def test_options(self):
+        '''
+        Test the number of regions per body.
+        '''
+        synthetic = sr.synthetic.SyntheticImage(
+            (600, 600), seed=1, cell_size=300, num_holes=2, num_islands=0,
+            region_size=(0.2, 0.25), num_indentations=1, num_protrusions=3,
+            fill=0.5)
+        bodies = synthetic.bodies()
+        assert 0 < len(bodies) < 4
+        for body in bodies:
+            assert len(body['protrusions']) == 3
+            assert len(body['indentations']) == 1
+            assert len(body['regions']) == 2
+        binary, _, regions = sr.synthetic.generate((600, 600), seed=1,
+                                                   cell_size=300, fill=0.)
+        assert not binary.any()
+        assert not any(mask.any() for mask in regions.values())
+
+    def test_tiles(self):
+        '''
+        Test that the tiles make up the whole image and ground truth.
+        '''
+        binary = np.zeros(self.shape, dtype='uint8')
+        for box, img, regions in self.synthetic.tiles((128, 200),
+                                                      ground_truth=True):
+            binary[box] = img
+            for saltype in self.regions:
+                assert np.array_equal(regions[saltype],
+                                      self.regions[saltype][box])
+        assert np.array_equal(binary, self.binary)
+        gray = np.zeros(self.shape, dtype='uint8')
+        for box, img, regions in self.synthetic.tiles((333, 111),
+                                                      grayscale=True):
+            gray[box] = img
+            assert regions is None
+        assert np.array_equal(gray, self.gray)
+
+    def test_ground_truth(self):
+        '''
+        Test that the ground truth is what the binary detector finds.
+        '''
+        SE = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (15, 15))
+        detector = sr.BinaryDetector(SE=SE, lam=30, area_factor=0.01,
+                                     connectivity=4)
+        regions = detector.detect(self.binary, visualize=False)
+        assert sorted(regions.keys()) == sorted(self.regions.keys())
+        for saltype in regions:
+            truth = self.regions[saltype] > 0
+            found = regions[saltype] > 0
+            assert truth.any()
+            overlap = (truth & found).sum() / float((truth | found).sum())
+            assert overlap > 0.8, (saltype, overlap)
+
+
+if __name__ == "__main__":
+    unittest.main()
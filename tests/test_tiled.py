@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Testing the tiled detection.
+"""
+from __future__ import absolute_import
+from .context import salientregions as sr
+import unittest
+import cv2
+import os
+import shutil
+import tempfile
+import numpy as np
+
+
+class TiledLabelingTester(unittest.TestCase):
+
+    '''
+    Tests for the class `TiledLabeling`
+    '''
+
+    def test_components(self):
+        '''
+        Test that the components are those of the whole image.
+        '''
+        rng = np.random.RandomState(0)
+        img = np.where(rng.rand(90, 110) > 0.45, 255, 0).astype('uint8')
+        for connectivity in (4, 8):
+            nlabels, labels, stats, _ = cv2.connectedComponentsWithStats(
+                img, connectivity=connectivity)
+            tiled = sr.tiled.TiledLabeling(img.shape, lambda box: img[box],
+                                           (16, 23), connectivity)
+            assert tiled.num_components == nlabels - 1
+            tiled_labels = tiled.crop((slice(0, 90), slice(0, 110)))
+            # The same partition of the pixels, with the same statistics
+            assert np.array_equal(tiled_labels > 0, labels > 0)
+            mapping = np.zeros(nlabels, dtype=int)
+            mapping[labels.ravel()[np.flatnonzero(labels)]] = \
+                tiled_labels.ravel()[np.flatnonzero(labels)]
+            assert len(np.unique(mapping[1:])) == nlabels - 1
+            assert np.array_equal(tiled.area[mapping[1:]],
+                                  stats[1:, cv2.CC_STAT_AREA])
+            assert np.array_equal(tiled.bbox[mapping[1:], 0],
+                                  stats[1:, cv2.CC_STAT_TOP])
+            assert np.array_equal(
+                tiled.bbox[mapping[1:], 3],
+                stats[1:, cv2.CC_STAT_LEFT] + stats[1:, cv2.CC_STAT_WIDTH])
+
+    def test_cache(self):
+        '''
+        Test that cached tiles are reused and evicted least recently used.
+        '''
+        rng = np.random.RandomState(1)
+        img = np.where(rng.rand(60, 60) > 0.5, 255, 0).astype('uint8')
+        tiled = sr.tiled.TiledLabeling(img.shape, lambda box: img[box],
+                                       (20, 20), 4, cache_size=2)
+        first = tiled.labels(0, 0)
+        tiled.labels(0, 1)
+        # Hit the cache twice, which makes (0, 0) the most recently used
+        assert tiled.labels(0, 0) is first
+        assert tiled.labels(0, 0) is first
+        assert list(tiled._cache.keys()) == [(0, 1), (0, 0)]
+        tiled.labels(1, 0)
+        assert list(tiled._cache.keys()) == [(0, 0), (1, 0)]
+        assert tiled.labels(0, 0) is first
+        tiled.clear_cache()
+        assert np.array_equal(tiled.labels(0, 0), first)
+
+
+class TiledDetectorTester(unittest.TestCase):
+
+    '''
+    Tests for the classes `TiledBinaryDetector` and `TiledSalientDetector`
+    '''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        images_path = os.path.normpath(os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'images'))
+        self.binary_images = [
+            cv2.imread(os.path.join(images_path, 'Binary', name),
+                       cv2.IMREAD_GRAYSCALE)
+            for name in ('Binary_all_types_noise.png', 'Binary_nested.png')]
+        self.binary_images.append(
+            sr.synthetic.generate((300, 450), seed=2, cell_size=150)[0])
+        self.color = cv2.imread(os.path.join(images_path, 'Color',
+                                             'color.png'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_binary_detector(self):
+        '''
+        Test that the tiled regions are those of the whole image.
+        '''
+        SE = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (21, 21))
+        for img in self.binary_images:
+            img = np.where(img > 127, 255, 0).astype('uint8')
+            for connectivity in (4, 8):
+                expected = sr.BinaryDetector(
+                    SE, 40, 0.01, connectivity).detect(img, visualize=False)
+                for tile_shape in ((64, 64), (100, 37)):
+                    detector = sr.tiled.TiledBinaryDetector(
+                        SE, 40, 0.01, connectivity, tile_shape=tile_shape)
+                    regions = detector.detect(img)
+                    for saltype in expected:
+                        assert np.array_equal(regions[saltype],
+                                              expected[saltype])
+
+    def test_detect_tiles(self):
+        '''
+        Test generating the regions tile by tile, for some of the types.
+        '''
+        img = self.binary_images[0]
+        SE = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (15, 15))
+        expected = sr.BinaryDetector(SE, 50, 0.05, 4).detect(
+            img, find_holes=False, find_protrusions=False, visualize=False)
+        detector = sr.tiled.TiledBinaryDetector(SE, 50, 0.05, 4,
+                                                tile_shape=(100, 100))
+        tiles = list(detector.detect_tiles(img, find_holes=False,
+                                           find_protrusions=False))
+        assert len(tiles) == 9
+        for box, regions in tiles:
+            assert sorted(regions.keys()) == ['indentations', 'islands']
+            for saltype in regions:
+                assert np.array_equal(regions[saltype], expected[saltype][box])
+
+    def test_salient_detector(self):
+        '''
+        Test detecting in a memory-mapped color image, with the regions
+        written to memory maps.
+        '''
+        filename = os.path.join(self.tmpdir, 'color.dat')
+        img = np.memmap(filename, dtype='uint8', mode='w+',
+                        shape=self.color.shape)
+        img[:] = self.color
+        img.flush()
+        img = np.memmap(filename, dtype='uint8', mode='r',
+                        shape=self.color.shape)
+        for binarizer in (sr.OtsuBinarizer(), sr.ThresholdBinarizer(100)):
+            expected = sr.SalientDetector(
+                binarizer=binarizer, SE_size_factor=0.05,
+                lam_factor=4).detect(self.color, visualize=False)
+            out = dict((saltype, np.memmap(
+                os.path.join(self.tmpdir, saltype + '.dat'), dtype='uint8',
+                mode='w+', shape=self.color.shape[:2]))
+                for saltype in expected)
+            detector = sr.tiled.TiledSalientDetector(
+                tile_shape=(200, 300), binarizer=binarizer,
+                SE_size_factor=0.05, lam_factor=4)
+            regions = detector.detect(img, out=out)
+            for saltype in expected:
+                assert regions[saltype] is out[saltype]
+                assert np.array_equal(regions[saltype], expected[saltype])
+        self.assertRaises(ValueError, sr.tiled.TiledSalientDetector,
+                          binarizer=sr.DatadrivenBinarizer(lam=10))
+
+    def test_otsu_threshold(self):
+        '''
+        Test that the threshold from the histogram is the one of OpenCV.
+        '''
+        gray = cv2.cvtColor(self.color, cv2.COLOR_BGR2GRAY)
+        rng = np.random.RandomState(1)
+        images = [gray, (rng.rand(40, 50) * 90 + 40).astype('uint8'),
+                  np.where(rng.rand(40, 50) > 0.3, 200, 10).astype('uint8')]
+        for img in images:
+            expected, _ = cv2.threshold(img, 0, 255,
+                                        cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            hist = sr.tiled.gray_histogram(img, (16, 16))
+            assert np.array_equal(hist, np.bincount(img.ravel(),
+                                                    minlength=256))
+            assert sr.tiled.otsu_threshold(hist) == expected
+
+
+if __name__ == "__main__":
+    unittest.main()